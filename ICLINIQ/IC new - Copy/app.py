@@ -1,79 +1,168 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from py2neo import Graph  # type: ignore
-from fuzzywuzzy import process  # type: ignore
-import re
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from io import BytesIO
-import sqlite3
-from datetime import datetime
-import torch
-from transformers import BertTokenizer, BertForSequenceClassification
-
-app = Flask(__name__)
-
-# SQLite Database Connection
+from startup import Startup, WARM_UP
+
+# Every phase of a cold start is timed, imports included
+startup = Startup()
+
+with startup.phase('imports'):
+    from flask import Blueprint, Flask, render_template, request, jsonify, send_file, Response, stream_with_context, g
+    import json
+    import logging
+    import os
+    import re
+    import time
+    from io import BytesIO
+    from datetime import datetime, timedelta
+    from chat_store import ChatStore, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+    from chat_writer import ChatWriter
+    from knowledge_index import KnowledgeIndex, NO_DETAILS
+    from symptom_matcher import SymptomMatcher
+    from nlp_stage import NLPStage
+    from result_cache import ResultCache
+    from data_ingestion import MANIFEST_PATH
+    from graph_access import GraphClient
+    from report_service import ReportService
+    from metrics import METRICS, Profiler, PROFILE_HEADER, stage
+
+routes = Blueprint('icliniq', __name__)
+log = logging.getLogger(__name__)
+profiler = Profiler()
+
+# The fields each analysis stage produces, in the order they are produced
+ANALYSIS_STAGES = [
+    ('diseases', ['possible_diseases']),
+    ('details', ['description', 'precautions', 'diagnostic_statement']),
+    ('follow_up', ['next_questions']),
+]
+
+# SQLite chat store: pooled per-thread connections, WAL journal, one schema
+def get_chat_store():
+    return startup.get('chat_store')
+
+# Chat turns are persisted behind the response by a group-committing writer thread
+# (ICLINIQ_CHAT_DURABILITY=sync|commit|async)
+def get_chat_writer():
+    return startup.get('chat_writer')
+
+def get_engine():
+    return startup.get('recommendation_engine')
+
+def get_report_service():
+    return startup.get('report_service')
+
+# SQLite Database Connection, checked out of the store's pool: `with get_db_connection() as conn:`
 def get_db_connection():
-    conn = sqlite3.connect('chat_history.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# Initialize Database
-def initialize_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Create tables if they don't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_sessions (
-            session_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER,
-            message_text TEXT,
-            is_user BOOLEAN,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_session_data (
-            session_id INTEGER PRIMARY KEY,
-            symptoms TEXT,
-            FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
-
-# Initialize the database
-initialize_db()
+    return get_chat_store().connection()
 
 class EnhancedRecommendationEngine:
-    def __init__(self):
+    def __init__(self, scorer='count', nlp_mode=None, symptom_tagger=None, symptom_dictionary=None, graph=None):
+        self.scorer = scorer
+        # Persistent symptom ids (chat_store.dictionary); sessions store these, not names
+        self.symptom_dictionary = symptom_dictionary
+        # Pooled, retrying, circuit-broken Neo4j reads; while it is down the
+        # index comes from the CSVs and is retried on the next refresh.
+        # graph: anything GraphClient-shaped, e.g. benchmark.py's in-memory stand-in
+        self.graph = graph or GraphClient()
+        self.connect_graph()
+
+        # Everything derived from a symptom set is memoized on the sorted set itself;
+        # disease details only change when the graph is re-ingested
+        self.results = ResultCache(name='recommend')
+        self.details_cache = ResultCache(capacity=1024, ttl=None, name='disease_details')
+        # Every ingest rewrites the manifest; a new mtime means the graph changed
+        self.ingest_stamp = None
+        self.ingest_checked_at = 0.0
+
+        # Build the in-memory knowledge index once; requests never touch Neo4j
+        self.index = None
+        self.matcher = None
+        self.refresh_index()
+
+        # BioBERT only loads when a consumer of its logits is configured, e.g. a
+        # learned symptom tagger: symptom_tagger(query, logits) -> [symptom, ...]
+        with startup.phase('nlp_model'):
+            self.nlp = NLPStage(nlp_mode)
+        self.symptom_tagger = symptom_tagger
+
+    def connect_graph(self):
         try:
-            self.graph = Graph("bolt://localhost:7687", auth=("neo4j", "12345678"))
+            with startup.phase('neo4j_connect'):
+                self.graph.connect()
             print("Connected to Neo4j")
         except Exception as e:
             print(f"Neo4j connection error: {e}")
-            self.graph = None
+            # Serve from the CSVs straight away; a refresh retries once the breaker resets
+            self.graph.breaker.trip()
+        return self.graph
 
-        # Load BioBERT model and tokenizer
-        self.tokenizer = BertTokenizer.from_pretrained('monologg/biobert_v1.1_pubmed')
-        self.model = BertForSequenceClassification.from_pretrained('monologg/biobert_v1.1_pubmed', num_labels=2)
-        self.model.eval()  # Set the model to evaluation mode
+    def before_fork(self):
+        # Bolt sockets cannot be shared between processes; each worker reconnects lazily
+        self.graph.close()
+
+    def after_fork(self):
+        self.nlp.after_fork()
+
+    def refresh_index(self):
+        # Rebuild from the graph (or the CSVs if Neo4j is down) and swap atomically
+        try:
+            self.ingest_stamp = self.read_ingest_stamp()
+            with startup.phase('knowledge_index'):
+                index = KnowledgeIndex.load(self.graph, scorer=self.scorer)
+            self.install_index(index)
+        except Exception as e:
+            print(f"Knowledge index load error: {e}")
+        return self.index
+
+    def install_index(self, index):
+        # Also the entry point for indexes loaded elsewhere, e.g. asgi.py's async graph load
+        with startup.phase('symptom_matcher'):
+            matcher = SymptomMatcher(index.symptoms)
+        if self.symptom_dictionary is not None:
+            self.symptom_dictionary.ensure(index.symptoms)
+            index.bind_dictionary(self.symptom_dictionary.ids)
+        self.index, self.matcher = index, matcher
+        # Cached results came from the old index
+        self.results.clear()
+        self.details_cache.clear()
+        print(f"Knowledge index loaded from {index.source}: "
+              f"{len(index.diseases)} diseases, {len(index.symptoms)} symptoms")
+        return index
+
+    def read_ingest_stamp(self):
+        try:
+            return os.path.getmtime(MANIFEST_PATH)
+        except OSError:
+            return None
+
+    def check_ingest(self, interval=5.0):
+        # At most one stat() every few seconds; reload the index if an ingest ran since
+        now = time.monotonic()
+        if now - self.ingest_checked_at < interval:
+            return
+        self.ingest_checked_at = now
+        if self.read_ingest_stamp() != self.ingest_stamp:
+            print("Knowledge graph was re-ingested, reloading the index")
+            self.refresh_index()
     
-    def recommend(self, query, previous_symptoms=None):
-        if not self.graph:
-            return {
+    def recommend(self, query, previous_symptoms=None, previous_symptom_ids=None):
+        # Extract symptoms from current query
+        current_symptoms = self.extract_symptoms(query)
+        return self.recommend_symptoms(current_symptoms, previous_symptoms, previous_symptom_ids)
+
+    def recommend_symptoms(self, current_symptoms, previous_symptoms=None, previous_symptom_ids=None):
+        # Everything after extraction; the async path extracts on a worker thread first
+        result = {}
+        for stage, fields in self.recommend_stages(current_symptoms, previous_symptoms, previous_symptom_ids):
+            result.update(fields)
+        if 'possible_diseases' in result:
+            log.debug("Possible Diseases: %s", result['possible_diseases'])
+        return result
+
+    def recommend_stages(self, current_symptoms, previous_symptoms=None, previous_symptom_ids=None):
+        # Yields (stage, fields) as each stage completes: symptoms, diseases,
+        # details, follow_up. The streaming route sends each one as it arrives.
+        self.check_ingest()
+        if not self.index:
+            yield 'details', {
                 "possible_diseases": [],
                 "extracted_symptoms": [],
                 "all_symptoms": [],
@@ -81,121 +170,91 @@ class EnhancedRecommendationEngine:
                 "description": "Database connection failure",
                 "diagnostic_statement": "Insufficient information due to database connection failure."
             }
-        
-        # Extract symptoms from current query
-        current_symptoms = self.extract_symptoms(query)
-        print("Extracted Symptoms from current query:", current_symptoms)
-        
-        # Combine with previous symptoms if any
-        all_symptoms = []
-        if previous_symptoms:
-            all_symptoms = list(set(previous_symptoms + current_symptoms))
-        else:
-            all_symptoms = current_symptoms
-        
-        print("All Symptoms Combined:", all_symptoms)
-        
+            return
+        
+        log.debug("Extracted Symptoms from current query: %s", current_symptoms)
+        
+        # Combine with previous symptoms if any. Stored session symptoms arrive as
+        # dictionary ids and map straight onto scoring columns, no string parsing
+        previous_columns = self.index.columns_from_dictionary(previous_symptom_ids or [])
+        previous_columns = list(dict.fromkeys(previous_columns + self.index.scoring.columns(previous_symptoms or [])))
+        columns = list(dict.fromkeys(previous_columns + self.index.scoring.columns(current_symptoms)))
+        all_symptoms = [self.index.symptoms[column] for column in columns]
+        
+        log.debug("All Symptoms Combined: %s", all_symptoms)
+        yield 'symptoms', {"extracted_symptoms": current_symptoms, "all_symptoms": all_symptoms}
+        
+        # The same symptom set always produces the same analysis, whatever order it arrived in
+        key = tuple(sorted(columns))
+        generation = self.results.generation
+        analysis = self.results.get(key)
+        if analysis is not None:
+            for stage, names in ANALYSIS_STAGES:
+                yield stage, {name: analysis[name] for name in names}
+            return
+        
+        analysis = {}
+        for stage, fields in self.analyze_stages(key, previous_columns):
+            analysis.update(fields)
+            yield stage, fields
+        self.results.put(key, analysis, generation)
+
+    def analyze_stages(self, columns, previous_columns=None):
+        symptoms = [self.index.symptoms[column] for column in columns]
+
         # Get multiple possible diseases based on symptoms
-        possible_diseases = self.recommend_diseases(all_symptoms)
-        print("Possible Diseases:", possible_diseases)
-        
-        # Generate follow-up questions for differential diagnosis
-        next_questions = self.generate_follow_up_questions(possible_diseases, all_symptoms)
-        
-        # Get details for top disease
-        top_disease = possible_diseases[0]['disease'] if possible_diseases else "Unknown Disease"
-        details = self.get_disease_details(top_disease) if possible_diseases else [{'description': 'No description available.', 'precautions': ['No precautions found.']}]
-        
-        # Generate diagnosis
-        diagnosis = self.generate_diagnosis(possible_diseases, all_symptoms)
-        
-        return {
-            "possible_diseases": possible_diseases,
-            "extracted_symptoms": current_symptoms,
-            "all_symptoms": all_symptoms,
-            "next_questions": next_questions,
+        with stage('scoring'):
+            possible_diseases = self.index.recommend_columns(list(columns), limit=5)
+        yield 'diseases', {"possible_diseases": possible_diseases}
+        
+        with stage('details'):
+            # Get details for top disease
+            top_disease = possible_diseases[0]['disease'] if possible_diseases else "Unknown Disease"
+            details = self.get_disease_details(top_disease) if possible_diseases else NO_DETAILS
+            
+            # Generate diagnosis
+            diagnosis = self.generate_diagnosis(possible_diseases, symptoms)
+        yield 'details', {
             "description": details[0]['description'] if details else "No description available",
             "precautions": details[0]['precautions'] if details else ["No precautions found"],
             "diagnostic_statement": diagnosis
         }
+        
+        # Generate follow-up questions for differential diagnosis
+        with stage('follow_up'):
+            next_questions = self.generate_follow_up_questions(possible_diseases, columns, previous_columns)
+        yield 'follow_up', {"next_questions": next_questions}
 
+    @METRICS.timed('icliniq_stage_seconds', stage='extract')
     def extract_symptoms(self, query):
-        # Tokenize the input query
-        inputs = self.tokenizer(query, return_tensors="pt", truncation=True, padding=True, max_length=512)
-        
-        # Get model predictions
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        
-        # Process the outputs to extract symptoms
-        # For a more realistic implementation, we'll use keyword matching against the database
-        symptom_list = self.get_symptom_list()
-        
-        # Convert query to lowercase for better matching
-        query_lower = query.lower()
-        extracted_symptoms = []
-        
-        # Use fuzzy matching to find symptoms in the query
-        for symptom in symptom_list:
-            if symptom.lower() in query_lower:
-                extracted_symptoms.append(symptom)
-                continue
-                
-            # Use fuzzy matching for more complex scenarios
-            matches = process.extract(symptom.lower(), [query_lower], limit=1)
-            for match, score in matches:
-                if score > 80:  # Threshold for fuzzy matching
+        # Exact and fuzzy (score > 80) matching against the compiled symptom vocabulary
+        if not self.matcher:
+            return []
+        extracted_symptoms = self.matcher.match(query)
+
+        # Only run the model forward pass when something consumes its output
+        if self.symptom_tagger and self.nlp.enabled:
+            logits = self.nlp.logits([query])
+            for symptom in self.symptom_tagger(query, logits[0]):
+                if symptom in self.index.symptom_ids and symptom not in extracted_symptoms:
                     extracted_symptoms.append(symptom)
-        
-        return list(dict.fromkeys(extracted_symptoms))
+
+        return extracted_symptoms
 
     def get_symptom_list(self):
-        if not self.graph:
+        if not self.index:
             return []
-        
-        query = """
-        MATCH (s:Symptom)
-        RETURN s.name AS symptom
-        """
-        result = self.graph.run(query).data()
-        return [row['symptom'] for row in result]
+        return self.index.symptom_list()
 
     def recommend_diseases(self, symptoms):
-        if not symptoms or not self.graph:
+        if not symptoms or not self.index:
             return []
-        
-        query = """
-        MATCH (d:Disease)-[:HAS_SYMPTOM]->(s:Symptom)
-        WHERE s.name IN $symptoms
-        WITH d, COLLECT(DISTINCT s.name) AS matched_symptoms, COUNT(DISTINCT s) AS matched_count
-        MATCH (d)-[:HAS_SYMPTOM]->(total:Symptom)
-        WITH d, matched_symptoms, matched_count, COUNT(DISTINCT total) AS total_count
-        WHERE total_count > 0
-        RETURN d.name AS disease, 
-               matched_symptoms,
-               matched_count, 
-               total_count, 
-               (matched_count * 1.0 / total_count) AS match_percentage
-        ORDER BY match_percentage DESC
-        LIMIT 5
-        """
-        result = self.graph.run(query, symptoms=symptoms).data()
-        return result
+        return self.index.recommend_diseases(symptoms, limit=5)
 
     def get_disease_details(self, disease_name):
-        if not self.graph:
-            return [{'description': 'No description available.', 'precautions': ['No precautions found.']}]
-        
-        query = """
-        MATCH (d:Disease {name: $disease_name})
-        OPTIONAL MATCH (d)-[:HAS_DESCRIPTION]->(desc:Description)
-        OPTIONAL MATCH (d)-[:HAS_PRECAUTION]->(prec:Precaution)
-        RETURN 
-            COALESCE(desc.text, 'No description available') AS description,
-            COLLECT(DISTINCT prec.text) AS precautions
-        """
-        result = self.graph.run(query, disease_name=disease_name).data()
-        return result
+        if not self.index:
+            return NO_DETAILS
+        return self.details_cache.get_or_compute(disease_name, lambda: self.index.get_disease_details(disease_name))
 
     def generate_diagnosis(self, possible_diseases, symptoms):
         if not possible_diseases:
@@ -214,16 +273,19 @@ class EnhancedRecommendationEngine:
         diagnosis += "\nMore information is needed for a conclusive diagnosis. Please answer the follow-up questions."
         return diagnosis
 
-    def generate_follow_up_questions(self, possible_diseases, current_symptoms):
-        if not self.graph or not possible_diseases:
+    def generate_follow_up_questions(self, possible_diseases, columns, previous_columns=None):
+        if not self.index or not possible_diseases:
             return ["Are you experiencing any other symptoms?"]
         
-        # Get distinctive symptoms for the top diseases
-        distinctive_symptoms = self.get_distinctive_symptoms(possible_diseases, current_symptoms)
+        # The symptoms whose answers best tell the candidate diseases apart
+        symptoms = self.index.questions.plan(possible_diseases, columns, previous_columns, limit=3)
+        if not symptoms:
+            # One candidate left, or nothing separates them: ask about the rest of its symptoms
+            symptoms = self.get_distinctive_symptoms(possible_diseases, [self.index.symptoms[column] for column in columns])
         
         # Convert to questions
         questions = []
-        for symptom in distinctive_symptoms[:3]:  # Limit to top 3 questions
+        for symptom in symptoms[:3]:  # Limit to top 3 questions
             questions.append(f"Are you experiencing {symptom}?")
         
         # Add a general question if we don't have enough specific ones
@@ -234,82 +296,52 @@ class EnhancedRecommendationEngine:
         return questions
 
     def get_distinctive_symptoms(self, possible_diseases, current_symptoms):
-        distinctive_symptoms = []
-        
         # Get all symptoms for the top diseases
         top_diseases = [disease['disease'] for disease in possible_diseases[:3]]
-        
-        query = """
-        MATCH (d:Disease)-[:HAS_SYMPTOM]->(s:Symptom)
-        WHERE d.name IN $diseases AND NOT s.name IN $current_symptoms
-        RETURN DISTINCT s.name AS symptom
-        LIMIT 10
-        """
-        
-        result = self.graph.run(query, diseases=top_diseases, current_symptoms=current_symptoms).data()
-        return [row['symptom'] for row in result]
+        return self.index.get_distinctive_symptoms(top_diseases, current_symptoms, limit=10)
 
-recommendation_engine = EnhancedRecommendationEngine()
+startup.register('chat_store', ChatStore)
+startup.register('chat_writer', lambda: ChatWriter(get_chat_store()), per_process=True)
+startup.register('recommendation_engine',
+                 lambda: EnhancedRecommendationEngine(symptom_dictionary=get_chat_store().dictionary))
+# Owns a process pool, which a forked worker must not share
+startup.register('report_service', ReportService, per_process=True)
 
-@app.route('/')
+@routes.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/get_recommendation', methods=['POST'])
+@routes.route('/refresh_index', methods=['POST'])
+def refresh_index():
+    payload, status = index_status(get_engine().refresh_index())
+    return jsonify(payload), status
+
+def index_status(index):
+    if not index:
+        return {'status': 'error', 'message': 'Knowledge index could not be loaded.'}, 503
+    return {
+        'status': 'ok',
+        'source': index.source,
+        'diseases': len(index.diseases),
+        'symptoms': len(index.symptoms)
+    }, 200
+
+@routes.route('/get_recommendation', methods=['POST'])
 def get_recommendation():
     query = request.json.get('message', '')
     session_id = request.json.get('session_id', None)
     
     try:
         # Get previous symptoms for this session if it exists
-        previous_symptoms = []
+        previous_symptom_ids = []
         if session_id:
-            previous_symptoms = get_previous_symptoms(session_id)
+            previous_symptom_ids = get_previous_symptom_ids(session_id)
         
         # Get recommendations with the enhanced engine
-        result = recommendation_engine.recommend(query, previous_symptoms)
+        result = get_engine().recommend(query, previous_symptom_ids=previous_symptom_ids)
         
-        # Extract all the data from the result
-        possible_diseases = result.get('possible_diseases', [])
+        response_data, formatted_response = build_recommendation_response(result)
         all_symptoms = result.get('all_symptoms', [])
-        next_questions = result.get('next_questions', [])
-        description = result.get('description', 'No description available.')
-        precautions = result.get('precautions', ['No precautions found.'])
-        diagnostic_statement = result.get('diagnostic_statement', 'Insufficient information.')
-        
-        # Top disease information
-        top_disease = possible_diseases[0]['disease'] if possible_diseases else 'Unable to determine'
-        
-        # Create a structured response with all information
-        response_data = {
-            'disease': top_disease,
-            'possible_diseases': possible_diseases,
-            'description': description,
-            'diagnostic_statement': diagnostic_statement,
-            'precautions': precautions,
-            'extracted_symptoms': all_symptoms,
-            'next_questions': next_questions
-        }
-
-        # Format the response for display in the chat
-        formatted_response = f"""<div class="response-container">
-            <p><strong>Extracted Symptoms:</strong> {', '.join(all_symptoms)}</p>
-            <p><strong>Possible Diseases:</strong></p>
-            <ul>
-                {"".join([f"<li>{disease['disease']} (Confidence: {disease['match_percentage']*100:.1f}%)</li>" for disease in possible_diseases[:3]])}
-            </ul>
-            <p><strong>Top Disease:</strong> {top_disease}</p>
-            <p><strong>Description:</strong> {description}</p>
-            <p><strong>Diagnostic Statement:</strong> {diagnostic_statement}</p>
-            <p><strong>Precautions:</strong></p>
-            <ul>
-                {"".join([f"<li>{precaution}</li>" for precaution in precautions])}
-            </ul>
-            <p><strong>Follow-up Questions:</strong></p>
-            <ul>
-                {"".join([f"<li>{question}</li>" for question in next_questions])}
-            </ul>
-        </div>"""
 
         # Save chat to database
         session_id = save_chat_to_db(query, formatted_response, session_id, all_symptoms)
@@ -322,186 +354,272 @@ def get_recommendation():
     
     except Exception as e:
         print(f"Error: {e}")
-        error_response = f"<div class='response-container'><p>Error: {str(e)}</p></div>"
-        session_id = save_chat_to_db(query, error_response, session_id)
-        return jsonify({
-            'disease': 'Error',
-            'description': str(e),
-            'diagnostic_statement': 'An error occurred.',
-            'precautions': [],
-            'session_id': session_id,
-            'formatted_response': error_response
-        })
-
-@app.route('/download_report', methods=['POST'])
-def download_report():
-    data = request.json
-    disease = data.get('disease', 'Unknown Disease')
-    description = data.get('description', 'No description available.')
-    diagnostic_statement = data.get('diagnostic_statement', 'No diagnostic statement available.')
-    precautions = data.get('precautions', ['No precautions available.'])
-    extracted_symptoms = data.get('extracted_symptoms', [])
-    possible_diseases = data.get('possible_diseases', [])
-
-    buffer = BytesIO()
-    pdf = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-
-    # Title
-    title = Paragraph("Medical Recommendation Report", styles['Title'])
-    story.append(title)
-    story.append(Spacer(1, 12))
-    
-    # Date
-    date_paragraph = Paragraph(f"<b>Date:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['BodyText'])
-    story.append(date_paragraph)
-    story.append(Spacer(1, 12))
-    
-    # Symptoms
-    if extracted_symptoms:
-        symptoms_paragraph = Paragraph(f"<b>Reported Symptoms:</b> {', '.join(extracted_symptoms)}", styles['BodyText'])
-        story.append(symptoms_paragraph)
-        story.append(Spacer(1, 12))
-
-    # Primary Disease
-    disease_paragraph = Paragraph(f"<b>Primary Recommendation:</b> {disease}", styles['BodyText'])
-    story.append(disease_paragraph)
-    story.append(Spacer(1, 12))
-    
-    # Other Possible Diseases
-    if possible_diseases and len(possible_diseases) > 1:
-        other_diseases_paragraph = Paragraph("<b>Other Possible Conditions:</b>", styles['BodyText'])
-        story.append(other_diseases_paragraph)
-        story.append(Spacer(1, 6))
-        
-        for i, disease_data in enumerate(possible_diseases[1:4], 2):  # Start from the second disease
-            disease_name = disease_data.get('disease', 'Unknown')
-            confidence = disease_data.get('match_percentage', 0) * 100
-            disease_item = Paragraph(f"{i-1}. {disease_name} (Confidence: {confidence:.1f}%)", styles['BodyText'])
-            story.append(disease_item)
-            
-        story.append(Spacer(1, 12))
-
-    # Description
-    description_paragraph = Paragraph(f"<b>Description:</b> {description}", styles['BodyText'])
-    story.append(description_paragraph)
-    story.append(Spacer(1, 12))
-
-    # Diagnostic Statement
-    diagnostic_paragraph = Paragraph(f"<b>Diagnostic Statement:</b> {diagnostic_statement}", styles['BodyText'])
-    story.append(diagnostic_paragraph)
-    story.append(Spacer(1, 12))
-
-    # Precautions
-    precautions_paragraph = Paragraph("<b>Precautions:</b>", styles['BodyText'])
-    story.append(precautions_paragraph)
-    for precaution in precautions:
-        precaution_paragraph = Paragraph(f"- {precaution}", styles['BodyText'])
-        story.append(precaution_paragraph)
-        story.append(Spacer(1, 6))
-    
-    # Disclaimer
-    story.append(Spacer(1, 24))
-    disclaimer = Paragraph("<i>Disclaimer: This report is generated by an AI system and is for informational purposes only. It is not a substitute for professional medical advice, diagnosis, or treatment. Always seek the advice of your physician or other qualified health provider with any questions you may have regarding a medical condition.</i>", styles['BodyText'])
-    story.append(disclaimer)
-
-    pdf.build(story)
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name='medical_report.pdf', mimetype='application/pdf')
-
-@app.route('/get_chat_history', methods=['GET'])
-def get_chat_history():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Fetch all chat sessions
-    cursor.execute('SELECT * FROM chat_sessions ORDER BY created_at DESC')
-    sessions = cursor.fetchall()
-
-    # Fetch messages for each session
-    chat_history = []
-    for session in sessions:
-        cursor.execute('SELECT * FROM chat_messages WHERE session_id = ? ORDER BY created_at', (session['session_id'],))
-        messages = cursor.fetchall()
-
-        # Convert sqlite3.Row objects to dictionaries
-        session_dict = dict(session)
-        messages_dict = [dict(message) for message in messages]
-
-        # Get the first message as a preview
-        preview = "Empty chat" if not messages else messages_dict[0]['message_text'][:30] + "..."
-
-        chat_history.append({
-            'session_id': session_dict['session_id'],
-            'created_at': session_dict['created_at'],
-            'preview': preview,
-            'messages': messages_dict
-        })
+        response_data, error_response = build_error_response(e)
+        response_data['session_id'] = save_chat_to_db(query, error_response, session_id)
+        return jsonify(response_data)
 
-    conn.close()
-    return jsonify(chat_history)
+@routes.route('/get_recommendation/stream', methods=['POST'])
+def get_recommendation_stream():
+    # Same answer as /get_recommendation, sent as server-sent events while it is
+    # computed: symptoms, diseases, details, follow_up, then done with the full
+    # response and session_id once the turn is saved
+    query = request.json.get('message', '')
+    session_id = request.json.get('session_id', None)
 
-def get_previous_symptoms(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get the symptoms from the session metadata
-    cursor.execute('SELECT symptoms FROM chat_session_data WHERE session_id = ?', (session_id,))
-    result = cursor.fetchone()
+    def generate():
+        try:
+            previous_symptom_ids = get_previous_symptom_ids(session_id) if session_id else []
+            engine = get_engine()
+            current_symptoms = engine.extract_symptoms(query)
+
+            result = {}
+            for stage, fields in engine.recommend_stages(current_symptoms, previous_symptom_ids=previous_symptom_ids):
+                result.update(fields)
+                yield server_sent_event(stage, fields)
+
+            response_data, formatted_response = build_recommendation_response(result)
+            response_data['session_id'] = save_chat_to_db(query, formatted_response, session_id,
+                                                          result.get('all_symptoms', []))
+            response_data['formatted_response'] = formatted_response
+            yield server_sent_event('done', response_data)
+        except Exception as e:
+            print(f"Error: {e}")
+            response_data, error_response = build_error_response(e)
+            response_data['session_id'] = save_chat_to_db(query, error_response, session_id)
+            yield server_sent_event('error', response_data)
+
+    # no-cache and X-Accel-Buffering keep proxies from holding events back
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Shared by this route and the async one in asgi.py
+@METRICS.timed('icliniq_stage_seconds', stage='format')
+def build_recommendation_response(result):
+    # Extract all the data from the result
+    possible_diseases = result.get('possible_diseases', [])
+    all_symptoms = result.get('all_symptoms', [])
+    next_questions = result.get('next_questions', [])
+    description = result.get('description', 'No description available.')
+    precautions = result.get('precautions', ['No precautions found.'])
+    diagnostic_statement = result.get('diagnostic_statement', 'Insufficient information.')
     
-    conn.close()
+    # Top disease information
+    top_disease = possible_diseases[0]['disease'] if possible_diseases else 'Unable to determine'
     
-    if result and result['symptoms']:
-        return result['symptoms'].split(',')
-    return []
-
-def save_chat_to_db(query, response, session_id=None, symptoms=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Create a structured response with all information
+    response_data = {
+        'disease': top_disease,
+        'possible_diseases': possible_diseases,
+        'description': description,
+        'diagnostic_statement': diagnostic_statement,
+        'precautions': precautions,
+        'extracted_symptoms': all_symptoms,
+        'next_questions': next_questions
+    }
+
+    # Format the response for display in the chat
+    formatted_response = f"""<div class="response-container">
+        <p><strong>Extracted Symptoms:</strong> {', '.join(all_symptoms)}</p>
+        <p><strong>Possible Diseases:</strong></p>
+        <ul>
+            {"".join([f"<li>{disease['disease']} (Confidence: {disease['match_percentage']*100:.1f}%)</li>" for disease in possible_diseases[:3]])}
+        </ul>
+        <p><strong>Top Disease:</strong> {top_disease}</p>
+        <p><strong>Description:</strong> {description}</p>
+        <p><strong>Diagnostic Statement:</strong> {diagnostic_statement}</p>
+        <p><strong>Precautions:</strong></p>
+        <ul>
+            {"".join([f"<li>{precaution}</li>" for precaution in precautions])}
+        </ul>
+        <p><strong>Follow-up Questions:</strong></p>
+        <ul>
+            {"".join([f"<li>{question}</li>" for question in next_questions])}
+        </ul>
+    </div>"""
+
+    return response_data, formatted_response
+
+def build_error_response(error):
+    error_response = f"<div class='response-container'><p>Error: {str(error)}</p></div>"
+    return {
+        'disease': 'Error',
+        'description': str(error),
+        'diagnostic_statement': 'An error occurred.',
+        'precautions': [],
+        'formatted_response': error_response
+    }, error_response
+
+@routes.route('/download_report', methods=['POST'])
+def download_report():
+    # Rendered in the report service's process pool; repeat downloads come from its cache
+    pdf = get_report_service().render(request.json)
+    return send_file(BytesIO(pdf), as_attachment=True, download_name='medical_report.pdf', mimetype='application/pdf')
 
-    # Convert datetime to string
-    created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+@routes.route('/get_chat_history', methods=['GET'])
+def get_chat_history():
+    # One page of sessions, newest first; pass next_before back as ?before= for the next page
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    # History reads see every turn already answered
+    get_chat_writer().flush()
+    sessions = get_chat_store().list_sessions(before, limit)
+
+    next_before = sessions[-1]['session_id'] if len(sessions) == min(max(limit, 1), MAX_PAGE_SIZE) else None
+    return jsonify({'sessions': sessions, 'next_before': next_before})
+
+@routes.route('/get_chat_history/<int:session_id>/messages', methods=['GET'])
+def get_session_messages(session_id):
+    # Messages are fetched lazily per session and streamed straight off the cursor
+    after = request.args.get('after', type=int)
+    limit = max(1, min(request.args.get('limit', MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    get_chat_writer().flush()
+    return Response(stream_with_context(get_chat_store().stream_session_messages(session_id, after, limit)),
+                    mimetype='application/json')
+
+@routes.route('/stats', methods=['GET'])
+def stats():
+    # Reports only what is already running; asking for stats never builds a subsystem
+    report = {'startup': startup.report()}
+    chat_writer = startup.peek('chat_writer')
+    if chat_writer is not None:
+        report['chat_writer'] = chat_writer.stats()
+    engine = startup.peek('recommendation_engine')
+    if engine is not None:
+        report['recommend_cache'] = engine.results.stats()
+        report['details_cache'] = engine.details_cache.stats()
+        report['graph'] = engine.graph.stats()
+    report_service = startup.peek('report_service')
+    if report_service is not None:
+        report['reports'] = report_service.stats()
+    return jsonify(report)
+
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format: latency histograms plus counters and gauges of what is running
+    return Response(METRICS.render(metric_samples()), mimetype='text/plain; version=0.0.4')
+
+def metric_samples():
+    samples = []
+    chat_writer = startup.peek('chat_writer')
+    if chat_writer is not None:
+        writer = chat_writer.stats()
+        samples += [
+            ('icliniq_chat_queue_depth', 'gauge', 'Chat turns waiting to be written', {}, writer['queue_depth']),
+            ('icliniq_chat_turns_written_total', 'counter', 'Chat turns committed', {}, writer['written']),
+            ('icliniq_chat_turns_failed_total', 'counter', 'Chat turns that could not be written', {}, writer['failed']),
+        ]
+    engine = startup.peek('recommendation_engine')
+    caches = [engine.results, engine.details_cache] if engine is not None else []
+    for cache in caches:
+        cache_stats = cache.stats()
+        samples += [
+            ('icliniq_cache_hits_total', 'counter', 'Result cache hits', {'cache': cache.name}, cache_stats['hits']),
+            ('icliniq_cache_misses_total', 'counter', 'Result cache misses', {'cache': cache.name}, cache_stats['misses']),
+            ('icliniq_cache_entries', 'gauge', 'Result cache entries', {'cache': cache.name}, cache_stats['size']),
+        ]
+    if engine is not None:
+        graph = engine.graph.stats()
+        samples += [
+            ('icliniq_neo4j_breaker_open', 'gauge', '1 while the Neo4j circuit breaker is not closed', {},
+             graph['breaker'] != 'closed'),
+            ('icliniq_neo4j_retries_total', 'counter', 'Neo4j query retries', {}, graph['retried']),
+            ('icliniq_neo4j_failures_total', 'counter', 'Neo4j queries that failed every retry', {}, graph['failed']),
+        ]
+    return samples
+
+@routes.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile = profiler.start(PROFILE_HEADER in request.headers)
+
+@routes.after_request
+def record_request_time(response):
+    # Streamed responses are timed up to their first byte
+    endpoint = request.endpoint or 'unknown'
+    METRICS.observe('icliniq_request_seconds', time.perf_counter() - g.request_started, endpoint=endpoint)
+    if g.profile is not None:
+        profile, g.profile = g.profile, None
+        response.headers['X-ICLINIQ-Profile-Dump'] = os.path.basename(profiler.stop(profile, endpoint))
+    return response
+
+@routes.teardown_request
+def finish_profile(error=None):
+    # A request that raised never reached after_request; still end its profile
+    if g.get('profile') is not None:
+        profiler.stop(g.profile, request.endpoint or 'unknown')
+        g.profile = None
+
+@routes.route('/ready', methods=['GET'])
+def ready():
+    # 200 once a recommendation can be served without building anything, else 503
+    engine = startup.peek('recommendation_engine')
+    subsystems = {
+        'chat_store': startup.is_warm('chat_store'),
+        'chat_writer': startup.is_warm('chat_writer'),
+        'neo4j': engine is not None and engine.graph.available,
+        'knowledge_index': engine is not None and engine.index is not None,
+        'nlp_model': engine is not None and engine.nlp.loaded,
+    }
+    # The model only has to be warm when something is going to use it
+    required = ['chat_store', 'chat_writer', 'knowledge_index']
+    if engine is not None and engine.nlp.mode == 'on':
+        required.append('nlp_model')
+    is_ready = all(subsystems[name] for name in required)
+    if not is_ready:
+        # Without ICLINIQ_WARM_UP nothing is built until a chat request arrives, and a
+        # probe gating traffic on /ready would wait forever; the first probe starts it
+        startup.warm_up(background=True)
+    return jsonify({'ready': is_ready, 'subsystems': subsystems, 'startup': startup.report()}), 200 if is_ready else 503
+
+@routes.route('/analytics/symptoms', methods=['GET'])
+def symptom_analytics():
+    # Most common symptoms and symptom pairs in sessions started within the last ?days= (default 7)
+    days = request.args.get('days', 7, type=int)
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+    since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    get_chat_writer().flush()
+    return jsonify({
+        'since': since,
+        'symptoms': get_chat_store().common_symptoms(since, limit),
+        'combinations': get_chat_store().common_symptom_pairs(since, limit)
+    })
+
+def get_previous_symptom_ids(session_id):
+    # Includes turns still waiting in the write-behind queue
+    return get_chat_writer().get_previous_symptom_ids(session_id)
 
-    # Create a new chat session if session_id is not provided
-    if not session_id:
-        cursor.execute('INSERT INTO chat_sessions (created_at) VALUES (?)', (created_at,))
-        session_id = cursor.lastrowid
-        
-        # Create metadata table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_session_data (
-                session_id INTEGER PRIMARY KEY,
-                symptoms TEXT,
-                FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
-            )
-        ''')
-
-    # Save user message
-    cursor.execute('INSERT INTO chat_messages (session_id, message_text, is_user) VALUES (?, ?, ?)',
-                   (session_id, query, True))
-
-    # Save bot response
-    cursor.execute('INSERT INTO chat_messages (session_id, message_text, is_user) VALUES (?, ?, ?)',
-                   (session_id, response, False))
-    
-    # Update session data with symptoms
-    if symptoms:
-        symptoms_str = ','.join(symptoms)
-        
-        # Check if session data already exists
-        cursor.execute('SELECT * FROM chat_session_data WHERE session_id = ?', (session_id,))
-        if cursor.fetchone():
-            cursor.execute('UPDATE chat_session_data SET symptoms = ? WHERE session_id = ?', 
-                          (symptoms_str, session_id))
-        else:
-            cursor.execute('INSERT INTO chat_session_data (session_id, symptoms) VALUES (?, ?)',
-                          (session_id, symptoms_str))
+def get_previous_symptoms(session_id):
+    return get_chat_writer().get_previous_symptoms(session_id)
 
-    conn.commit()
-    conn.close()
+def session_report_data(session_id):
+    # A stored session's report, recomputed from its symptoms (bulk reports in report_service.py)
+    result = get_engine().recommend_symptoms([], previous_symptom_ids=get_previous_symptom_ids(session_id))
+    return build_recommendation_response(result)[0]
 
-    return session_id
+@METRICS.timed('icliniq_stage_seconds', stage='save')
+def save_chat_to_db(query, response, session_id=None, symptoms=None):
+    return get_chat_writer().save(query, response, session_id, symptoms)
+
+def create_app(warm_up=WARM_UP):
+    # Cheap by design: no database, graph or model is touched until a request
+    # needs it, unless warm_up starts building them in the background right away
+    with startup.phase('create_app'):
+        app = Flask(__name__)
+        app.register_blueprint(routes)
+    if warm_up:
+        startup.warm_up(background=True)
+    return app
+
+# Never warms up on import: a spawned report worker re-imports the main module,
+# and must not build its own graph client, index and chat writer. The entry
+# points (below, serve.py, asgi.py's lifespan) start the warm-up themselves.
+app = create_app(warm_up=False)
 
 if __name__ == '__main__':
+    # Development server; serve.py runs pre-forked workers for production
+    if WARM_UP:
+        startup.warm_up(background=True)
     app.run(host='127.0.0.1', port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from app import (WARM_UP, create_app, routes, startup, get_engine, get_previous_symptom_ids, save_chat_to_db,
+                 build_recommendation_response, build_error_response, index_status, server_sent_event)
+from knowledge_index import KnowledgeIndex
+from graph_access import NEO4J_URI, NEO4J_AUTH, POOL_SIZE
+from metrics import METRICS
+
+# Serve with any ASGI server, e.g. `uvicorn asgi:app --workers 4`.
+# POST /get_recommendation, its /stream variant and /refresh_index are native
+# async handlers; every other route runs the regular Flask app on the thread pool.
+
+THREAD_POOL_SIZE = int(os.environ.get('ICLINIQ_ASYNC_THREADS', 0)) or min(32, (os.cpu_count() or 1) + 4)
+
+executor = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix='asgi')
+flask_app = create_app(warm_up=False)
+_driver = None
+
+
+def run(fn, *args):
+    # Blocking work (symptom extraction, SQLite) runs on the pool, never on the event loop
+    return asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args))
+
+
+async def constant(value):
+    return value
+
+
+def graph_driver():
+    # The async Neo4j driver keeps its own session pool; None when the package is absent
+    global _driver
+    if _driver is None:
+        try:
+            from neo4j import AsyncGraphDatabase  # type: ignore
+        except ImportError:
+            return None
+        _driver = AsyncGraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH, max_connection_pool_size=POOL_SIZE)
+    return _driver
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_response(send, status, body, content_type=b'application/json'):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, status, payload):
+    await send_response(send, status, json.dumps(payload).encode())
+
+
+async def get_recommendation(scope, receive, send):
+    data = json.loads(await read_body(receive) or b'{}')
+    query = data.get('message', '')
+    session_id = data.get('session_id', None)
+    engine = await run(get_engine)
+
+    try:
+        # Extraction (CPU) and the session's stored symptoms (SQLite) don't depend
+        # on each other, so they run side by side on the pool
+        current_symptoms, previous_symptom_ids = await asyncio.gather(
+            run(engine.extract_symptoms, query),
+            run(get_previous_symptom_ids, session_id) if session_id else constant([]))
+
+        # A reload after a re-ingest reads the CSVs or Neo4j, so it happens on the
+        # pool; what's left is in-memory and memoized, cheap enough for the loop
+        await run(engine.check_ingest)
+        result = engine.recommend_symptoms(current_symptoms, previous_symptom_ids=previous_symptom_ids)
+        response_data, formatted_response = build_recommendation_response(result)
+
+        response_data['session_id'] = await run(save_chat_to_db, query, formatted_response, session_id,
+                                                result.get('all_symptoms', []))
+        response_data['formatted_response'] = formatted_response
+    except Exception as e:
+        print(f"Error: {e}")
+        response_data, error_response = build_error_response(e)
+        response_data['session_id'] = await run(save_chat_to_db, query, error_response, session_id)
+
+    await send_json(send, 200, response_data)
+
+
+async def get_recommendation_stream(scope, receive, send):
+    # Server-sent events, one per recommend stage, flushed as soon as each is ready
+    data = json.loads(await read_body(receive) or b'{}')
+    query = data.get('message', '')
+    session_id = data.get('session_id', None)
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                            (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+
+    async def emit(event, payload):
+        await send({'type': 'http.response.body', 'body': server_sent_event(event, payload).encode(),
+                    'more_body': True})
+
+    engine = await run(get_engine)
+    try:
+        current_symptoms, previous_symptom_ids = await asyncio.gather(
+            run(engine.extract_symptoms, query),
+            run(get_previous_symptom_ids, session_id) if session_id else constant([]))
+
+        await run(engine.check_ingest)
+        result = {}
+        for stage, fields in engine.recommend_stages(current_symptoms, previous_symptom_ids=previous_symptom_ids):
+            result.update(fields)
+            await emit(stage, fields)
+        response_data, formatted_response = build_recommendation_response(result)
+
+        response_data['session_id'] = await run(save_chat_to_db, query, formatted_response, session_id,
+                                                result.get('all_symptoms', []))
+        response_data['formatted_response'] = formatted_response
+        await emit('done', response_data)
+    except Exception as e:
+        print(f"Error: {e}")
+        response_data, error_response = build_error_response(e)
+        response_data['session_id'] = await run(save_chat_to_db, query, error_response, session_id)
+        await emit('error', response_data)
+
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def refresh_index(scope, receive, send):
+    await read_body(receive)
+    engine = await run(get_engine)
+    driver = graph_driver()
+    index = None
+    if driver is not None:
+        try:
+            index = await KnowledgeIndex.from_graph_async(driver, scorer=engine.scorer)
+            index = await run(engine.install_index, index)
+        except Exception as e:
+            print(f"Async knowledge index load failed, falling back: {e}")
+    if index is None:
+        # No async driver (or Neo4j down): the regular py2neo / CSV refresh
+        index = await run(engine.refresh_index)
+    payload, status = index_status(index)
+    await send_json(send, status, payload)
+
+
+ROUTES = {
+    ('POST', '/get_recommendation'): get_recommendation,
+    ('POST', '/get_recommendation/stream'): get_recommendation_stream,
+    ('POST', '/refresh_index'): refresh_index,
+}
+
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def call_flask(scope, receive, send):
+    # Runs the WSGI app on the pool; the response is buffered, which is fine for
+    # everything except very long message streams (use the WSGI server for those)
+    environ = wsgi_environ(scope, await read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    def respond():
+        result = flask_app(environ, start_response)
+        try:
+            return b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    body = await run(respond)
+    await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if WARM_UP:
+                startup.warm_up(background=True)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await run(startup.shutdown)
+            if _driver is not None:
+                await _driver.close()
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        # Timed by the Flask app's own request hooks
+        return await call_flask(scope, receive, send)
+    # Native routes skip those hooks; same histogram and endpoint label, timed to the last byte
+    with METRICS.timer('icliniq_request_seconds', endpoint=f'{routes.name}.{handler.__name__}'):
+        await handler(scope, receive, send)
@@ -0,0 +1,313 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from data_ingestion import DATA_DIR, load_frames
+from graph_access import GraphClient, GraphUnavailable
+
+# Regressions beyond this (relative p50/p95 change) are flagged by --compare
+REGRESSION_THRESHOLD = 0.10
+
+TEMPLATES = [
+    "I have {symptoms}",
+    "I've been having {symptoms} for a few days",
+    "my symptoms are {symptoms}",
+    "{symptoms} since yesterday",
+    "doctor, I am suffering from {symptoms}",
+]
+
+
+def graph_rows(frames):
+    # The rows Neo4j returns for knowledge_index.GRAPH_QUERIES, rebuilt from the ingest frames
+    disease_symptoms = {}
+    for row in frames['disease_symptoms'].itertuples(index=False):
+        disease_symptoms.setdefault(row.disease, []).append(row.symptom)
+    precautions = {}
+    for row in frames['precautions'].itertuples(index=False):
+        precautions.setdefault(row.disease, []).append(row.text)
+    diseases = (set(disease_symptoms) | set(frames['descriptions']['disease']) | set(precautions))
+    return {
+        'diseases': [{'disease': name} for name in sorted(diseases)],
+        'disease_symptoms': [{'disease': d, 'symptoms': s} for d, s in disease_symptoms.items()],
+        'symptoms': [{'symptom': s} for s in frames['severities']['symptom']],
+        'descriptions': [{'disease': row.disease, 'description': row.text}
+                         for row in frames['descriptions'].itertuples(index=False)],
+        'precautions': [{'disease': d, 'precautions': p} for d, p in precautions.items()],
+        'severities': [{'symptom': row.symptom, 'weight': int(row.weight)}
+                       for row in frames['severities'].itertuples(index=False)],
+    }
+
+
+class MemoryGraph(GraphClient):
+    # Neo4j stand-in for benchmarks: answers the knowledge index's batched read
+    # from the CSVs in memory, keeping the real client's breaker, stats and
+    # latency histograms. Any other query fails like an unreachable Neo4j would.
+    def __init__(self, data_dir=DATA_DIR):
+        super().__init__(uri='memory://')
+        self.rows = graph_rows(load_frames(data_dir))
+
+    def connect(self):
+        self._graph = self
+        return self
+
+    def close(self):
+        self._graph = None
+
+    def query(self, query, name=None, **parameters):
+        raise GraphUnavailable("MemoryGraph only serves the knowledge index queries")
+
+    def query_batch(self, queries, name='batch'):
+        start = time.perf_counter()
+        rows = {key: self.rows[key] for key in queries}
+        self._observe(name, time.perf_counter() - start)
+        return rows
+
+
+def dataset_rows(path=os.path.join(DATA_DIR, 'dataset.csv')):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [(row[0].strip(), [s.strip() for s in row[1:] if s and s.strip()]) for row in reader]
+
+
+def add_typo(word, rng):
+    # One keyboard slip: swap, drop, double or replace a character
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(['swap', 'drop', 'double', 'replace'])
+    if kind == 'swap':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 'drop':
+        return word[:i] + word[i + 1:]
+    if kind == 'double':
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+
+def phrase(symptoms, rng, typo_rate):
+    # "I have skin rash, itchng and chills"
+    words = []
+    for symptom in symptoms:
+        text = ' '.join(add_typo(word, rng) if rng.random() < typo_rate else word
+                        for word in symptom.replace('_', ' ').split())
+        words.append(text)
+    listed = words[0] if len(words) == 1 else ', '.join(words[:-1]) + ' and ' + words[-1]
+    return rng.choice(TEMPLATES).format(symptoms=listed)
+
+
+def generate_workload(rows, queries=500, sessions=100, typo_rate=0.15, seed=0):
+    # Single-turn queries plus multi-turn sessions, each symptom named at most once
+    rng = random.Random(seed)
+    single = []
+    for _ in range(queries):
+        disease, symptoms = rng.choice(rows)
+        picked = rng.sample(symptoms, min(len(symptoms), rng.randint(1, 4)))
+        single.append({'disease': disease, 'symptoms': picked, 'query': phrase(picked, rng, typo_rate)})
+
+    multi = []
+    for _ in range(sessions):
+        disease, symptoms = rng.choice(rows)
+        remaining = rng.sample(symptoms, len(symptoms))
+        turns = []
+        while remaining and len(turns) < 4:
+            count = rng.randint(1, 2)
+            picked, remaining = remaining[:count], remaining[count:]
+            turns.append({'symptoms': picked, 'query': phrase(picked, rng, typo_rate)})
+        multi.append({'disease': disease, 'symptoms': symptoms, 'turns': turns})
+    return {'single': single, 'sessions': multi}
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def measure(fn, items, warmup=10):
+    # Runs fn once per item; latency percentiles and throughput over the whole run
+    for item in items[:warmup]:
+        fn(item)
+    timings = []
+    started = time.perf_counter()
+    for item in items:
+        start = time.perf_counter_ns()
+        fn(item)
+        timings.append((time.perf_counter_ns() - start) / 1e6)
+    elapsed = time.perf_counter() - started
+    timings = np.array(timings)
+    return {
+        'n': len(items),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'mean_ms': float(timings.mean()),
+        'throughput_per_s': len(items) / elapsed if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_benchmarks(workload, db_path, durability='async'):
+    import app as application
+    from chat_store import ChatStore
+    from chat_writer import ChatWriter
+
+    # Temp chat DB and the in-memory graph, registered before anything is built
+    startup = application.startup
+    startup.register('chat_store', lambda: ChatStore(db_path))
+    startup.register('chat_writer', lambda: ChatWriter(application.get_chat_store(), durability=durability),
+                     per_process=True)
+    startup.register('recommendation_engine', lambda: application.EnhancedRecommendationEngine(
+        symptom_dictionary=application.get_chat_store().dictionary, graph=MemoryGraph()))
+
+    results = {'startup_rss_mb': peak_rss_mb()}
+    started = time.perf_counter()
+    engine = application.get_engine()
+    application.get_chat_writer()
+    results['cold_start_ms'] = (time.perf_counter() - started) * 1000
+    client = application.app.test_client()
+    single = workload['single']
+    stages = {}
+
+    # Extraction, plus how many of the intended symptoms it recovered despite typos
+    stages['extract_symptoms'] = measure(lambda item: engine.extract_symptoms(item['query']), single)
+    found = [set(engine.extract_symptoms(item['query'])) for item in single]
+    results['extraction_recall'] = float(np.mean([len(f & set(item['symptoms'])) / len(item['symptoms'])
+                                                  for f, item in zip(found, single)]))
+
+    stages['recommend_diseases'] = measure(lambda item: engine.recommend_diseases(item['symptoms']), single)
+
+    def analyze(item):
+        columns = tuple(sorted(engine.index.scoring.columns(item['symptoms'])))
+        return dict(kv for _, fields in engine.analyze_stages(columns) for kv in fields.items())
+    stages['analyze_uncached'] = measure(analyze, single)
+
+    analyses = [dict(analyze(item), all_symptoms=item['symptoms']) for item in single]
+    stages['format_response'] = measure(application.build_recommendation_response, analyses)
+
+    stages['save_chat_to_db'] = measure(
+        lambda item: application.save_chat_to_db(item['query'], '<div>benchmark</div>', None, item['symptoms']), single)
+    application.get_chat_writer().flush(timeout=None)
+    store = application.get_chat_store()
+    stages['save_turn_sync'] = measure(
+        lambda item: store.save_turn(item['query'], '<div>benchmark</div>', None, item['symptoms']), single)
+
+    # The full HTTP path, results cache included (repeated symptom sets hit it)
+    def post(path, body):
+        response = client.post(path, json=body)
+        response.get_data()
+        return response
+    stages['get_recommendation'] = measure(
+        lambda item: post('/get_recommendation', {'message': item['query']}), single)
+    stages['get_recommendation_stream'] = measure(
+        lambda item: post('/get_recommendation/stream', {'message': item['query']}), single)
+
+    # Multi-turn sessions, measured per turn; each turn carries the session forward
+    hits = []
+    turn_timings = []
+
+    def run_session(session):
+        session_id = None
+        for turn in session['turns']:
+            start = time.perf_counter_ns()
+            data = post('/get_recommendation', {'message': turn['query'], 'session_id': session_id}).get_json()
+            turn_timings.append((time.perf_counter_ns() - start) / 1e6)
+            session_id = data['session_id']
+        hits.append(data['disease'] == session['disease'])
+
+    stages['session'] = measure(run_session, workload['sessions'], warmup=0)
+    turn_timings = np.array(turn_timings)
+    stages['session_turn'] = {
+        'n': len(turn_timings),
+        'p50_ms': float(np.percentile(turn_timings, 50)),
+        'p95_ms': float(np.percentile(turn_timings, 95)),
+        'p99_ms': float(np.percentile(turn_timings, 99)),
+        'mean_ms': float(turn_timings.mean()),
+        'throughput_per_s': 1000.0 / turn_timings.mean(),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    results['session_top1_accuracy'] = float(np.mean(hits))
+
+    application.get_chat_writer().flush(timeout=None)
+    results['stages'] = stages
+    results['peak_rss_mb'] = peak_rss_mb()
+    startup.shutdown()
+    return results
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    # Relative change per stage; positive is slower
+    rows = []
+    for name, stats in current['results']['stages'].items():
+        before = baseline['results']['stages'].get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            change = (stats[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            rows.append((name, metric, before[metric], stats[metric], change, change > threshold))
+    return rows
+
+
+def print_results(results):
+    print(f"Cold start {results['cold_start_ms']:.0f} ms, peak RSS {results['peak_rss_mb']:.1f} MB, "
+          f"extraction recall {results['extraction_recall'] * 100:.1f}%, "
+          f"session top-1 {results['session_top1_accuracy'] * 100:.1f}%")
+    print(f"  {'stage':<28} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'RSS MB':>8}")
+    for name, stats in results['stages'].items():
+        print(f"  {name:<28} {stats['n']:>6} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+              f"{stats['throughput_per_s']:>10.1f} {stats['peak_rss_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation pipeline on queries generated from dataset.csv.")
+    parser.add_argument('--queries', type=int, default=500, help="Single-turn queries")
+    parser.add_argument('--sessions', type=int, default=100, help="Multi-turn sessions")
+    parser.add_argument('--typo-rate', type=float, default=0.15, help="Chance each word gets a typo")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--durability', default='async', choices=['sync', 'commit', 'async'],
+                        help="Chat writer mode used by save_chat_to_db and the HTTP path")
+    parser.add_argument('--save', default=None, help="Write the results to this JSON baseline")
+    parser.add_argument('--compare', default=None, help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    workload = generate_workload(dataset_rows(), args.queries, args.sessions, args.typo_rate, args.seed)
+    with tempfile.TemporaryDirectory(prefix='icliniq-bench-') as tmp:
+        results = run_benchmarks(workload, os.path.join(tmp, 'chat_history.db'), args.durability)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': vars(args),
+        'results': results,
+    }
+    print_results(results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline['created_at']}):")
+        workload_keys = ('queries', 'sessions', 'typo_rate', 'seed', 'durability')
+        if any(baseline['config'].get(key) != report['config'][key] for key in workload_keys):
+            print("  Note: the baseline ran a different workload; differences are not like for like")
+        regressions = 0
+        for name, metric, before, after, change, regressed in compare(report, baseline):
+            regressions += regressed
+            print(f"  {name:<28} {metric:<7} {before:9.3f} -> {after:9.3f} ms  {change * 100:+6.1f}%"
+                  f"{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f"{regressions} metrics regressed by more than {REGRESSION_THRESHOLD * 100:.0f}%")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
@@ -0,0 +1,386 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from metrics import METRICS
+
+DB_PATH = os.environ.get('ICLINIQ_CHAT_DB', 'chat_history.db')
+# Connections shared by every thread of a process; a caller waits up to
+# POOL_TIMEOUT seconds for one when all are checked out
+POOL_SIZE = int(os.environ.get('ICLINIQ_CHAT_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = 10.0
+
+# The one schema definition for the chat database
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    preview TEXT
+);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER,
+    message_text TEXT,
+    is_user BOOLEAN,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
+);
+
+-- Every symptom name gets one integer id; sessions store ids, never names
+CREATE TABLE IF NOT EXISTS symptom_dictionary (
+    symptom_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+-- A session's symptoms, one row each, tagged with the user turn that first mentioned it
+CREATE TABLE IF NOT EXISTS session_symptoms (
+    session_id INTEGER NOT NULL,
+    symptom_id INTEGER NOT NULL,
+    first_seen_turn INTEGER NOT NULL,
+    PRIMARY KEY (session_id, symptom_id),
+    FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id),
+    FOREIGN KEY (symptom_id) REFERENCES symptom_dictionary (symptom_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created ON chat_messages (session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_created ON chat_sessions (created_at);
+CREATE INDEX IF NOT EXISTS idx_session_symptoms_symptom ON session_symptoms (symptom_id);
+'''
+
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',     # Readers no longer block the writer (and vice versa)
+    'PRAGMA synchronous=NORMAL',   # fsync at checkpoints only; safe with WAL
+    'PRAGMA cache_size=-16000',    # 16 MB page cache per connection
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+]
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MESSAGE_FETCH_SIZE = 100
+
+# Databases created before the preview column existed get it added and backfilled
+MIGRATIONS = [
+    ('chat_sessions', 'preview', [
+        'ALTER TABLE chat_sessions ADD COLUMN preview TEXT',
+        '''UPDATE chat_sessions SET preview = (
+               SELECT substr(m.message_text, 1, 30) || '...' FROM chat_messages m
+               WHERE m.session_id = chat_sessions.session_id
+               ORDER BY m.created_at, m.message_id LIMIT 1)''',
+    ]),
+]
+
+# Statements are module constants so each pooled connection's statement cache reuses them
+INSERT_SESSION = 'INSERT INTO chat_sessions (created_at, preview) VALUES (?, ?)'
+INSERT_SESSION_WITH_ID = 'INSERT OR IGNORE INTO chat_sessions (session_id, created_at, preview) VALUES (?, ?, ?)'
+INSERT_MESSAGE = 'INSERT INTO chat_messages (session_id, message_text, is_user) VALUES (?, ?, ?)'
+COUNT_USER_TURNS = 'SELECT COUNT(*) FROM chat_messages WHERE session_id = ? AND is_user'
+# Appends only: symptoms already recorded for the session keep their first_seen_turn
+INSERT_SESSION_SYMPTOM = 'INSERT OR IGNORE INTO session_symptoms (session_id, symptom_id, first_seen_turn) VALUES (?, ?, ?)'
+INSERT_SYMPTOM_NAME = 'INSERT OR IGNORE INTO symptom_dictionary (name) VALUES (?)'
+SELECT_SYMPTOM_DICTIONARY = 'SELECT symptom_id, name FROM symptom_dictionary'
+# Session IDs handed out ahead of time come from the AUTOINCREMENT counter itself,
+# so they stay unique across threads, workers and restarts
+SEED_SESSION_SEQUENCE = '''
+INSERT INTO sqlite_sequence (name, seq)
+SELECT 'chat_sessions', COALESCE(MAX(session_id), 0) FROM chat_sessions
+WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'chat_sessions')
+'''
+RESERVE_SESSION_IDS = "UPDATE sqlite_sequence SET seq = seq + ? WHERE name = 'chat_sessions' RETURNING seq"
+SELECT_SESSION_SYMPTOMS = '''
+SELECT symptom_id FROM session_symptoms WHERE session_id = ?
+ORDER BY first_seen_turn, symptom_id
+'''
+# Keyset pagination: newest first, continuing strictly after the `before` session
+SELECT_SESSIONS_PAGE = '''
+SELECT s.session_id, s.created_at, COALESCE(s.preview, 'Empty chat') AS preview,
+       (SELECT group_concat(d.name, ',') FROM session_symptoms ss
+        JOIN symptom_dictionary d ON d.symptom_id = ss.symptom_id
+        WHERE ss.session_id = s.session_id) AS symptoms
+FROM chat_sessions s
+WHERE ?1 IS NULL
+   OR (s.created_at, s.session_id) < (SELECT created_at, session_id FROM chat_sessions WHERE session_id = ?1)
+ORDER BY s.created_at DESC, s.session_id DESC
+LIMIT ?2
+'''
+SELECT_SESSION_IDS = 'SELECT session_id FROM chat_sessions WHERE ?1 IS NULL OR created_at >= ?1 ORDER BY session_id'
+SELECT_SESSION_MESSAGES = '''
+SELECT message_id, session_id, message_text, is_user, created_at
+FROM chat_messages
+WHERE session_id = ?1
+  AND (?2 IS NULL
+       OR (created_at, message_id) > (SELECT created_at, message_id FROM chat_messages WHERE message_id = ?2))
+ORDER BY created_at, message_id
+LIMIT ?3
+'''
+# Analytics: symptoms, and symptom pairs, reported together in sessions started since ?1
+SELECT_COMMON_SYMPTOMS = '''
+SELECT d.name AS symptom, COUNT(*) AS sessions
+FROM session_symptoms ss
+JOIN symptom_dictionary d ON d.symptom_id = ss.symptom_id
+WHERE ss.session_id IN (SELECT session_id FROM chat_sessions WHERE created_at >= ?1)
+GROUP BY ss.symptom_id
+ORDER BY sessions DESC, d.name
+LIMIT ?2
+'''
+SELECT_COMMON_SYMPTOM_PAIRS = '''
+SELECT da.name AS first, db.name AS second, COUNT(*) AS sessions
+FROM session_symptoms a
+JOIN session_symptoms b ON b.session_id = a.session_id AND b.symptom_id > a.symptom_id
+JOIN symptom_dictionary da ON da.symptom_id = a.symptom_id
+JOIN symptom_dictionary db ON db.symptom_id = b.symptom_id
+WHERE a.session_id IN (SELECT session_id FROM chat_sessions WHERE created_at >= ?1)
+GROUP BY a.symptom_id, b.symptom_id
+ORDER BY sessions DESC, da.name, db.name
+LIMIT ?2
+'''
+# Pre-normalization databases kept a comma-joined string per session
+HAS_LEGACY_SESSION_DATA = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_session_data'"
+SELECT_LEGACY_SESSION_DATA = 'SELECT session_id, symptoms FROM chat_session_data'
+
+# One chat turn with its session already allocated; written by write_turns()
+ChatTurn = namedtuple('ChatTurn', ['session_id', 'query', 'response', 'symptom_ids', 'created_at', 'is_new'])
+
+
+class SymptomDictionary:
+    # symptom_dictionary mirrored in memory, so turning names into ids (and back)
+    # costs a dict lookup; the table is only written when a new name shows up
+    def __init__(self, store):
+        self.store = store
+        self.ids = {}
+        self.names = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with self.store.connection() as conn:
+            rows = conn.execute(SELECT_SYMPTOM_DICTIONARY).fetchall()
+        self.names = {row['symptom_id']: row['name'] for row in rows}
+        self.ids = {name: symptom_id for symptom_id, name in self.names.items()}
+
+    def ensure(self, names):
+        # Ids for the given names, adding any the dictionary has not seen yet
+        names = list(names)
+        missing = [name for name in dict.fromkeys(names) if name not in self.ids]
+        if missing:
+            with self._lock:
+                with self.store.transaction() as conn:
+                    conn.executemany(INSERT_SYMPTOM_NAME, [(name,) for name in missing])
+                self.reload()
+        return [self.ids[name] for name in names]
+
+    def lookup(self, symptom_ids):
+        if any(symptom_id not in self.names for symptom_id in symptom_ids):
+            # Added by another worker process since we last read the table
+            self.reload()
+        return [self.names[symptom_id] for symptom_id in symptom_ids if symptom_id in self.names]
+
+
+class ChatStore:
+    # A bounded pool of long-lived SQLite connections instead of a connect/close
+    # per call. Each call checks one out and hands it back, so a threaded server
+    # starting a thread per request still never holds more than pool_size.
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.initialize()
+
+    def _connect(self):
+        # Autocommit mode; writes open their own transactions in transaction()
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.pool_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No chat database connection free after {POOL_TIMEOUT}s")
+
+    def _release(self, conn):
+        with self._lock:
+            if conn not in self._connections:
+                return  # Closed by close() while it was checked out
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        # A pooled connection for the block; nested use in the same thread gets
+        # the one it already holds instead of taking a second one
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            # IMMEDIATE takes the write lock up front, so concurrent writers queue on
+            # busy_timeout instead of failing when a read transaction tries to upgrade
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def initialize(self):
+        with self.connection() as conn:
+            for table, column, statements in MIGRATIONS:
+                columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+                if columns and column not in columns:
+                    with self.transaction() as tx:
+                        for statement in statements:
+                            tx.execute(statement)
+            conn.executescript(SCHEMA)
+            self.dictionary = SymptomDictionary(self)
+            self.migrate_session_data()
+
+    def migrate_session_data(self):
+        # Move comma-joined chat_session_data rows into session_symptoms, then drop it
+        with self.connection() as conn:
+            if not conn.execute(HAS_LEGACY_SESSION_DATA).fetchone():
+                return
+            rows = conn.execute(SELECT_LEGACY_SESSION_DATA).fetchall()
+        split = [(row['session_id'], [s for s in (row['symptoms'] or '').split(',') if s]) for row in rows]
+        self.dictionary.ensure(name for _, names in split for name in names)
+        with self.transaction() as conn:
+            conn.executemany(INSERT_SESSION_SYMPTOM, [
+                (session_id, self.dictionary.ids[name], 1) for session_id, names in split for name in names])
+            conn.execute('DROP TABLE chat_session_data')
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+
+    def before_fork(self):
+        # SQLite handles must never be shared across a fork; workers reconnect lazily
+        self.close()
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='get_session_symptom_ids')
+    def get_session_symptom_ids(self, session_id):
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute(SELECT_SESSION_SYMPTOMS, (session_id,))]
+
+    def get_previous_symptoms(self, session_id):
+        return self.dictionary.lookup(self.get_session_symptom_ids(session_id))
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='save_turn')
+    def save_turn(self, query, response, session_id=None, symptoms=None):
+        # User message, bot message and session symptoms land in one transaction
+        symptom_ids = self.dictionary.ensure(symptoms or [])
+        with self.transaction() as conn:
+            if not session_id:
+                created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                # The sidebar preview is stored once instead of re-read from the messages
+                session_id = conn.execute(INSERT_SESSION, (created_at, query[:30] + "...")).lastrowid
+            self._write_turn(conn, session_id, query, response, symptom_ids)
+
+        return session_id
+
+    def _write_turn(self, conn, session_id, query, response, symptom_ids):
+        conn.executemany(INSERT_MESSAGE, [(session_id, query, True), (session_id, response, False)])
+        if symptom_ids:
+            turn = conn.execute(COUNT_USER_TURNS, (session_id,)).fetchone()[0]
+            conn.executemany(INSERT_SESSION_SYMPTOM, [(session_id, symptom_id, turn) for symptom_id in symptom_ids])
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='reserve_session_ids')
+    def reserve_session_ids(self, count):
+        with self.transaction() as conn:
+            conn.execute(SEED_SESSION_SEQUENCE)
+            last = conn.execute(RESERVE_SESSION_IDS, (count,)).fetchone()[0]
+        return range(last - count + 1, last + 1)
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='write_turns')
+    def write_turns(self, turns):
+        # Group commit: any number of turns, all sessions pre-allocated, one transaction
+        with self.transaction() as conn:
+            conn.executemany(INSERT_SESSION_WITH_ID, [
+                (turn.session_id, turn.created_at, turn.query[:30] + "...") for turn in turns if turn.is_new])
+            # Turn by turn, so first_seen_turn counts the turns of the same session before it
+            for turn in turns:
+                self._write_turn(conn, turn.session_id, turn.query, turn.response, turn.symptom_ids)
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='common_symptoms')
+    def common_symptoms(self, since, limit=20):
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(SELECT_COMMON_SYMPTOMS, (since, limit))]
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='common_symptom_pairs')
+    def common_symptom_pairs(self, since, limit=20):
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(SELECT_COMMON_SYMPTOM_PAIRS, (since, limit))]
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='list_sessions')
+    def list_sessions(self, before=None, limit=DEFAULT_PAGE_SIZE):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self.connection() as conn:
+            return [dict(row) for row in conn.execute(SELECT_SESSIONS_PAGE, (before, limit))]
+
+    @METRICS.timed('icliniq_sqlite_seconds', operation='session_ids')
+    def session_ids(self, since=None):
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute(SELECT_SESSION_IDS, (since,))]
+
+    def iter_session_messages(self, session_id, after=None, limit=None):
+        # Rows come off the cursor in chunks, so a long session is never fully in memory.
+        # The connection stays checked out until the generator finishes or is closed;
+        # it bypasses the thread-local, since a generator may be resumed on another thread.
+        conn = self._checkout()
+        cursor = conn.execute(SELECT_SESSION_MESSAGES, (session_id, after, limit or -1))
+        try:
+            while True:
+                rows = cursor.fetchmany(MESSAGE_FETCH_SIZE)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+            self._release(conn)
+
+    def stream_session_messages(self, session_id, after=None, limit=MAX_PAGE_SIZE):
+        # JSON body produced piece by piece: {"session_id", "messages": [...], "next_after"}
+        yield '{"session_id": %s, "messages": [' % json.dumps(session_id)
+        last_id = None
+        count = 0
+        for message in self.iter_session_messages(session_id, after, limit):
+            yield (', ' if count else '') + json.dumps(message)
+            last_id = message['message_id']
+            count += 1
+        next_after = last_id if limit and count == limit else None
+        yield '], "next_after": %s}' % json.dumps(next_after)
@@ -0,0 +1,239 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from chat_store import ChatTurn
+
+# sync:   write in the request thread before responding (the old behaviour)
+# commit: hand the turn to the writer and wait for its group commit
+# async:  hand the turn to the writer and respond immediately
+DURABILITY_MODES = ('sync', 'commit', 'async')
+
+DEFAULT_DURABILITY = os.environ.get('ICLINIQ_CHAT_DURABILITY', 'async')
+DEFAULT_QUEUE_SIZE = int(os.environ.get('ICLINIQ_CHAT_QUEUE_SIZE', 10000))
+MAX_BATCH_SIZE = 512
+SESSION_ID_BLOCK = 64
+WRITE_RETRIES = 3
+# Longest a history read waits for the turns queued before it
+FLUSH_TIMEOUT = float(os.environ.get('ICLINIQ_CHAT_FLUSH_TIMEOUT', 2.0))
+
+_STOP = object()
+
+log = logging.getLogger(__name__)
+
+
+class ChatWriter:
+    # Write-behind persistence for chat turns. Requests enqueue a turn and return;
+    # one writer thread drains the bounded queue and commits whatever has piled up
+    # in a single transaction. A full queue blocks producers (back-pressure).
+    def __init__(self, store, durability=DEFAULT_DURABILITY, max_queue=DEFAULT_QUEUE_SIZE, max_batch=MAX_BATCH_SIZE):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability '{durability}', expected one of {DURABILITY_MODES}")
+        self.store = store
+        self.durability = durability
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        # Every queued turn gets the next sequence number; the writer publishes the
+        # highest one it has finished, so flush() can wait for a point in the queue
+        self.queued_seq = 0
+        self.committed_seq = 0
+        self._seq_lock = threading.Lock()
+        self._committed = threading.Condition()
+
+        # Symptom ids of turns still in the queue, so the next turn reads its own writes
+        self.pending_symptoms = {}
+        self._pending_lock = threading.Lock()
+
+        self._session_ids = iter(())
+        self._session_lock = threading.Lock()
+        # New sessions whose first turn could not be written: the client already has
+        # the id, so the session's next turn creates the chat_sessions row instead
+        self.lost_sessions = set()
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+        self.last_commit_seconds = 0.0
+
+        self._thread = None
+        if durability != 'sync':
+            self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def allocate_session_id(self):
+        # IDs are reserved in blocks so a new chat costs one DB round-trip per block
+        with self._session_lock:
+            session_id = next(self._session_ids, None)
+            if session_id is None:
+                self._session_ids = iter(self.store.reserve_session_ids(SESSION_ID_BLOCK))
+                session_id = next(self._session_ids)
+            return session_id
+
+    def save(self, query, response, session_id=None, symptoms=None):
+        is_new = not session_id
+        if is_new:
+            session_id = self.allocate_session_id()
+        symptom_ids = self.store.dictionary.ensure(symptoms or [])
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        if self.durability == 'sync':
+            self.store.write_turns([ChatTurn(session_id, query, response, symptom_ids, created_at, is_new)])
+            return session_id
+
+        if symptom_ids:
+            with self._pending_lock:
+                # Appends are idempotent, so the queued turn may carry everything still unflushed
+                symptom_ids = list(dict.fromkeys(self.pending_symptoms.get(session_id, []) + symptom_ids))
+                self.pending_symptoms[session_id] = symptom_ids
+        turn = ChatTurn(session_id, query, response, symptom_ids, created_at, is_new)
+
+        done = Future() if self.durability == 'commit' else None
+        self._put(turn, done)
+        if done is not None:
+            done.result()
+        return session_id
+
+    def get_previous_symptom_ids(self, session_id):
+        with self._pending_lock:
+            symptom_ids = self.pending_symptoms.get(session_id)
+        if symptom_ids is None:
+            return self.store.get_session_symptom_ids(session_id)
+        # What is already on disk, then the ids still waiting in the queue
+        return list(dict.fromkeys(self.store.get_session_symptom_ids(session_id) + symptom_ids))
+
+    def get_previous_symptoms(self, session_id):
+        return self.store.dictionary.lookup(self.get_previous_symptom_ids(session_id))
+
+    def _put(self, turn, done):
+        # Numbered and queued under one lock, so sequence order is queue order
+        with self._seq_lock:
+            self.queued_seq += 1
+            item = (self.queued_seq, turn, done)
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                start = time.perf_counter()
+                self.queue.put(item)
+                self.blocked_puts += 1
+                self.blocked_seconds += time.perf_counter() - start
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        # Wait until every turn queued before this call has been written (or dropped).
+        # Turns queued afterwards aren't waited for, so steady writes can't stall a
+        # reader; after timeout it gives up. True if everything it waited for is done.
+        if self._thread is None:
+            return True
+        target = self.queued_seq
+        with self._committed:
+            return self._committed.wait_for(lambda: self.committed_seq >= target, timeout)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            # Take whatever else is already waiting, up to max_batch
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            with self._committed:
+                self.committed_seq = batch[-1][0]
+                self._committed.notify_all()
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                self.queue.task_done()
+                return
+
+    def _write(self, turns):
+        error = None
+        for attempt in range(WRITE_RETRIES):
+            try:
+                self.store.write_turns(turns)
+                return None
+            except Exception as e:
+                error = e
+                time.sleep(0.05 * 2 ** attempt)
+        return error
+
+    def _commit(self, batch):
+        turns = [turn._replace(is_new=True) if turn.session_id in self.lost_sessions else turn
+                 for _, turn, _ in batch]
+        start = time.perf_counter()
+        error = self._write(turns)
+        self.last_commit_seconds = time.perf_counter() - start
+
+        errors = [error] * len(turns)
+        if error is not None and len(turns) > 1:
+            # One bad turn shouldn't cost the whole batch: write the turns one by one
+            log.warning("Chat writer batch of %d turns failed (%s), writing them one at a time", len(turns), error)
+            errors = [self._write([turn]) for turn in turns]
+
+        for turn, turn_error in zip(turns, errors):
+            if turn_error is None:
+                self.written += 1
+                self.lost_sessions.discard(turn.session_id)
+            else:
+                self.failed += 1
+                if turn.is_new:
+                    self.lost_sessions.add(turn.session_id)
+                log.error("Chat writer dropped a turn of session %s: %s", turn.session_id, turn_error)
+        if error is None:
+            self.batches += 1
+
+        with self._pending_lock:
+            for turn in turns:
+                # Only forget symptoms no newer queued turn has replaced
+                if self.pending_symptoms.get(turn.session_id) is turn.symptom_ids:
+                    del self.pending_symptoms[turn.session_id]
+
+        for (_, _, done), turn_error in zip(batch, errors):
+            if done is not None:
+                if turn_error is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(turn_error)
+
+    def stats(self):
+        return {
+            'durability': self.durability,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'failed': self.failed,
+            'batches': self.batches,
+            'mean_batch_size': self.written / self.batches if self.batches else 0.0,
+            'blocked_puts': self.blocked_puts,
+            'blocked_seconds': self.blocked_seconds,
+            'last_commit_seconds': self.last_commit_seconds,
+        }
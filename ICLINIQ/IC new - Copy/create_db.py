@@ -1,30 +1,7 @@
-import sqlite3
+from chat_store import ChatStore
 
-# Connect to SQLite database (or create it if it doesn't exist)
-conn = sqlite3.connect('chat_history.db')
-cursor = conn.cursor()
-
-# Create tables
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS chat_sessions (
-    session_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS chat_messages (
-    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    session_id INTEGER,
-    message_text TEXT,
-    is_user BOOLEAN,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
-)
-''')
-
-# Commit changes and close the connection
-conn.commit()
-conn.close()
+# Create the chat database (or bring an existing one up to the current schema)
+store = ChatStore()
+store.close()
 
 print("Database and tables created successfully.")
\ No newline at end of file
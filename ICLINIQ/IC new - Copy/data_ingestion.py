@@ -1,61 +1,414 @@
-import pandas as pd
-from py2neo import Graph, Node, Relationship #type: ignore
+import argparse
+import json
+import os
+import time
+from datetime import datetime
 
-def ingest_data():
-    # Load datasets
-    dataset = pd.read_csv('dataset.csv')
-    symptom_description = pd.read_csv('symptom_description.csv')
-    symptom_precaution = pd.read_csv('symptom_precaution.csv')
-    symptom_severity = pd.read_csv('symptom_severity.csv')
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(DATA_DIR, 'ingestion_manifest.json')
+BATCH_SIZE = 1000
+
+CSV_FILES = {
+    'dataset': 'dataset.csv',
+    'symptom_description': 'symptom_Description.csv',
+    'symptom_precaution': 'symptom_precaution.csv',
+    'symptom_severity': 'symptom_severity.csv',
+}
+
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT disease_name IF NOT EXISTS FOR (d:Disease) REQUIRE d.name IS UNIQUE",
+    "CREATE CONSTRAINT symptom_name IF NOT EXISTS FOR (s:Symptom) REQUIRE s.name IS UNIQUE",
+    "CREATE INDEX description_text IF NOT EXISTS FOR (d:Description) ON (d.text)",
+    "CREATE INDEX precaution_text IF NOT EXISTS FOR (p:Precaution) ON (p.text)",
+    "CREATE INDEX severity_weight IF NOT EXISTS FOR (s:Severity) ON (s.weight)",
+]
+
+MERGE_DISEASES = """
+UNWIND $rows AS row
+MERGE (:Disease {name: row.disease})
+"""
+
+MERGE_SYMPTOMS = """
+UNWIND $rows AS row
+MERGE (:Symptom {name: row.symptom})
+"""
+
+MERGE_HAS_SYMPTOM = """
+UNWIND $rows AS row
+MATCH (d:Disease {name: row.disease})
+MATCH (s:Symptom {name: row.symptom})
+MERGE (d)-[:HAS_SYMPTOM]->(s)
+"""
+
+MERGE_DESCRIPTIONS = """
+UNWIND $rows AS row
+MERGE (d:Disease {name: row.disease})
+MERGE (desc:Description {text: row.text})
+MERGE (d)-[:HAS_DESCRIPTION]->(desc)
+"""
+
+MERGE_PRECAUTIONS = """
+UNWIND $rows AS row
+MERGE (d:Disease {name: row.disease})
+MERGE (prec:Precaution {text: row.text})
+MERGE (d)-[:HAS_PRECAUTION]->(prec)
+"""
+
+MERGE_SEVERITIES = """
+UNWIND $rows AS row
+MERGE (s:Symptom {name: row.symptom})
+MERGE (sev:Severity {weight: row.weight})
+MERGE (s)-[:HAS_SEVERITY]->(sev)
+"""
+
+# Statements used by incremental ingestion to retract rows that changed or vanished
+DELETE_DISEASES = """
+UNWIND $rows AS row
+MATCH (d:Disease {name: row.disease})
+DETACH DELETE d
+"""
+
+DELETE_HAS_SYMPTOM = """
+UNWIND $rows AS row
+MATCH (:Disease {name: row.disease})-[r:HAS_SYMPTOM]->(:Symptom {name: row.symptom})
+DELETE r
+"""
+
+DELETE_DESCRIPTION_LINKS = """
+UNWIND $rows AS row
+MATCH (:Disease {name: row.disease})-[r:HAS_DESCRIPTION]->(:Description)
+DELETE r
+"""
+
+DELETE_PRECAUTION_LINKS = """
+UNWIND $rows AS row
+MATCH (:Disease {name: row.disease})-[r:HAS_PRECAUTION]->(:Precaution {text: row.text})
+DELETE r
+"""
+
+DELETE_SEVERITY_LINKS = """
+UNWIND $rows AS row
+MATCH (:Symptom {name: row.symptom})-[r:HAS_SEVERITY]->(:Severity)
+DELETE r
+"""
+
+PRUNE_ORPHANS = [
+    "MATCH (n:Description) WHERE NOT (n)<--() DELETE n",
+    "MATCH (n:Precaution) WHERE NOT (n)<--() DELETE n",
+    "MATCH (n:Severity) WHERE NOT (n)<--() DELETE n",
+    "MATCH (n:Symptom) WHERE NOT (n)--() DELETE n",
+]
+
+
+class CypherRecorder:
+    # Dry-run stand-in for py2neo.Graph: records every statement and its
+    # parameters instead of sending them, so ingestion can run without Neo4j
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    def run(self, query, parameters=None, **kwparameters):
+        self.statements.append((query.strip(), dict(parameters or {}, **kwparameters)))
+        return RecordedResult()
+
+    def begin(self):
+        return self
+
+    def commit(self, tx=None):
+        self.commits += 1
+
+    def rollback(self, tx=None):
+        pass
+
+
+class RecordedResult:
+    def data(self):
+        return []
+
+
+def read_csvs(data_dir=DATA_DIR):
+    # pandas is imported where it is used, so importing this module for its
+    # constants (as the app does) stays cheap
+    import pandas as pd
+
+    return {name: pd.read_csv(os.path.join(data_dir, filename)) for name, filename in CSV_FILES.items()}
+
+
+def load_frames(data_dir=DATA_DIR, raw=None):
+    # Read the CSVs and reduce them to de-duplicated rows, one per graph edge
+    raw = raw if raw is not None else read_csvs(data_dir)
+    dataset = raw['dataset']
+    symptom_description = raw['symptom_description']
+    symptom_precaution = raw['symptom_precaution']
+    symptom_severity = raw['symptom_severity']
+
+    # 4,920 rows collapse to a few hundred distinct disease-symptom pairs
+    disease_symptoms = dataset.melt(id_vars='Disease', value_name='symptom').dropna(subset=['symptom'])
+    disease_symptoms['symptom'] = disease_symptoms['symptom'].str.strip()
+    disease_symptoms = (disease_symptoms[disease_symptoms['symptom'] != '']
+                        .rename(columns={'Disease': 'disease'})[['disease', 'symptom']]
+                        .drop_duplicates())
+
+    descriptions = (symptom_description.rename(columns={'Disease': 'disease', 'Description': 'text'})
+                    .dropna(subset=['text'])
+                    .drop_duplicates())
+
+    precautions = symptom_precaution.melt(id_vars='Disease', value_name='text').dropna(subset=['text'])
+    precautions['text'] = precautions['text'].str.strip()
+    precautions = (precautions[precautions['text'] != '']
+                   .rename(columns={'Disease': 'disease'})[['disease', 'text']]
+                   .drop_duplicates())
+
+    severities = (symptom_severity.rename(columns={'Symptom': 'symptom'})
+                  .dropna(subset=['weight'])
+                  .drop_duplicates(subset=['symptom']))
+    severities['weight'] = severities['weight'].astype(int)
+
+    return {
+        'disease_symptoms': disease_symptoms,
+        'descriptions': descriptions,
+        'precautions': precautions,
+        'severities': severities[['symptom', 'weight']]
+    }
+
+
+def records(frame):
+    return frame.to_dict('records')
+
+
+def run_batched(graph, query, rows, batch_size=BATCH_SIZE):
+    # One UNWIND statement per batch, each batch in its own transaction
+    for start in range(0, len(rows), batch_size):
+        tx = graph.begin()
+        try:
+            tx.run(query, rows=rows[start:start + batch_size])
+        except Exception:
+            graph.rollback(tx)
+            raise
+        graph.commit(tx)
+
+
+def create_schema(graph):
+    for statement in SCHEMA_STATEMENTS:
+        graph.run(statement)
+
+
+def write_frames(graph, frames, batch_size=BATCH_SIZE, timings=None):
+    timings = timings if timings is not None else {}
+    pairs = frames['disease_symptoms']
+    phases = [
+        ('diseases', MERGE_DISEASES, pairs[['disease']].drop_duplicates()),
+        ('symptoms', MERGE_SYMPTOMS, pairs[['symptom']].drop_duplicates()),
+        ('has_symptom', MERGE_HAS_SYMPTOM, pairs),
+        ('descriptions', MERGE_DESCRIPTIONS, frames['descriptions']),
+        ('precautions', MERGE_PRECAUTIONS, frames['precautions']),
+        ('severities', MERGE_SEVERITIES, frames['severities']),
+    ]
+    for name, query, frame in phases:
+        start = time.perf_counter()
+        run_batched(graph, query, records(frame), batch_size)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def row_hashes(raw):
+    import pandas as pd
+
+    # One 64-bit content hash per CSV row, so a refresh can tell exactly which rows moved
+    return {name: sorted(format(h, '016x') for h in pd.util.hash_pandas_object(frame, index=False))
+            for name, frame in raw.items()}
+
+
+def frame_state(frames):
+    # What the graph should contain, keyed by entity so two loads can be diffed
+    return {
+        'disease_symptoms': {disease: sorted(group['symptom'])
+                             for disease, group in frames['disease_symptoms'].groupby('disease', sort=False)},
+        'descriptions': {row.disease: row.text
+                         for row in frames['descriptions'].drop_duplicates(subset=['disease']).itertuples(index=False)},
+        'precautions': {disease: sorted(group['text'])
+                        for disease, group in frames['precautions'].groupby('disease', sort=False)},
+        'severities': {row.symptom: int(row.weight) for row in frames['severities'].itertuples(index=False)},
+    }
+
+
+def diff_pairs(old, new, key_name, value_name):
+    added, removed = [], []
+    for key in set(old) | set(new):
+        old_values, new_values = set(old.get(key, [])), set(new.get(key, []))
+        added.extend({key_name: key, value_name: value} for value in sorted(new_values - old_values))
+        removed.extend({key_name: key, value_name: value} for value in sorted(old_values - new_values))
+    return added, removed
+
+
+def plan_changes(old_state, new_state):
+    def diseases(state):
+        return set(state['disease_symptoms']) | set(state['descriptions']) | set(state['precautions'])
+
+    removed_diseases = diseases(old_state) - diseases(new_state)
+    symptoms_added, symptoms_removed = diff_pairs(old_state['disease_symptoms'], new_state['disease_symptoms'], 'disease', 'symptom')
+    precautions_added, precautions_removed = diff_pairs(old_state['precautions'], new_state['precautions'], 'disease', 'text')
+
+    return {
+        'removed_diseases': [{'disease': disease} for disease in sorted(removed_diseases)],
+        'symptoms_added': symptoms_added,
+        # Relationships of removed diseases go with DETACH DELETE
+        'symptoms_removed': [row for row in symptoms_removed if row['disease'] not in removed_diseases],
+        'descriptions': [{'disease': disease, 'text': text} for disease, text in new_state['descriptions'].items()
+                         if old_state['descriptions'].get(disease) != text],
+        'descriptions_removed': [{'disease': disease} for disease in old_state['descriptions']
+                                 if disease not in new_state['descriptions'] and disease not in removed_diseases],
+        'precautions_added': precautions_added,
+        'precautions_removed': [row for row in precautions_removed if row['disease'] not in removed_diseases],
+        'severities': [{'symptom': symptom, 'weight': weight} for symptom, weight in new_state['severities'].items()
+                       if old_state['severities'].get(symptom) != weight],
+        'severities_removed': [{'symptom': symptom} for symptom in old_state['severities']
+                               if symptom not in new_state['severities']],
+    }
+
+
+def apply_changes(graph, plan, batch_size=BATCH_SIZE, timings=None):
+    import pandas as pd
+
+    timings = timings if timings is not None else {}
+    added_pairs = pd.DataFrame(plan['symptoms_added'], columns=['disease', 'symptom'])
+    phases = [
+        ('delete_diseases', [(DELETE_DISEASES, plan['removed_diseases'])]),
+        ('symptoms', [(DELETE_HAS_SYMPTOM, plan['symptoms_removed']),
+                      (MERGE_DISEASES, records(added_pairs[['disease']].drop_duplicates())),
+                      (MERGE_SYMPTOMS, records(added_pairs[['symptom']].drop_duplicates())),
+                      (MERGE_HAS_SYMPTOM, plan['symptoms_added'])]),
+        ('descriptions', [(DELETE_DESCRIPTION_LINKS, plan['descriptions'] + plan['descriptions_removed']),
+                          (MERGE_DESCRIPTIONS, plan['descriptions'])]),
+        ('precautions', [(DELETE_PRECAUTION_LINKS, plan['precautions_removed']),
+                         (MERGE_PRECAUTIONS, plan['precautions_added'])]),
+        ('severities', [(DELETE_SEVERITY_LINKS, plan['severities'] + plan['severities_removed']),
+                        (MERGE_SEVERITIES, plan['severities'])]),
+    ]
+    for name, statements in phases:
+        start = time.perf_counter()
+        for query, rows in statements:
+            run_batched(graph, query, rows, batch_size)
+        timings[name] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for statement in PRUNE_ORPHANS:
+        graph.run(statement)
+    timings['prune_orphans'] = time.perf_counter() - start
+    return timings
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(raw, state, path=MANIFEST_PATH):
+    if not path:
+        return
+    manifest = {
+        'loaded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': row_hashes(raw),
+        'state': state,
+    }
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def connect():
+    # Writes need the raw py2neo Graph (explicit transactions), not the read-side GraphClient
+    from py2neo import Graph  # type: ignore
+    from graph_access import NEO4J_URI, NEO4J_AUTH
+    return Graph(NEO4J_URI, auth=NEO4J_AUTH)
+
+
+def report(timings):
+    print("Ingestion timing:")
+    for phase, seconds in timings.items():
+        print(f"  {phase:<14} {seconds * 1000:9.1f} ms")
+    print(f"  {'total':<14} {sum(timings.values()) * 1000:9.1f} ms")
+
+
+def ingest_data(graph=None, data_dir=DATA_DIR, batch_size=BATCH_SIZE, mode='full', manifest_path=MANIFEST_PATH):
+    # full:        wipe the graph and reload everything
+    # incremental: diff against the manifest of the previous load and only write
+    #              what changed, so the app can keep serving during a refresh
+    if mode not in ('full', 'incremental'):
+        raise ValueError(f"Unknown ingestion mode '{mode}'")
+    timings = {}
+
+    start = time.perf_counter()
+    raw = read_csvs(data_dir)
+    frames = load_frames(data_dir, raw)
+    state = frame_state(frames)
+    timings['load_csv'] = time.perf_counter() - start
+
+    manifest = load_manifest(manifest_path) if mode == 'incremental' else None
+    if manifest is not None:
+        old_rows = manifest['rows']
+        new_rows = row_hashes(raw)
+        changed = {name: len(set(new_rows[name]) ^ set(old_rows.get(name, []))) for name in new_rows}
+        if not any(changed.values()):
+            print(f"No CSV rows changed since {manifest['loaded_at']}; nothing to ingest.")
+            return timings
+        print("Changed CSV rows: " + ", ".join(f"{name}={count}" for name, count in changed.items()))
 
     # Connect to Neo4j
-    graph = Graph("bolt://localhost:7687", auth=("neo4j", "12345678"))
-
-    # Clear existing data
-    graph.run("MATCH (n) DETACH DELETE n")
-
-    # Ingest diseases and symptoms
-    for _, row in dataset.iterrows():
-        disease = Node("Disease", name=row['Disease'])  # Create Disease node
-        graph.merge(disease, "Disease", "name")
-
-        for symptom in row[1:]:
-            if pd.notna(symptom) and symptom.strip():  # Skip NaN and empty strings
-                symptom_node = Node("Symptom", name=symptom.strip())  # Create Symptom node
-                graph.merge(symptom_node, "Symptom", "name")
-                rel = Relationship(disease, "HAS_SYMPTOM", symptom_node)  # Create relationship
-                graph.create(rel)
-
-    # Ingest symptom descriptions
-    for _, row in symptom_description.iterrows():
-        disease = Node("Disease", name=row['Disease'])
-        description = Node("Description", text=row['Description'])
-        graph.merge(disease, "Disease", "name")
-        graph.merge(description, "Description", "text")
-        rel = Relationship(disease, "HAS_DESCRIPTION", description)
-        graph.create(rel)
-
-    # Ingest symptom precautions
-    for _, row in symptom_precaution.iterrows():
-        disease = Node("Disease", name=row['Disease'])
-        for i in range(1, 5):
-            precaution = row[f'Precaution_{i}']
-            if pd.notna(precaution) and precaution.strip():  # Skip NaN and empty strings
-                precaution_node = Node("Precaution", text=precaution.strip())
-                graph.merge(precaution_node, "Precaution", "text")
-                rel = Relationship(disease, "HAS_PRECAUTION", precaution_node)
-                graph.create(rel)
-
-    # Ingest symptom severity
-    for _, row in symptom_severity.iterrows():
-        symptom = Node("Symptom", name=row['Symptom'])
-        severity = Node("Severity", weight=row['weight'])
-        graph.merge(symptom, "Symptom", "name")
-        graph.merge(severity, "Severity", "weight")
-        rel = Relationship(symptom, "HAS_SEVERITY", severity)
-        graph.create(rel)
+    graph = graph if graph is not None else connect()
+
+    start = time.perf_counter()
+    create_schema(graph)
+    timings['schema'] = time.perf_counter() - start
 
+    if manifest is not None:
+        plan = plan_changes(manifest['state'], state)
+        apply_changes(graph, plan, batch_size, timings)
+    elif mode == 'incremental':
+        # No manifest yet: upsert everything but leave existing data in place
+        write_frames(graph, frames, batch_size, timings)
+    else:
+        # Clear existing data
+        start = time.perf_counter()
+        graph.run("MATCH (n) DETACH DELETE n")
+        timings['clear'] = time.perf_counter() - start
+        write_frames(graph, frames, batch_size, timings)
+
+    save_manifest(raw, state, manifest_path)
+
+    report(timings)
     print("Data ingested into Neo4j.")
+    return timings
+
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the symptom CSVs into Neo4j.")
+    parser.add_argument('--dry-run', action='store_true', help="Record the Cypher statements instead of running them")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--incremental', action='store_true', help="Only write rows that changed since the last load")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help="Where the record of the last load is kept")
+    args = parser.parse_args()
+    mode = 'incremental' if args.incremental else 'full'
+
+    if args.dry_run:
+        # A dry run must not move the manifest forward, so only read it
+        manifest_path = args.manifest
+        if os.path.exists(manifest_path):
+            dry_manifest = manifest_path + '.dry-run'
+            with open(manifest_path) as src, open(dry_manifest, 'w') as dst:
+                dst.write(src.read())
+            manifest_path = dry_manifest
+        else:
+            manifest_path = None
+        recorder = CypherRecorder()
+        try:
+            ingest_data(recorder, batch_size=args.batch_size, mode=mode, manifest_path=manifest_path)
+        finally:
+            if manifest_path and os.path.exists(manifest_path):
+                os.remove(manifest_path)
+        rows = sum(len(params.get('rows', [])) for _, params in recorder.statements)
+        print(f"Dry run: {len(recorder.statements)} statements, {rows} rows, {recorder.commits} transactions")
+    else:
+        ingest_data(batch_size=args.batch_size, mode=mode, manifest_path=args.manifest)
\ No newline at end of file
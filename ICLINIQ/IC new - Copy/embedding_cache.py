@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_CAPACITY = int(os.environ.get('ICLINIQ_EMBED_CACHE_SIZE', 4096))
+DEFAULT_DISK_CAPACITY = int(os.environ.get('ICLINIQ_EMBED_DISK_CACHE_SIZE', 65536))
+INDEX_FLUSH_EVERY = 64
+
+
+def key_tag(key):
+    # Stable across processes (unlike hash()); 0 marks a row that holds no key
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+
+def normalize_query(query):
+    # "I have Fever, and headache!" -> "i have fever and headache"
+    return ' '.join(re.findall(r'[a-z0-9]+', query.lower()))
+
+
+class EmbeddingCache:
+    # Bounded LRU of normalized query -> float32 embedding, with an optional disk
+    # tier: a memory-mapped (rows x dim) float32 array plus a JSON key -> row index.
+    # The disk tier is a ring, so once full the oldest rows are overwritten.
+    # The index is only saved now and then, so each row also carries a tag of the
+    # key it holds; after a crash, index entries whose row was reused are dropped.
+    def __init__(self, dim, capacity=DEFAULT_CAPACITY, path=None, disk_capacity=DEFAULT_DISK_CAPACITY):
+        self.dim = dim
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path = path
+        self.vectors = None
+        if path:
+            self._open_disk(disk_capacity)
+
+    def _open_disk(self, disk_capacity):
+        data_path = self.path + '.f32'
+        tags_path = self.path + '.tags'
+        index_path = self.path + '.keys.json'
+        self.rows = {}
+        self.row_keys = [None] * disk_capacity
+        self.next_row = 0
+        self.pending_writes = 0
+
+        if all(os.path.exists(path) for path in (data_path, tags_path, index_path)):
+            with open(index_path) as f:
+                saved = json.load(f)
+            if saved.get('dim') == self.dim and saved.get('capacity') == disk_capacity:
+                self.tags = np.memmap(tags_path, dtype=np.uint64, mode='r+', shape=(disk_capacity,))
+                self.next_row = saved['next_row']
+                for key, row in saved['rows'].items():
+                    # Rows overwritten after the index was last saved belong to another key now
+                    if self.tags[row] == key_tag(key):
+                        self.rows[key] = row
+                        self.row_keys[row] = key
+                self.vectors = np.memmap(data_path, dtype=np.float32, mode='r+', shape=(disk_capacity, self.dim))
+                return
+
+        # Missing or incompatible files: start a fresh tier
+        self.tags = np.memmap(tags_path, dtype=np.uint64, mode='w+', shape=(disk_capacity,))
+        self.vectors = np.memmap(data_path, dtype=np.float32, mode='w+', shape=(disk_capacity, self.dim))
+        self.flush()
+
+    def get(self, key):
+        with self._lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self.vectors is not None and key in self.rows:
+                vector = np.array(self.vectors[self.rows[key]])
+                vector.setflags(write=False)
+                self._remember(key, vector)
+                self.hits += 1
+                self.disk_hits += 1
+                return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key, vector):
+        vector = np.array(vector, dtype=np.float32).reshape(self.dim)
+        vector.setflags(write=False)  # Shared between callers, so keep it immutable
+        with self._lock:
+            self._remember(key, vector)
+            if self.vectors is not None and key not in self.rows:
+                self._write_disk(key, vector)
+
+    def _remember(self, key, vector):
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def _write_disk(self, key, vector):
+        row = self.next_row
+        evicted = self.row_keys[row]
+        if evicted is not None:
+            del self.rows[evicted]
+        # Untagged while the vector is replaced, so the row never matches a key it doesn't hold
+        self.tags[row] = 0
+        self.vectors[row] = vector
+        self.tags[row] = key_tag(key)
+        self.rows[key] = row
+        self.row_keys[row] = key
+        self.next_row = (row + 1) % len(self.row_keys)
+
+        self.pending_writes += 1
+        if self.pending_writes >= INDEX_FLUSH_EVERY:
+            self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self.vectors is None:
+            return
+        self.vectors.flush()
+        self.tags.flush()
+        # Write the index atomically so a crash never leaves a half-written file
+        index_path = self.path + '.keys.json'
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'dim': self.dim, 'capacity': len(self.row_keys), 'next_row': self.next_row, 'rows': self.rows}, f)
+        os.replace(index_path + '.tmp', index_path)
+        self.pending_writes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'disk_entries': len(self.rows) if self.vectors is not None else 0
+        }
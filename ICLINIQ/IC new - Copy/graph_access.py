@@ -0,0 +1,229 @@
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as QueryTimeout
+from metrics import METRICS
+
+NEO4J_URI = os.environ.get('ICLINIQ_NEO4J_URI', 'bolt://localhost:7687')
+NEO4J_AUTH = (os.environ.get('ICLINIQ_NEO4J_USER', 'neo4j'), os.environ.get('ICLINIQ_NEO4J_PASSWORD', '12345678'))
+POOL_SIZE = int(os.environ.get('ICLINIQ_NEO4J_POOL_SIZE', 16))
+QUERY_TIMEOUT = float(os.environ.get('ICLINIQ_NEO4J_TIMEOUT', 5.0))
+RETRIES = 3
+BACKOFF_BASE = 0.1
+BACKOFF_MAX = 2.0
+BREAKER_THRESHOLD = 5      # Consecutive failures before the breaker opens
+BREAKER_RESET_SECONDS = 30  # How long it stays open before one trial query
+
+
+class GraphUnavailable(RuntimeError):
+    # Neo4j can't answer right now (breaker open, retries exhausted); callers
+    # fall back to the in-memory / CSV-backed knowledge data
+    pass
+
+
+def transient_errors():
+    from py2neo.errors import ConnectionBroken, ConnectionUnavailable, ServiceUnavailable, TransientError  # type: ignore
+    return (OSError, QueryTimeout, ConnectionBroken, ConnectionUnavailable, ServiceUnavailable, TransientError)
+
+
+def return_columns(query):
+    # Aliases of the final RETURN clause: "RETURN d.name AS disease" -> ['disease'].
+    # Batched queries must alias every column they return.
+    clause = re.split(r'\bRETURN\b', query, flags=re.IGNORECASE)[-1]
+    return re.findall(r'\bAS\s+(\w+)', clause, flags=re.IGNORECASE)
+
+
+def batch_query(queries):
+    # {name: read query} -> one statement returning one row with one list column
+    # per query. Each query is aggregated inside its own subquery, so one that
+    # matches nothing yields [] instead of wiping out the whole row.
+    parts = []
+    for name, query in queries.items():
+        fields = ', '.join(f'{column}: {column}' for column in return_columns(query))
+        parts.append(f"CALL {{ CALL {{ {query.strip()} }} RETURN collect({{{fields}}}) AS {name} }}")
+    return '\n'.join(parts) + '\nRETURN ' + ', '.join(queries)
+
+
+class CircuitBreaker:
+    # closed: queries flow. open: fail fast for reset_seconds. half_open: let one
+    # trial query through; success closes the breaker, failure re-opens it.
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                return True
+            return self.state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def release(self):
+        # A half-open trial that failed for a reason other than an outage (e.g. a
+        # Cypher error) proves nothing either way; the next call gets to try instead
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+
+    def trip(self):
+        # Open immediately, e.g. when Neo4j is unreachable at startup
+        with self._lock:
+            if self.state != 'open':
+                self.trips += 1
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class GraphClient:
+    # The one way the app reads from Neo4j: a bounded py2neo connection pool,
+    # per-query timeouts, retries with exponential backoff and jitter, and a
+    # circuit breaker so an outage costs one fast GraphUnavailable per call
+    # instead of a hung request. Connects lazily and reconnects after errors.
+    def __init__(self, uri=NEO4J_URI, auth=NEO4J_AUTH, pool_size=POOL_SIZE, timeout=QUERY_TIMEOUT,
+                 retries=RETRIES, breaker=None):
+        self.uri = uri
+        self.auth = auth
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self.histograms = {}
+        self.queries = 0
+        self.retried = 0
+        self.failed = 0
+        self._graph = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self._graph is not None and self.breaker.state == 'closed'
+
+    def connect(self):
+        return self._connection()[0]
+
+    def _open_graph(self):
+        from py2neo import Graph  # type: ignore
+        # max_size bounds the Bolt pool; queries beyond it wait for a connection
+        return Graph(self.uri, auth=self.auth, max_size=self.pool_size)
+
+    def _connection(self):
+        with self._lock:
+            if self._graph is None:
+                self._graph = self._open_graph()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='neo4j')
+            return self._graph, self._executor
+
+    def _reset_graph(self, graph):
+        # After a transient error: drop that Bolt pool so the next attempt reconnects.
+        # The executor stays, since other threads' queries are still running on it,
+        # and a pool another thread already replaced is left alone.
+        with self._lock:
+            if self._graph is not graph:
+                return
+            self._graph = None
+        self._close_graph(graph)
+
+    def _close_graph(self, graph):
+        try:
+            graph.service.connector.close()
+        except Exception:
+            pass
+
+    def close(self):
+        # Drops the pool and the executor; the next query reconnects. Also used before forking.
+        with self._lock:
+            graph, self._graph = self._graph, None
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if graph is not None:
+            self._close_graph(graph)
+
+    def query(self, query, name=None, **parameters):
+        # Rows as dicts, like graph.run(query, **parameters).data()
+        return self._call(name or 'query', lambda graph: graph.run(query, **parameters).data())
+
+    def query_batch(self, queries, name='batch'):
+        # Several independent read queries in a single round-trip; {name: rows}
+        statement = batch_query(queries)
+        rows = self._call(name, lambda graph: graph.run(statement).data())
+        return {key: rows[0][key] if rows else [] for key in queries}
+
+    def _call(self, name, fn):
+        try:
+            transient = transient_errors()
+        except ImportError as e:
+            raise GraphUnavailable(f"py2neo is not installed: {e}")
+        if not self.breaker.allow():
+            raise GraphUnavailable(f"Neo4j circuit breaker is open ({self.uri})")
+
+        self.queries += 1
+        error = None
+        for attempt in range(self.retries):
+            if attempt:
+                self.retried += 1
+                time.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+            start = time.perf_counter()
+            graph = None
+            try:
+                graph, executor = self._connection()
+                # The worker thread may outlive a timeout; the caller does not wait for it
+                result = executor.submit(fn, graph).result(timeout=self.timeout)
+            except transient as e:
+                error = e
+                if graph is not None:
+                    self._reset_graph(graph)
+                continue
+            except Exception:
+                # Not an outage (a bad query, say): no retry, and a trial query hands its turn back
+                self.breaker.release()
+                raise
+            self._observe(name, time.perf_counter() - start)
+            self.breaker.record_success()
+            return result
+
+        self.failed += 1
+        self.breaker.record_failure()
+        raise GraphUnavailable(f"Neo4j query '{name}' failed after {self.retries} attempts: {error!r}")
+
+    def _observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            # The same histogram /metrics exports
+            histogram = self.histograms.setdefault(name, METRICS.histogram('icliniq_neo4j_seconds', query=name))
+        histogram.observe(seconds)
+
+    def stats(self):
+        return {
+            'uri': self.uri,
+            'connected': self._graph is not None,
+            'breaker': self.breaker.state,
+            'breaker_trips': self.breaker.trips,
+            'queries': self.queries,
+            'retried': self.retried,
+            'failed': self.failed,
+            'latency': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
@@ -2,37 +2,136 @@ import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Disable oneDNN logs
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # Suppress TensorFlow logs (0 = all logs, 3 = no logs)
 
+import argparse
+import time
 import torch
-from torch_geometric.data import Data #type: ignore
 from torch_geometric.nn import Node2Vec #type: ignore
+from data_ingestion import DATA_DIR, load_frames
 
-def generate_graph_embeddings():
-    # Example: Load graph data (replace with actual Neo4j data)
-    edge_index = torch.tensor([[0, 1, 1, 2], [1, 0, 2, 1]], dtype=torch.long)
-    x = torch.tensor([[1], [2], [3]], dtype=torch.float)
-    data = Data(x=x, edge_index=edge_index)
-    
-    # Train Node2Vec embeddings
-    model = Node2Vec(data.edge_index, embedding_dim=768, walk_length=20, context_size=10, walks_per_node=10)
-    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
-    loader = model.loader(batch_size=128, shuffle=True)
-    
-    for epoch in range(10):
+EMBEDDINGS_PATH = os.path.join(DATA_DIR, 'graph_embeddings.pt')
+
+
+def node_key(node_type, name):
+    return f"{node_type}:{name}"
+
+
+def load_edges(graph=None, data_dir=DATA_DIR):
+    # (source_type, source, target_type, target) for every disease-symptom and
+    # disease-precaution edge, from Neo4j when given a graph, else from the CSVs
+    if graph is not None:
+        query = """
+        MATCH (d:Disease)-[:HAS_SYMPTOM|HAS_PRECAUTION]->(n)
+        RETURN d.name AS source, labels(n)[0] AS target_type, COALESCE(n.name, n.text) AS target
+        """
+        return [('Disease', row['source'], row['target_type'], row['target']) for row in graph.run(query).data()]
+
+    frames = load_frames(data_dir)
+    edges = [('Disease', row.disease, 'Symptom', row.symptom)
+             for row in frames['disease_symptoms'].itertuples(index=False)]
+    edges += [('Disease', row.disease, 'Precaution', row.text)
+              for row in frames['precautions'].itertuples(index=False)]
+    return edges
+
+
+def build_graph(graph=None, data_dir=DATA_DIR):
+    node_ids = {}
+    node_names = []
+    node_types = []
+
+    def node_id(node_type, name):
+        key = node_key(node_type, name)
+        if key not in node_ids:
+            node_ids[key] = len(node_names)
+            node_names.append(name)
+            node_types.append(node_type)
+        return node_ids[key]
+
+    sources, targets = [], []
+    for source_type, source, target_type, target in load_edges(graph, data_dir):
+        source_id, target_id = node_id(source_type, source), node_id(target_type, target)
+        # Random walks need to move both ways along every edge
+        sources += [source_id, target_id]
+        targets += [target_id, source_id]
+
+    edge_index = torch.tensor([sources, targets], dtype=torch.long)
+    return edge_index, node_names, node_types, node_ids
+
+
+def generate_graph_embeddings(graph=None, data_dir=DATA_DIR, output=EMBEDDINGS_PATH, embedding_dim=128,
+                              walk_length=20, context_size=10, walks_per_node=10, num_negative_samples=1,
+                              epochs=100, batch_size=128, lr=0.01, num_workers=None, patience=5, min_delta=1e-3):
+    edge_index, node_names, node_types, node_ids = build_graph(graph, data_dir)
+    num_nodes = len(node_names)
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    print(f"Graph: {num_nodes} nodes, {edge_index.size(1) // 2} edges, {num_workers} walk workers")
+
+    # Sparse embedding gradients + SparseAdam only touch the rows in each batch
+    model = Node2Vec(edge_index, embedding_dim=embedding_dim, walk_length=walk_length, context_size=context_size,
+                     walks_per_node=walks_per_node, num_negative_samples=num_negative_samples,
+                     num_nodes=num_nodes, sparse=True)
+    optimizer = torch.optim.SparseAdam(list(model.parameters()), lr=lr)
+    # Random walks are sampled inside the DataLoader workers, in parallel with training
+    loader = model.loader(batch_size=batch_size, shuffle=True, num_workers=num_workers,
+                          persistent_workers=num_workers > 0)
+
+    best_loss = float('inf')
+    best_embeddings = model.embedding.weight.detach().clone()
+    stale_epochs = 0
+    for epoch in range(epochs):
+        start = time.perf_counter()
         model.train()
+        total_loss = 0.0
         for pos_rw, neg_rw in loader:
             optimizer.zero_grad()
             loss = model.loss(pos_rw, neg_rw)
             loss.backward()
             optimizer.step()
-        print(f"Epoch {epoch + 1}, Loss: {loss.item()}")
-    
-    # Create the 'recommendation' directory if it doesn't exist
-    os.makedirs('recommendation', exist_ok=True)
-    
-    # Save embeddings
-    embeddings = model.embedding.weight.data
-    torch.save(embeddings, 'graph_embeddings.pt')
-    print("Graph embeddings saved.")
+            total_loss += loss.item()
+        elapsed = time.perf_counter() - start
+        epoch_loss = total_loss / len(loader)
+        walks_per_sec = num_nodes * walks_per_node / elapsed
+        print(f"Epoch {epoch + 1}, Loss: {epoch_loss:.4f}, {elapsed:.2f}s, {walks_per_sec:,.0f} walks/sec")
+
+        if epoch_loss < best_loss - min_delta:
+            best_loss = epoch_loss
+            best_embeddings = model.embedding.weight.detach().clone()
+            stale_epochs = 0
+        else:
+            stale_epochs += 1
+            if stale_epochs >= patience:
+                print(f"Early stopping: no improvement in {patience} epochs")
+                break
+
+    # Save embeddings with the node-id -> name mapping needed to use them
+    torch.save({
+        'embeddings': best_embeddings,
+        'node_names': node_names,
+        'node_types': node_types,
+        'node_ids': node_ids,
+        'loss': best_loss,
+        'config': {
+            'embedding_dim': embedding_dim,
+            'walk_length': walk_length,
+            'context_size': context_size,
+            'walks_per_node': walks_per_node,
+        },
+    }, output)
+    print(f"Graph embeddings saved to {output}.")
+    return best_embeddings, node_names
+
 
 if __name__ == "__main__":
-    generate_graph_embeddings()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train Node2Vec embeddings on the disease graph.")
+    parser.add_argument('--neo4j', action='store_true', help="Read the graph from Neo4j instead of the CSVs")
+    parser.add_argument('--output', default=EMBEDDINGS_PATH)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--num-workers', type=int, default=None)
+    args = parser.parse_args()
+
+    graph = None
+    if args.neo4j:
+        from data_ingestion import connect
+        graph = connect()
+    generate_graph_embeddings(graph, output=args.output, embedding_dim=args.dim, epochs=args.epochs,
+                              num_workers=args.num_workers)
\ No newline at end of file
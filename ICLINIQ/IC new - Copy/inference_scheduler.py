@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get('ICLINIQ_MAX_BATCH_SIZE', 8))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get('ICLINIQ_MAX_WAIT_MS', 2))
+
+_STOP = object()
+
+
+def configure_torch_threads(num_threads=None, interop_threads=None):
+    # One intra-op pool sized to the box (or ICLINIQ_TORCH_THREADS); batching
+    # already gives us request-level parallelism, so extra threads only contend
+    import torch
+
+    num_threads = num_threads or int(os.environ.get('ICLINIQ_TORCH_THREADS', 0)) or os.cpu_count() or 1
+    torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op work has started
+            pass
+    return num_threads
+
+
+class BatchScheduler:
+    # Collects concurrent single-item requests into one batch_fn call. A batch is
+    # dispatched once it reaches max_batch_size or the oldest request has waited
+    # max_wait_ms. batch_fn takes a list of items and returns one result per item.
+    def __init__(self, batch_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, name='inference'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.start()
+        self.requests.put((item, future))
+        return future
+
+    def run(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.requests.put(_STOP)
+            self._thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'queued': self.requests.qsize()
+        }
+
+    def _run(self):
+        while True:
+            first = self.requests.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stop = True
+                    break
+                batch.append(request)
+
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,207 @@
+import asyncio
+import numpy as np
+from data_ingestion import DATA_DIR, load_frames
+from scoring_engine import ScoringEngine
+from question_planner import QuestionPlanner
+
+# Everything the index needs from Neo4j, as independent read queries
+GRAPH_QUERIES = {
+    'diseases': "MATCH (d:Disease) RETURN d.name AS disease",
+    'disease_symptoms': """
+        MATCH (d:Disease)-[:HAS_SYMPTOM]->(s:Symptom)
+        RETURN d.name AS disease, COLLECT(DISTINCT s.name) AS symptoms
+    """,
+    'symptoms': "MATCH (s:Symptom) RETURN s.name AS symptom",
+    'descriptions': """
+        MATCH (d:Disease)-[:HAS_DESCRIPTION]->(desc:Description)
+        RETURN d.name AS disease, desc.text AS description
+    """,
+    'precautions': """
+        MATCH (d:Disease)-[:HAS_PRECAUTION]->(prec:Precaution)
+        RETURN d.name AS disease, COLLECT(DISTINCT prec.text) AS precautions
+    """,
+    'severities': """
+        MATCH (s:Symptom)-[:HAS_SEVERITY]->(sev:Severity)
+        RETURN s.name AS symptom, sev.weight AS weight
+    """,
+}
+
+NO_DETAILS = [{'description': 'No description available.', 'precautions': ['No precautions found.']}]
+
+
+class KnowledgeIndex:
+    # In-memory snapshot of the knowledge graph. Every disease keeps its symptoms
+    # as a bitset (a Python int with one bit per symptom id) for set lookups, and
+    # scoring runs on the NumPy incidence matrix in scoring_engine.py.
+    def __init__(self, disease_symptoms, symptoms=None, descriptions=None, precautions=None, severities=None, source='memory', scorer='count'):
+        self.source = source
+        self.diseases = list(disease_symptoms)
+        self.disease_ids = {name: i for i, name in enumerate(self.diseases)}
+
+        self.symptoms = []
+        self.symptom_ids = {}
+        for name in list(symptoms or []) + [s for syms in disease_symptoms.values() for s in syms]:
+            if name not in self.symptom_ids:
+                self.symptom_ids[name] = len(self.symptoms)
+                self.symptoms.append(name)
+
+        self.disease_bits = []
+        for name in self.diseases:
+            bits = 0
+            for symptom in disease_symptoms[name]:
+                bits |= 1 << self.symptom_ids[symptom]
+            self.disease_bits.append(bits)
+
+        self.descriptions = dict(descriptions or {})
+        self.precautions = {name: list(texts) for name, texts in (precautions or {}).items()}
+        self.severities = dict(severities or {})
+
+        self.scoring = ScoringEngine(self, scorer)
+        self.questions = QuestionPlanner(self.scoring)
+        # External symptom id -> column, filled in by bind_dictionary()
+        self.dictionary_columns = np.zeros(0, dtype=np.int64)
+
+    def bind_dictionary(self, dictionary_ids):
+        # dictionary_ids: {symptom name: persistent id}, e.g. ChatStore.dictionary.ids.
+        # Afterwards stored session symptom ids map to scoring columns with one array lookup.
+        columns = np.full(max(dictionary_ids.values(), default=-1) + 1, -1, dtype=np.int64)
+        for name, symptom_id in dictionary_ids.items():
+            columns[symptom_id] = self.symptom_ids.get(name, -1)
+        self.dictionary_columns = columns
+
+    def columns_from_dictionary(self, symptom_ids):
+        ids = np.asarray(symptom_ids, dtype=np.int64)
+        columns = self.dictionary_columns[ids[(ids >= 0) & (ids < len(self.dictionary_columns))]]
+        return list(dict.fromkeys(int(column) for column in columns if column >= 0))
+
+    @classmethod
+    def load(cls, graph=None, data_dir=DATA_DIR, scorer='count'):
+        # Prefer the live graph; fall back to the CSVs it was ingested from
+        if graph is not None:
+            try:
+                return cls.from_graph(graph, scorer)
+            except Exception as e:
+                print(f"Knowledge index graph load failed, using CSV data: {e}")
+        return cls.from_csv(data_dir, scorer)
+
+    @classmethod
+    def from_graph(cls, graph, scorer='count'):
+        if hasattr(graph, 'query_batch'):
+            # graph_access.GraphClient: all six queries in one round-trip
+            return cls.from_graph_rows(graph.query_batch(GRAPH_QUERIES, name='knowledge_index'), scorer)
+        return cls.from_graph_rows({name: graph.run(query).data() for name, query in GRAPH_QUERIES.items()}, scorer)
+
+    @classmethod
+    async def from_graph_async(cls, driver, scorer='count', database=None):
+        # driver: a neo4j AsyncDriver. The queries are independent, so each one gets
+        # its own pooled session and all of them are in flight at once; the load
+        # takes about as long as the slowest query rather than the sum of all six
+        async def fetch(query):
+            async with driver.session(database=database) as session:
+                result = await session.run(query)
+                return await result.data()
+
+        rows = await asyncio.gather(*(fetch(query) for query in GRAPH_QUERIES.values()))
+        return cls.from_graph_rows(dict(zip(GRAPH_QUERIES, rows)), scorer)
+
+    @classmethod
+    def from_graph_rows(cls, rows, scorer='count'):
+        disease_symptoms = {row['disease']: [] for row in rows['diseases']}
+        for row in rows['disease_symptoms']:
+            disease_symptoms[row['disease']] = row['symptoms']
+
+        symptoms = [row['symptom'] for row in rows['symptoms']]
+
+        descriptions = {}
+        for row in rows['descriptions']:
+            descriptions.setdefault(row['disease'], row['description'])
+
+        precautions = {row['disease']: row['precautions'] for row in rows['precautions']}
+        severities = {row['symptom']: row['weight'] for row in rows['severities']}
+
+        return cls(disease_symptoms, symptoms, descriptions, precautions, severities, source='neo4j', scorer=scorer)
+
+    @classmethod
+    def from_csv(cls, data_dir=DATA_DIR, scorer='count'):
+        # Same de-duplicated frames data_ingestion writes, so both sources yield the same index
+        frames = load_frames(data_dir)
+
+        disease_symptoms = {}
+        for row in frames['disease_symptoms'].itertuples(index=False):
+            disease_symptoms.setdefault(row.disease, []).append(row.symptom)
+
+        descriptions = {}
+        for row in frames['descriptions'].itertuples(index=False):
+            disease_symptoms.setdefault(row.disease, [])
+            descriptions.setdefault(row.disease, row.text)
+
+        precautions = {}
+        for row in frames['precautions'].itertuples(index=False):
+            disease_symptoms.setdefault(row.disease, [])
+            precautions.setdefault(row.disease, []).append(row.text)
+
+        severities = {row.symptom: int(row.weight) for row in frames['severities'].itertuples(index=False)}
+
+        return cls(disease_symptoms, list(severities), descriptions, precautions, severities, source='csv', scorer=scorer)
+
+    def symptom_bits(self, symptoms):
+        bits = 0
+        for symptom in symptoms:
+            symptom_id = self.symptom_ids.get(symptom)
+            if symptom_id is not None:
+                bits |= 1 << symptom_id
+        return bits
+
+    def symptom_names(self, bits, limit=None):
+        names = []
+        while bits and (limit is None or len(names) < limit):
+            low = bits & -bits
+            names.append(self.symptoms[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+    def symptom_list(self):
+        return list(self.symptoms)
+
+    def recommend_diseases(self, symptoms, limit=5):
+        if not symptoms:
+            return []
+        return self.scoring.score(symptoms, k=limit)
+
+    def recommend_columns(self, columns, limit=5):
+        if not columns:
+            return []
+        return self.scoring.score_columns([columns], k=limit)[0]
+
+    def match_record(self, disease_name, symptoms):
+        # possible_diseases-style record for one disease, whatever its rank
+        disease_id = self.disease_ids.get(disease_name)
+        if disease_id is None or not self.scoring.total_counts[disease_id]:
+            return None
+        bits = self.disease_bits[disease_id]
+        matched = [s for s in dict.fromkeys(symptoms) if s in self.symptom_ids and bits >> self.symptom_ids[s] & 1]
+        weight = sum(float(self.scoring.weights[self.symptom_ids[s]]) for s in matched)
+        return {
+            'disease': disease_name,
+            'matched_symptoms': matched,
+            'matched_count': len(matched),
+            'total_count': int(self.scoring.total_counts[disease_id]),
+            'match_percentage': weight / float(self.scoring.weighted_totals[disease_id])
+        }
+
+    def get_disease_details(self, disease_name):
+        if disease_name not in self.disease_ids:
+            return []
+        return [{
+            'description': self.descriptions.get(disease_name, 'No description available'),
+            'precautions': list(self.precautions.get(disease_name, []))
+        }]
+
+    def get_distinctive_symptoms(self, diseases, current_symptoms, limit=10):
+        bits = 0
+        for disease in diseases:
+            disease_id = self.disease_ids.get(disease)
+            if disease_id is not None:
+                bits |= self.disease_bits[disease_id]
+        bits &= ~self.symptom_bits(current_symptoms)
+        return self.symptom_names(bits, limit)
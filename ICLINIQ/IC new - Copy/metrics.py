@@ -0,0 +1,164 @@
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, Prometheus-style
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests carrying PROFILE_HEADER are profiled with probability PROFILE_RATE and
+# the cProfile stats written to PROFILE_DIR. Without PROFILE_DIR the header is ignored.
+PROFILE_HEADER = 'X-ICLINIQ-Profile'
+PROFILE_DIR = os.environ.get('ICLINIQ_PROFILE_DIR')
+PROFILE_RATE = float(os.environ.get('ICLINIQ_PROFILE_RATE', 0.1))
+
+METRIC_HELP = {
+    'icliniq_stage_seconds': 'Time spent in each stage of a recommendation',
+    'icliniq_request_seconds': 'HTTP request latency by endpoint',
+    'icliniq_sqlite_seconds': 'Chat database call latency by operation',
+    'icliniq_neo4j_seconds': 'Neo4j query latency by query name',
+}
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {'count': count, 'sum': total, 'buckets': cumulative}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Metrics:
+    # In-memory latency histograms keyed by metric name and labels, rendered in
+    # the Prometheus text format by /metrics. Each process (e.g. each pre-forked
+    # worker) keeps and reports its own.
+    def __init__(self, help=METRIC_HELP):
+        self.histograms = {}  # (name, labels) -> LatencyHistogram
+        self.help = dict(help)
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = LatencyHistogram()
+        return histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        # Decorator form of timer()
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def render(self, samples=()):
+        # samples: extra (name, type, help, labels dict, value) for counters and
+        # gauges read off running subsystems at scrape time
+        lines = []
+        by_name = {}
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        for (name, labels), histogram in histograms:
+            by_name.setdefault(name, []).append((labels, histogram.snapshot()))
+        for name, series in by_name.items():
+            lines.append(f'# HELP {name} {self.help.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, snapshot in series:
+                for bound, count in snapshot['buckets'].items():
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {snapshot["sum"]}')
+                lines.append(f'{name}_count{format_labels(labels)} {snapshot["count"]}')
+
+        described = set()
+        for name, kind, help, labels, value in samples:
+            if name not in described:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+            lines.append(f'{name}{format_labels(tuple(sorted(labels.items())))} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def stage(name):
+    # Times one stage of a recommendation: extract, scoring, details, follow_up, format, save
+    return METRICS.timer('icliniq_stage_seconds', stage=name)
+
+
+class Profiler:
+    # Sampled cProfile of single requests. Only one profile runs at a time; a
+    # request that asks while another is being profiled just isn't profiled.
+    def __init__(self, directory=PROFILE_DIR, rate=PROFILE_RATE):
+        self.directory = directory
+        self.rate = rate
+        self.dumps = 0
+        self._busy = threading.Lock()
+
+    def start(self, requested):
+        if not (requested and self.directory and random.random() < self.rate):
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, name):
+        profile.disable()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{self.dumps}.prof')
+            profile.dump_stats(path)
+            self.dumps += 1
+            return path
+        finally:
+            self._busy.release()
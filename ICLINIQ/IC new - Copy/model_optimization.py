@@ -0,0 +1,250 @@
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+import time
+from io import BytesIO
+from types import SimpleNamespace
+import numpy as np
+
+# fp32:             the model as published
+# int8:             Linear layers dynamically quantized to int8 (weights int8, activations quantized per batch)
+# torchscript:      traced and frozen, one graph per length bucket
+# int8-torchscript: both
+MODEL_VARIANTS = ('fp32', 'int8', 'torchscript', 'int8-torchscript')
+DEFAULT_VARIANT = os.environ.get('ICLINIQ_MODEL_VARIANT', 'fp32')
+MODEL_CACHE_DIR = os.environ.get('ICLINIQ_MODEL_CACHE_DIR',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache'))
+
+# Every batch is padded up to one of these lengths instead of to whatever its
+# longest text happens to be, so short chat queries stay short and a traced
+# model needs one graph per bucket rather than one per length
+LENGTH_BUCKETS = (16, 32, 64, 128, 256, 512)
+
+
+def bucket_length(length, buckets=LENGTH_BUCKETS):
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return buckets[-1]
+
+
+def bucketed_inputs(tokenizer, texts, buckets=LENGTH_BUCKETS):
+    # Tokenize once unpadded, then pad the batch to the smallest bucket that fits it
+    encoded = tokenizer(texts, truncation=True, max_length=buckets[-1])
+    longest = max(len(ids) for ids in encoded['input_ids'])
+    return tokenizer.pad(encoded, padding='max_length', max_length=bucket_length(longest, buckets),
+                         return_tensors='pt')
+
+
+def load_pretrained(cls, model_name, **kwargs):
+    # Locally cached weights first; only download when nothing is cached yet
+    try:
+        return cls.from_pretrained(model_name, local_files_only=True, **kwargs)
+    except OSError:
+        return cls.from_pretrained(model_name, **kwargs)
+
+
+def model_size_bytes(model):
+    # Serialized size; counts the packed int8 weights that parameters() doesn't list
+    import torch
+
+    buffer = BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+class OptimizedModel:
+    # One calling convention over every variant of a BERT model: call it with
+    # tokenized inputs and get back an object with the usual output attributes
+    # (.logits, .last_hidden_state, .hidden_states). Traced graphs are built on
+    # the first batch of each length bucket and saved under cache_dir, so later
+    # starts just load them.
+    def __init__(self, model_cls, model_name, variant=DEFAULT_VARIANT, cache_dir=MODEL_CACHE_DIR, **kwargs):
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"Unknown model variant '{variant}', expected one of {MODEL_VARIANTS}")
+        import torch
+
+        self.model_name = model_name
+        self.variant = variant
+        self.cache_dir = cache_dir
+        self.traced = variant.endswith('torchscript')
+        self.graphs = {}
+        self._lock = threading.Lock()
+
+        # Traced graphs always return hidden states too, so one graph serves every caller
+        model = load_pretrained(model_cls, model_name, torchscript=self.traced,
+                                output_hidden_states=self.traced, **kwargs)
+        model.eval()
+        if variant.startswith('int8'):
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.config = model.config
+        self.output_names = None
+
+    def __call__(self, input_ids, attention_mask, token_type_ids=None, output_hidden_states=False):
+        import torch
+
+        with torch.no_grad():
+            if not self.traced:
+                return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids,
+                                  output_hidden_states=output_hidden_states, return_dict=True)
+            outputs = self.graph(input_ids, attention_mask)(input_ids, attention_mask)
+        return SimpleNamespace(**dict(zip(self.output_names, outputs)))
+
+    def graph(self, input_ids, attention_mask):
+        length = input_ids.shape[1]
+        graph = self.graphs.get(length)
+        if graph is None:
+            with self._lock:
+                graph = self.graphs.get(length)
+                if graph is None:
+                    graph = self.graphs[length] = self._load_graph(input_ids, attention_mask)
+        return graph
+
+    def _load_graph(self, input_ids, attention_mask):
+        import torch
+
+        if self.output_names is None:
+            # Traced graphs return plain tuples; remember what each position holds
+            with torch.no_grad():
+                example = self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+            self.output_names = list(example.keys())
+
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.model_name)
+        path = os.path.join(self.cache_dir, f'{name}-{self.variant}-{input_ids.shape[1]}.pt')
+        if os.path.exists(path):
+            return torch.jit.load(path)
+
+        with torch.no_grad():
+            graph = torch.jit.freeze(torch.jit.trace(self.model, (input_ids, attention_mask), strict=False))
+        # Written aside and renamed, so a worker tracing the same bucket never loads half a file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        partial = f'{path}.{os.getpid()}.tmp'
+        torch.jit.save(graph, partial)
+        os.replace(partial, path)
+        print(f"Traced {self.model_name} ({self.variant}) for length {input_ids.shape[1]}: {path}")
+        return graph
+
+    def size_bytes(self):
+        return model_size_bytes(self.model)
+
+
+# The two BERT models the app runs: (model class name, weights, from_pretrained kwargs)
+MODELS = {
+    'nlp': ('BertForSequenceClassification', 'monologg/biobert_v1.1_pubmed', {'num_labels': 2}),
+    'query': ('BertModel', 'bert-base-uncased', {}),
+}
+
+
+def sample_queries(path, count=64, seed=0):
+    # Chat-like sentences built from dataset.csv rows: "I have itching, skin rash and ..."
+    with open(path, newline='') as f:
+        rows = [[s.strip().replace('_', ' ') for s in row[1:] if s and s.strip()] for row in csv.reader(f)][1:]
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.choice(len(rows), size=min(count, len(rows)), replace=False):
+        symptoms = rows[i]
+        text = symptoms[0] if len(symptoms) == 1 else ", ".join(symptoms[:-1]) + " and " + symptoms[-1]
+        queries.append("I have " + text)
+    return queries
+
+
+def pooled(outputs, mask):
+    # Mean of the last hidden layer over real tokens, whichever model produced it
+    hidden = outputs.last_hidden_state if hasattr(outputs, 'last_hidden_state') else outputs.hidden_states[-1]
+    mask = mask.unsqueeze(-1).to(hidden.dtype)
+    return ((hidden * mask).sum(dim=1) / mask.sum(dim=1)).numpy()
+
+
+def run_batches(model, tokenizer, queries, batch_size):
+    results = []
+    for start in range(0, len(queries), batch_size):
+        inputs = bucketed_inputs(tokenizer, queries[start:start + batch_size])
+        started = time.perf_counter()
+        outputs = model(**inputs, output_hidden_states=True)
+        results.append((time.perf_counter() - started, outputs, inputs['attention_mask']))
+    return results
+
+
+def compare_variants(kind='nlp', variants=MODEL_VARIANTS, queries=None, batch_sizes=(1, 8), repeat=3):
+    # Latency, size and agreement with fp32 for every variant on the same queries
+    import torch
+    import transformers
+
+    class_name, model_name, kwargs = MODELS[kind]
+    model_cls = getattr(transformers, class_name)
+    tokenizer = load_pretrained(transformers.BertTokenizer, model_name)
+    queries = queries or sample_queries(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset.csv'))
+
+    report = {'model': model_name, 'queries': len(queries), 'torch_threads': torch.get_num_threads(), 'variants': {}}
+    reference = None
+    for variant in ['fp32'] + [v for v in variants if v != 'fp32']:
+        model = OptimizedModel(model_cls, model_name, variant, **kwargs)
+        run_batches(model, tokenizer, queries, max(batch_sizes))  # warm-up, and traces every bucket once
+
+        entry = {'size_mb': model.size_bytes() / 2 ** 20, 'latency_ms': {}}
+        for batch_size in batch_sizes:
+            timings = [seconds for _ in range(repeat) for seconds, _, _ in run_batches(model, tokenizer, queries, batch_size)]
+            entry['latency_ms'][f'batch_{batch_size}'] = {
+                'p50': float(np.percentile(timings, 50) * 1000),
+                'p95': float(np.percentile(timings, 95) * 1000),
+                'per_query': float(sum(timings) / repeat / len(queries) * 1000),
+            }
+
+        outputs = run_batches(model, tokenizer, queries, 1)
+        embeddings = np.concatenate([pooled(out, mask) for _, out, mask in outputs])
+        logits = np.concatenate([out.logits.numpy() for _, out, _ in outputs]) if hasattr(outputs[0][1], 'logits') else None
+        if reference is None:
+            reference = (embeddings, logits)
+        else:
+            ref_embeddings, ref_logits = reference
+            cosine = (embeddings * ref_embeddings).sum(axis=1) / (
+                np.linalg.norm(embeddings, axis=1) * np.linalg.norm(ref_embeddings, axis=1))
+            entry['embedding_cosine_mean'] = float(cosine.mean())
+            entry['embedding_cosine_min'] = float(cosine.min())
+            if logits is not None:
+                entry['label_agreement'] = float((logits.argmax(axis=1) == ref_logits.argmax(axis=1)).mean())
+                entry['logit_max_abs_diff'] = float(np.abs(logits - ref_logits).max())
+        report['variants'][variant] = entry
+        del model
+
+    fp32 = report['variants']['fp32']
+    for entry in report['variants'].values():
+        entry['speedup'] = {batch: fp32['latency_ms'][batch]['per_query'] / timing['per_query']
+                            for batch, timing in entry['latency_ms'].items()}
+        entry['size_ratio'] = entry['size_mb'] / fp32['size_mb']
+    return report
+
+
+def print_report(report):
+    print(f"{report['model']}: {report['queries']} queries, {report['torch_threads']} torch threads")
+    for variant, entry in report['variants'].items():
+        latency = ', '.join(f"{batch} {timing['per_query']:.1f} ms/query ({entry['speedup'][batch]:.2f}x)"
+                            for batch, timing in entry['latency_ms'].items())
+        accuracy = ''
+        if 'embedding_cosine_mean' in entry:
+            accuracy = f", cosine {entry['embedding_cosine_mean']:.4f} (min {entry['embedding_cosine_min']:.4f})"
+        if 'label_agreement' in entry:
+            accuracy += f", labels {entry['label_agreement'] * 100:.1f}% same"
+        print(f"  {variant:<17} {entry['size_mb']:7.1f} MB ({entry['size_ratio']:.2f}x)  {latency}{accuracy}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fp32, int8 and TorchScript variants of the app's BERT models.")
+    parser.add_argument('--model', choices=sorted(MODELS), default='nlp')
+    parser.add_argument('--variants', nargs='+', choices=MODEL_VARIANTS, default=list(MODEL_VARIANTS))
+    parser.add_argument('--queries', type=int, default=64, help="Sample queries drawn from dataset.csv")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    queries = sample_queries(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset.csv'), args.queries)
+    report = compare_variants(args.model, args.variants, queries, tuple(args.batch_sizes), args.repeat)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
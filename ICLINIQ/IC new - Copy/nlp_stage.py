@@ -0,0 +1,102 @@
+import os
+import threading
+import numpy as np
+from inference_scheduler import BatchScheduler, configure_torch_threads, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS
+from model_optimization import DEFAULT_VARIANT
+
+BIOBERT_MODEL = 'monologg/biobert_v1.1_pubmed'
+
+# off:  never load the model; nothing on the request path needs it
+# lazy: load on the first call that consumes logits or embeddings
+# on:   load at startup so the first request doesn't pay for it
+NLP_MODES = ('off', 'lazy', 'on')
+
+
+class NLPStage:
+    def __init__(self, mode=None, model_name=BIOBERT_MODEL, num_labels=2,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, torch_threads=None,
+                 variant=DEFAULT_VARIANT):
+        self.mode = mode or os.environ.get('ICLINIQ_NLP_MODE', 'off')
+        if self.mode not in NLP_MODES:
+            raise ValueError(f"Unknown NLP mode '{self.mode}', expected one of {NLP_MODES}")
+        self.model_name = model_name
+        self.num_labels = num_labels
+        # fp32, int8 and/or TorchScript; see model_optimization.py
+        self.variant = variant
+        self.tokenizer = None
+        self.model = None
+        self._lock = threading.Lock()
+
+        # Concurrent requests are micro-batched into one padded forward pass
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.torch_threads = torch_threads
+        self.schedulers = {}
+
+        if self.mode == 'on':
+            self.load()
+
+    def after_fork(self):
+        # Scheduler threads do not survive a fork; the model weights do (copy-on-write)
+        self._lock = threading.Lock()
+        self.schedulers = {}
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                # Heavy imports stay here so 'off' never pays for torch/transformers
+                from transformers import BertTokenizer, BertForSequenceClassification
+                from model_optimization import OptimizedModel, load_pretrained
+
+                configure_torch_threads(self.torch_threads)
+                self.tokenizer = load_pretrained(BertTokenizer, self.model_name)
+                self.model = OptimizedModel(BertForSequenceClassification, self.model_name, self.variant,
+                                            num_labels=self.num_labels)
+                print(f"Loaded NLP model {self.model_name} ({self.variant})")
+        return self.model
+
+    def forward(self, texts, output_hidden_states=False):
+        from model_optimization import bucketed_inputs
+
+        self.load()
+        inputs = bucketed_inputs(self.tokenizer, texts)
+        return self.model(**inputs, output_hidden_states=output_hidden_states), inputs['attention_mask']
+
+    def logits(self, texts):
+        if not self.enabled:
+            return None
+        return self._batched('logits', self._logits_batch, texts)
+
+    def embed(self, texts):
+        if not self.enabled:
+            return None
+        return self._batched('embed', self._embed_batch, texts)
+
+    def _logits_batch(self, texts):
+        outputs, _ = self.forward(texts)
+        return outputs.logits.numpy()
+
+    def _embed_batch(self, texts):
+        # Mean of the last hidden layer over real (non-padding) tokens
+        outputs, mask = self.forward(texts, output_hidden_states=True)
+        hidden = outputs.hidden_states[-1]
+        mask = mask.unsqueeze(-1).to(hidden.dtype)
+        return ((hidden * mask).sum(dim=1) / mask.sum(dim=1)).numpy()
+
+    def _batched(self, kind, batch_fn, texts):
+        if self.max_batch_size <= 1:
+            return batch_fn(texts)
+        scheduler = self.schedulers.get(kind)
+        if scheduler is None:
+            scheduler = self.schedulers.setdefault(
+                kind, BatchScheduler(batch_fn, self.max_batch_size, self.max_wait_ms, name=f'nlp-{kind}'))
+        futures = [scheduler.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
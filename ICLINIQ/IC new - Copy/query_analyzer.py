@@ -1,12 +1,67 @@
 from transformers import BertTokenizer, BertModel
-import torch
+import atexit
+import os
+import numpy as np
+from inference_scheduler import BatchScheduler, configure_torch_threads, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS
+from embedding_cache import EmbeddingCache, normalize_query, DEFAULT_CAPACITY
+from model_optimization import OptimizedModel, DEFAULT_VARIANT, bucketed_inputs, load_pretrained
 
 class QueryAnalyzer:
-    def __init__(self):
-        self.tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-        self.model = BertModel.from_pretrained('bert-base-uncased')
+    def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, torch_threads=None,
+                 cache_size=DEFAULT_CAPACITY, cache_path=None, variant=DEFAULT_VARIANT):
+        self.tokenizer = load_pretrained(BertTokenizer, 'bert-base-uncased')
+        # fp32, int8 and/or TorchScript; see model_optimization.py
+        self.model = OptimizedModel(BertModel, 'bert-base-uncased', variant)
+        configure_torch_threads(torch_threads)
 
-    def analyze_query(self, query):
-        inputs = self.tokenizer(query, return_tensors='pt', truncation=True, padding=True)
+        # Concurrent callers share one padded forward pass instead of batch-of-one runs
+        self.scheduler = None
+        if max_batch_size > 1:
+            self.scheduler = BatchScheduler(self.encode, max_batch_size, max_wait_ms, name='query-analyzer')
+
+        # Repeated chat phrases are served from the cache; the disk tier survives restarts
+        cache_path = cache_path or os.environ.get('ICLINIQ_EMBED_CACHE_PATH')
+        self.cache = EmbeddingCache(self.model.config.hidden_size, capacity=cache_size, path=cache_path)
+        if cache_path:
+            atexit.register(self.cache.flush)
+
+    def encode(self, queries):
+        inputs = bucketed_inputs(self.tokenizer, queries)
         outputs = self.model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1).detach().numpy()
\ No newline at end of file
+        # Mean over real tokens only, so padding added for batching doesn't shift the result
+        mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        return ((outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)).numpy()
+
+    def analyze_query(self, query):
+        key = normalize_query(query)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            if self.scheduler:
+                embedding = self.scheduler.run(key)
+            else:
+                embedding = self.encode([key])[0]
+            self.cache.put(key, embedding)
+        return embedding[np.newaxis, :]
+
+    def analyze_queries(self, queries):
+        # Batch API: look everything up first, then encode only the distinct misses
+        keys = [normalize_query(query) for query in queries]
+        embeddings = {}
+        misses = []
+        for key in keys:
+            if key in embeddings or key in misses:
+                continue
+            embedding = self.cache.get(key)
+            if embedding is None:
+                misses.append(key)
+            else:
+                embeddings[key] = embedding
+
+        if misses:
+            for key, embedding in zip(misses, self.encode(misses)):
+                self.cache.put(key, embedding)
+                embeddings[key] = embedding
+
+        if not keys:
+            return np.zeros((0, self.cache.dim), dtype=np.float32)
+        return np.stack([embeddings[key] for key in keys]).astype(np.float32)
\ No newline at end of file
@@ -0,0 +1,96 @@
+import numpy as np
+from result_cache import ResultCache
+
+# P(symptom reported | disease) for symptoms a disease has, and for ones it
+# doesn't (patients mention unrelated or mislabelled symptoms too)
+PRESENT_PROBABILITY = 0.9
+ABSENT_PROBABILITY = 0.02
+
+# Asking about a symptom that barely separates the candidates wastes a turn
+MIN_INFORMATION_GAIN = 1e-3
+
+
+def entropy(probabilities, axis=0):
+    # Shannon entropy in bits; 0 * log(0) counts as 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(probabilities > 0, probabilities * np.log2(probabilities), 0.0)
+    return -terms.sum(axis=axis)
+
+
+class QuestionPlanner:
+    # Picks the follow-up symptoms to ask about by expected information gain
+    # over the candidate diseases: how much the yes/no answers are expected to
+    # shrink the uncertainty about which one it is, so every turn splits the
+    # candidates as evenly as it can.
+    #
+    # The disease x symptom likelihood tables are built once per index. The
+    # posterior for a session's symptom set is cached and the next turn starts
+    # from it, adding only the symptoms that turn reported.
+    def __init__(self, scoring, present=PRESENT_PROBABILITY, absent=ABSENT_PROBABILITY, capacity=4096):
+        self.index = scoring.index
+        self.likelihood = np.where(scoring.incidence > 0, present, absent)
+        self.log_present = np.log(self.likelihood)
+        # Every disease is equally common in the dataset, so the prior is flat
+        self.prior = np.full(len(self.index.diseases), -np.log(max(len(self.index.diseases), 1)))
+        self.beliefs = ResultCache(capacity=capacity, ttl=None, name='question_beliefs')
+
+    def belief(self, columns, previous_columns=None):
+        # Log-posterior over every disease given the reported symptom columns
+        key = tuple(sorted(set(columns)))
+        log_posterior = self.beliefs.get(key)
+        if log_posterior is not None:
+            return log_posterior
+
+        base, known = self.prior, set()
+        if previous_columns:
+            previous_key = tuple(sorted(set(previous_columns)))
+            cached = self.beliefs.get(previous_key)
+            if cached is not None and set(previous_key) <= set(key):
+                base, known = cached, set(previous_key)
+        new_columns = [column for column in key if column not in known]
+        log_posterior = base + self.log_present[:, new_columns].sum(axis=1)
+        self.beliefs.put(key, log_posterior)
+        return log_posterior
+
+    def information_gain(self, p, outcomes, likelihood):
+        # Mutual information between the disease and the answers to the questions
+        # already picked plus each possible next one, for every symptom column at once.
+        # outcomes: candidates x answer patterns, P(pattern | disease) so far.
+        joint = np.concatenate([outcomes[None, :, :] * likelihood.T[:, :, None],
+                                outcomes[None, :, :] * (1.0 - likelihood.T[:, :, None])], axis=2)
+        joint = joint * p[None, :, None]                        # symptoms x candidates x patterns
+        p_outcome = joint.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            posterior = np.where(p_outcome[:, None, :] > 0, joint / p_outcome[:, None, :], 0.0)
+        return entropy(p) - (p_outcome * entropy(posterior, axis=1)).sum(axis=1)
+
+    def plan(self, possible_diseases, columns, previous_columns=None, limit=3):
+        # Symptom names to ask about next, most informative first. Questions are
+        # picked greedily on the gain of the whole set, so the second and third
+        # split the candidates differently from the first instead of repeating it.
+        candidates = [self.index.disease_ids[record['disease']] for record in possible_diseases
+                      if record['disease'] in self.index.disease_ids]
+        if len(candidates) < 2:
+            return []
+
+        log_posterior = self.belief(columns, previous_columns)[candidates]
+        weights = np.exp(log_posterior - log_posterior.max())
+        p = weights / weights.sum()
+        likelihood = self.likelihood[candidates]               # candidates x symptoms
+
+        outcomes = np.ones((len(candidates), 1))
+        excluded = list(columns)
+        picked, gained = [], 0.0
+        for _ in range(limit):
+            gain = self.information_gain(p, outcomes, likelihood)
+            gain[excluded] = -np.inf
+            # Highest gain first, ties broken by column order so the questions are stable
+            column = int(np.lexsort((np.arange(len(gain)), -gain))[0])
+            if gain[column] - gained <= MIN_INFORMATION_GAIN:
+                break
+            picked.append(column)
+            excluded.append(column)
+            gained = gain[column]
+            answer = likelihood[:, [column]]
+            outcomes = np.concatenate([outcomes * answer, outcomes * (1.0 - answer)], axis=1)
+        return [self.index.symptoms[column] for column in picked]
@@ -1,10 +1,16 @@
+import os
 import re
-from py2neo import Graph #type: ignore
-from fuzzywuzzy import process #type: ignore
+from graph_access import GraphClient, GraphUnavailable
+from knowledge_index import KnowledgeIndex
+from symptom_matcher import SymptomMatcher
+from vector_index import VectorIndex, EMBEDDINGS_PATH
 
 class RecommendationEngine:
-    def __init__(self):
-        self.graph = Graph("bolt://localhost:7687", auth=("neo4j", "12345678"))
+    def __init__(self, scorer='count'):
+        # Every graph read goes through the pooled, circuit-broken client and falls
+        # back to the in-memory index (built from the CSVs if Neo4j is down)
+        self.graph = GraphClient()
+        self.index = KnowledgeIndex.load(self.graph, scorer=scorer)
         self.symptom_mapping = {
             'fever': ['high_fever', 'mild_fever'],
             'cold': ['cold'],
@@ -12,6 +18,18 @@ class RecommendationEngine:
             'cough': ['dry_cough', 'cough'],
             'body pain': ['body_pain', 'back_pain']
         }
+        self.matcher = SymptomMatcher(self.index.symptoms, aliases=self.symptom_mapping)
+
+        # Graph embeddings add nearest-neighbour candidates next to the symptom match.
+        # They are a build artifact, not checked in: train them with graph_embeddings.py
+        self.vector_index = None
+        if not os.path.exists(EMBEDDINGS_PATH):
+            print(f"No graph embeddings at {EMBEDDINGS_PATH}; run graph_embeddings.py for embedding candidates")
+        else:
+            try:
+                self.vector_index = VectorIndex.load()
+            except Exception as e:
+                print(f"Vector index unavailable: {e}")
 
     def recommend(self, query):
         # Extract symptoms using advanced matching
@@ -20,72 +38,52 @@ class RecommendationEngine:
 
         # Recommend diseases based on symptoms
         recommendations = self.recommend_diseases(symptoms)
+        recommendations += self.embedding_candidates(symptoms, recommendations)
         print("Recommended Diseases:", recommendations)
 
         # Get details for the top recommended disease
         if recommendations:
             top_disease = recommendations[0]['disease']
-            details = self.get_disease_details(top_disease)
-            diagnosis = self.generate_diagnosis(top_disease, symptoms)
+            details, matched = self.get_disease_summary(top_disease, symptoms)
+            diagnosis = self.generate_diagnosis(top_disease, symptoms, matched)
             return top_disease, details, diagnosis
         return None, None, None
 
     def extract_symptoms(self, query):
-        # Get full symptom list from Neo4j
-        symptom_list = self.get_symptom_list()
-        
-        # Normalize query
-        query_lower = query.lower()
-        
-        # Extract symptoms using multiple techniques
-        extracted_symptoms = set()
-        
-        # Direct mapping
-        for key, mapped_symptoms in self.symptom_mapping.items():
-            if key in query_lower:
-                extracted_symptoms.update(mapped_symptoms)
-        
-        # Fuzzy matching
-        for symptom in symptom_list:
-            # Check if the full symptom is in the query
-            if symptom.lower() in query_lower:
-                extracted_symptoms.add(symptom)
-            
-            # Fuzzy matching with minimum score
-            match = process.extractOne(symptom, [query_lower], score_cutoff=80)
-            if match:
-                extracted_symptoms.add(symptom)
-        
-        return list(extracted_symptoms)
+        # Direct mapping, exact and fuzzy matching all run through the compiled matcher
+        return self.matcher.match(query)
+
+    def embedding_candidates(self, symptoms, recommendations, k=5):
+        if not self.vector_index or not symptoms:
+            return []
+        query_vector = self.vector_index.vector('Symptom', symptoms)
+        if query_vector is None:
+            return []
+
+        known = {row['disease'] for row in recommendations}
+        candidates = []
+        for disease, similarity in self.vector_index.search(query_vector, k, node_type='Disease')[0]:
+            record = self.index.match_record(disease, symptoms)
+            if record and disease not in known:
+                record['similarity'] = similarity
+                candidates.append(record)
+        return candidates
 
     def get_symptom_list(self):
         query = """
         MATCH (s:Symptom)
         RETURN s.name AS symptom
         """
-        result = self.graph.run(query).data()
+        try:
+            result = self.graph.query(query, name='symptom_list')
+        except GraphUnavailable:
+            return self.index.symptom_list()
         return [row['symptom'] for row in result]
 
     def recommend_diseases(self, symptoms):
         if not symptoms:
             return []
-        
-        query = """
-        MATCH (d:Disease)-[:HAS_SYMPTOM]->(s:Symptom)
-        WHERE s.name IN $symptoms
-        WITH d, COUNT(DISTINCT s) AS matched_symptoms
-        MATCH (d)-[:HAS_SYMPTOM]->(total:Symptom)
-        WITH d, matched_symptoms, COUNT(DISTINCT total) AS total_symptoms
-        WHERE total_symptoms > 0
-        RETURN d.name AS disease, 
-               matched_symptoms, 
-               total_symptoms, 
-               (matched_symptoms * 1.0 / total_symptoms) AS match_percentage
-        ORDER BY match_percentage DESC
-        LIMIT 5
-        """
-        result = self.graph.run(query, symptoms=symptoms).data()
-        return result
+        return self.index.recommend_diseases(symptoms, limit=5)
 
     def get_disease_details(self, disease_name):
         query = """
@@ -96,16 +94,57 @@ class RecommendationEngine:
             COALESCE(desc.text, 'No description available') AS description,
             COLLECT(DISTINCT prec.text) AS precautions
         """
-        result = self.graph.run(query, disease_name=disease_name).data()
-        return result
+        try:
+            return self.graph.query(query, name='disease_details', disease_name=disease_name)
+        except GraphUnavailable:
+            return self.index.get_disease_details(disease_name)
 
-    def generate_diagnosis(self, disease, symptoms):
+    def get_disease_summary(self, disease_name, symptoms):
+        # Description, precautions and the matched symptoms in one round-trip
         query = """
-        MATCH (d:Disease {name: $disease})-[:HAS_SYMPTOM]->(s:Symptom)
-        WHERE s.name IN $symptoms
-        RETURN COLLECT(s.name) AS matched_symptoms
+        MATCH (d:Disease {name: $disease_name})
+        CALL {
+            WITH d
+            OPTIONAL MATCH (d)-[:HAS_DESCRIPTION]->(desc:Description)
+            RETURN COALESCE(desc.text, 'No description available') AS description
+            LIMIT 1
+        }
+        CALL {
+            WITH d
+            OPTIONAL MATCH (d)-[:HAS_PRECAUTION]->(prec:Precaution)
+            RETURN COLLECT(DISTINCT prec.text) AS precautions
+        }
+        CALL {
+            WITH d
+            OPTIONAL MATCH (d)-[:HAS_SYMPTOM]->(s:Symptom)
+            WHERE s.name IN $symptoms
+            RETURN COLLECT(s.name) AS matched_symptoms
+        }
+        RETURN description, precautions, matched_symptoms
         """
-        matched = self.graph.run(query, disease=disease, symptoms=symptoms).data()[0]['matched_symptoms']
+        try:
+            rows = self.graph.query(query, name='disease_summary', disease_name=disease_name, symptoms=symptoms)
+        except GraphUnavailable:
+            return self.index.get_disease_details(disease_name), self.matched_symptoms(disease_name, symptoms)
+        if not rows:
+            return [], []
+        return [{'description': rows[0]['description'], 'precautions': rows[0]['precautions']}], rows[0]['matched_symptoms']
+
+    def matched_symptoms(self, disease, symptoms):
+        record = self.index.match_record(disease, symptoms)
+        return record['matched_symptoms'] if record else []
+
+    def generate_diagnosis(self, disease, symptoms, matched=None):
+        if matched is None:
+            query = """
+            MATCH (d:Disease {name: $disease})-[:HAS_SYMPTOM]->(s:Symptom)
+            WHERE s.name IN $symptoms
+            RETURN COLLECT(s.name) AS matched_symptoms
+            """
+            try:
+                matched = self.graph.query(query, name='diagnosis', disease=disease, symptoms=symptoms)[0]['matched_symptoms']
+            except GraphUnavailable:
+                matched = self.matched_symptoms(disease, symptoms)
         
         # Diagnostic confidence calculation
         confidence = len(matched) / len(symptoms) * 100 if symptoms else 0
@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from io import BytesIO
+
+# 0 renders in the calling thread instead of a process pool
+REPORT_WORKERS = int(os.environ.get('ICLINIQ_REPORT_WORKERS', 2))
+REPORT_CACHE_BYTES = int(os.environ.get('ICLINIQ_REPORT_CACHE_BYTES', 64 * 1024 * 1024))
+
+# What goes into a report, with the defaults /download_report always used
+REPORT_DEFAULTS = OrderedDict([
+    ('disease', 'Unknown Disease'),
+    ('description', 'No description available.'),
+    ('diagnostic_statement', 'No diagnostic statement available.'),
+    ('precautions', ['No precautions available.']),
+    ('extracted_symptoms', []),
+    ('possible_diseases', []),
+])
+
+DISCLAIMER = ("<i>Disclaimer: This report is generated by an AI system and is for informational purposes only. "
+              "It is not a substitute for professional medical advice, diagnosis, or treatment. Always seek the advice "
+              "of your physician or other qualified health provider with any questions you may have regarding a "
+              "medical condition.</i>")
+
+_styles = None
+
+
+def report_fields(data):
+    return {name: data.get(name, default) for name, default in REPORT_DEFAULTS.items()}
+
+
+def report_key(fields, generated_at):
+    # Same content on the same day, same key, whatever order the JSON arrived in.
+    # The day is part of it so a cached report never shows an old Date: line;
+    # within the day a cached copy keeps the time it was first rendered at.
+    day = generated_at[:10]
+    return hashlib.sha256(json.dumps([fields, day], sort_keys=True).encode()).hexdigest()
+
+
+def styles():
+    # Built once per process; getSampleStyleSheet() is rebuilt from scratch on every call
+    global _styles
+    if _styles is None:
+        from reportlab.lib.styles import getSampleStyleSheet
+        sheet = getSampleStyleSheet()
+        _styles = {'Title': sheet['Title'], 'BodyText': sheet['BodyText']}
+    return _styles
+
+
+def warm_worker():
+    # Pool initializer: reportlab imported and styles built before the first report arrives
+    styles()
+
+
+def render_pdf(fields, generated_at):
+    # Runs in a pool process; everything it needs comes in as plain data
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+    body = styles()['BodyText']
+    buffer = BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=letter)
+    story = [Paragraph("Medical Recommendation Report", styles()['Title']), Spacer(1, 12),
+             Paragraph(f"<b>Date:</b> {generated_at}", body), Spacer(1, 12)]
+
+    # Symptoms
+    if fields['extracted_symptoms']:
+        story += [Paragraph(f"<b>Reported Symptoms:</b> {', '.join(fields['extracted_symptoms'])}", body),
+                  Spacer(1, 12)]
+
+    # Primary Disease
+    story += [Paragraph(f"<b>Primary Recommendation:</b> {fields['disease']}", body), Spacer(1, 12)]
+
+    # Other Possible Diseases
+    possible_diseases = fields['possible_diseases']
+    if possible_diseases and len(possible_diseases) > 1:
+        story += [Paragraph("<b>Other Possible Conditions:</b>", body), Spacer(1, 6)]
+        for i, disease_data in enumerate(possible_diseases[1:4], 2):  # Start from the second disease
+            disease_name = disease_data.get('disease', 'Unknown')
+            confidence = disease_data.get('match_percentage', 0) * 100
+            story.append(Paragraph(f"{i-1}. {disease_name} (Confidence: {confidence:.1f}%)", body))
+        story.append(Spacer(1, 12))
+
+    story += [Paragraph(f"<b>Description:</b> {fields['description']}", body), Spacer(1, 12),
+              Paragraph(f"<b>Diagnostic Statement:</b> {fields['diagnostic_statement']}", body), Spacer(1, 12),
+              Paragraph("<b>Precautions:</b>", body)]
+    for precaution in fields['precautions']:
+        story += [Paragraph(f"- {precaution}", body), Spacer(1, 6)]
+
+    story += [Spacer(1, 24), Paragraph(DISCLAIMER, body)]
+    pdf.build(story)
+    return buffer.getvalue()
+
+
+class PDFCache:
+    # Finished PDFs by content hash, least recently used evicted first once the
+    # total size passes max_bytes. A PDF larger than the whole budget isn't kept.
+    def __init__(self, max_bytes=REPORT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            pdf = self.entries.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key, pdf):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self.entries[key] = pdf
+            self.bytes += len(pdf)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+class ReportService:
+    # PDF reports rendered off the request thread. reportlab layout holds the
+    # GIL for its whole run, so it goes to a small process pool (spawned, never
+    # forked from a process running threads) and the request thread just waits.
+    # Identical reports are rendered once: concurrent requests share the
+    # in-flight render and later ones are served from the PDF cache.
+    def __init__(self, workers=REPORT_WORKERS, cache_bytes=REPORT_CACHE_BYTES):
+        self.workers = workers
+        self.cache = PDFCache(cache_bytes)
+        self.rendered = 0
+        self.pending = {}  # key -> Future of a render in progress
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None and self.workers > 0:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def render(self, data, generated_at=None):
+        return self.submit(data, generated_at).result()
+
+    def render_many(self, reports, generated_at=None):
+        # Bulk mode: every render is queued before the first is waited on
+        futures = [self.submit(data, generated_at) for data in reports]
+        return [future.result() for future in futures]
+
+    def submit(self, data, generated_at=None):
+        fields = report_fields(data)
+        generated_at = generated_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        key = report_key(fields, generated_at)
+        pdf = self.cache.get(key)
+        if pdf is not None:
+            future = Future()
+            future.set_result(pdf)
+            return future
+
+        with self._lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            future = self.pending[key] = Future()
+
+        try:
+            pool = self.pool()
+            if pool is not None:
+                pool.submit(render_pdf, fields, generated_at).add_done_callback(
+                    lambda done: self._finished(key, future, fields, generated_at, done))
+                return future
+        except Exception as e:
+            # Processes can't be started here (e.g. a __main__ that spawn can't
+            # re-import); every report from now on renders in the calling thread
+            print(f"Report process pool unavailable, rendering in-process: {e}")
+            self.workers = 0
+            self.close()
+        try:
+            self._finish(key, future, render_pdf(fields, generated_at))
+        except Exception as e:
+            self._fail(key, future, e)
+        return future
+
+    def _finished(self, key, future, fields, generated_at, done):
+        try:
+            pdf = done.result()
+        except BrokenProcessPool:
+            # A pool process died; drop the pool (the next report starts a new one) and render here
+            with self._lock:
+                self._pool = None
+            try:
+                pdf = render_pdf(fields, generated_at)
+            except Exception as e:
+                return self._fail(key, future, e)
+        except Exception as e:
+            return self._fail(key, future, e)
+        self._finish(key, future, pdf)
+
+    def _finish(self, key, future, pdf):
+        self.cache.put(key, pdf)
+        self.rendered += 1
+        with self._lock:
+            self.pending.pop(key, None)
+        future.set_result(pdf)
+
+    def _fail(self, key, future, error):
+        with self._lock:
+            self.pending.pop(key, None)
+        future.set_exception(error)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        return dict(self.cache.stats(), workers=self.workers, rendered=self.rendered, in_flight=len(self.pending))
+
+
+def render_sessions(service, report_data, session_ids, out_dir):
+    # One report per stored session, written as report_<session_id>.pdf
+    os.makedirs(out_dir, exist_ok=True)
+    session_ids = list(session_ids)
+    pdfs = service.render_many(report_data(session_id) for session_id in session_ids)
+    paths = []
+    for session_id, pdf in zip(session_ids, pdfs):
+        path = os.path.join(out_dir, f'report_{session_id}.pdf')
+        with open(path, 'wb') as f:
+            f.write(pdf)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render PDF reports for stored chat sessions.")
+    parser.add_argument('--out', default='reports', help="Directory the PDFs are written to")
+    parser.add_argument('--session', type=int, action='append', dest='sessions',
+                        help="Session to render; repeat for several (default: every session)")
+    parser.add_argument('--days', type=int, default=None, help="Only sessions started within the last N days")
+    parser.add_argument('--workers', type=int, default=max(1, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    from app import startup, get_chat_store, session_report_data
+    session_ids = args.sessions
+    if session_ids is None:
+        since = (datetime.now() - timedelta(days=args.days)).strftime('%Y-%m-%d %H:%M:%S') if args.days else None
+        session_ids = get_chat_store().session_ids(since)
+
+    service = ReportService(workers=args.workers)
+    try:
+        paths = render_sessions(service, session_report_data, session_ids, args.out)
+    finally:
+        service.close()
+        startup.shutdown()
+    print(f"Wrote {len(paths)} reports to {args.out}")
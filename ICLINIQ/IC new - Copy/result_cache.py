@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = int(os.environ.get('ICLINIQ_RESULT_CACHE_SIZE', 4096))
+DEFAULT_TTL = float(os.environ.get('ICLINIQ_RESULT_CACHE_TTL', 3600))
+
+_MISSING = object()
+
+
+class ResultCache:
+    # Thread-safe LRU with an optional time-to-live. Values are shared between
+    # callers, so whatever is cached must be treated as read-only.
+    def __init__(self, capacity=DEFAULT_CAPACITY, ttl=DEFAULT_TTL, name='results'):
+        self.name = name
+        self.capacity = capacity
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            # A value computed before the last clear() belongs to the old data; drop it
+            if generation is not None and generation != self.generation:
+                return
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        generation = self.generation
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value, generation)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self.entries),
+                'capacity': self.capacity,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'generation': self.generation,
+            }
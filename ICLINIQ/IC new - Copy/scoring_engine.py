@@ -0,0 +1,101 @@
+import numpy as np
+
+
+# Scorers turn the knowledge index into one weight per symptom column. A disease's
+# match_percentage is the weight of its matched symptoms over the weight of all of
+# its symptoms, so the 'count' scorer reproduces matched_count / total_count.
+def count_weights(index):
+    return np.ones(len(index.symptoms), dtype=np.float64)
+
+
+def severity_weights(index, default=1.0):
+    return np.array([float(index.severities.get(symptom, default)) for symptom in index.symptoms], dtype=np.float64)
+
+
+SCORERS = {
+    'count': count_weights,
+    'severity': severity_weights,
+}
+
+
+def register_scorer(name, weights_fn):
+    SCORERS[name] = weights_fn
+
+
+class ScoringEngine:
+    def __init__(self, index, scorer='count'):
+        self.index = index
+
+        # Dense disease x symptom incidence matrix (41 x ~130 floats is tiny)
+        self.incidence = np.zeros((len(index.diseases), len(index.symptoms)), dtype=np.float64)
+        for disease_id, bits in enumerate(index.disease_bits):
+            for symptom in index.symptom_names(bits):
+                self.incidence[disease_id, index.symptom_ids[symptom]] = 1.0
+        self.total_counts = self.incidence.sum(axis=1).astype(np.int64)
+
+        self.set_scorer(scorer)
+
+    def set_scorer(self, scorer):
+        weights_fn = SCORERS[scorer] if isinstance(scorer, str) else scorer
+        self.scorer = scorer
+        self.weights = np.asarray(weights_fn(self.index), dtype=np.float64)
+        self.weighted_incidence = self.incidence * self.weights
+        totals = self.weighted_incidence.sum(axis=1)
+        # Diseases without symptoms can never match; avoid dividing by zero
+        self.weighted_totals = np.where(totals > 0, totals, np.inf).astype(np.float64)
+
+    def columns(self, symptoms):
+        # Symptom names -> incidence-matrix columns, de-duplicated, unknown names dropped
+        return [self.index.symptom_ids[s] for s in dict.fromkeys(symptoms) if s in self.index.symptom_ids]
+
+    def query_matrix(self, column_sets):
+        queries = np.zeros((len(column_sets), len(self.index.symptoms)), dtype=np.float64)
+        for row, columns in enumerate(column_sets):
+            queries[row, list(columns)] = 1.0
+        return queries
+
+    def score_matrix(self, queries):
+        # One matrix multiply scores every query in the batch against every disease
+        matched_counts = queries @ self.incidence.T
+        scores = (queries @ self.weighted_incidence.T) / self.weighted_totals
+        scores[matched_counts == 0] = -np.inf
+        return scores, matched_counts
+
+    def top_k(self, scores, k=5):
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        # Highest score first, ties broken by disease order for stable output
+        order = np.lexsort((candidates, -candidate_scores), axis=1)
+        return np.take_along_axis(candidates, order, axis=1)
+
+    def score_columns(self, column_sets, k=5):
+        # Column ids in, records out; callers holding ids skip the name lookups
+        queries = self.query_matrix(column_sets)
+        scores, matched_counts = self.score_matrix(queries)
+        top = self.top_k(scores, k)
+
+        results = []
+        for row, query_ids in enumerate(column_sets):
+            records = []
+            for disease_id in top[row]:
+                if not np.isfinite(scores[row, disease_id]):
+                    continue
+                records.append({
+                    'disease': self.index.diseases[disease_id],
+                    'matched_symptoms': [self.index.symptoms[i] for i in query_ids if self.incidence[disease_id, i]],
+                    'matched_count': int(matched_counts[row, disease_id]),
+                    'total_count': int(self.total_counts[disease_id]),
+                    'match_percentage': float(scores[row, disease_id])
+                })
+            results.append(records)
+        return results
+
+    def score_batch(self, symptom_sets, k=5):
+        return self.score_columns([self.columns(symptoms) for symptoms in symptom_sets], k)
+
+    def score(self, symptoms, k=5):
+        return self.score_batch([symptoms], k)[0]
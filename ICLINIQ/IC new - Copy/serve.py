@@ -0,0 +1,134 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+from werkzeug.serving import make_server
+from app import create_app, startup
+
+DEFAULT_WORKERS = int(os.environ.get('ICLINIQ_WORKERS', 0)) or os.cpu_count() or 1
+
+# Built once in the master and shared copy-on-write by every worker. The chat
+# writer is per-process (it owns a thread) and each worker starts its own.
+PRELOAD = ['chat_store', 'recommendation_engine']
+
+
+def torch_threads_per_worker(workers, threads=None):
+    # Split the cores between workers instead of every worker claiming all of them
+    return threads or max(1, (os.cpu_count() or 1) // workers)
+
+
+def configure_worker_threads(threads):
+    os.environ['ICLINIQ_TORCH_THREADS'] = str(threads)
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    if 'torch' in sys.modules:
+        # The model was loaded in the master, so its pool has to be resized here
+        from inference_scheduler import configure_torch_threads
+        configure_torch_threads(threads)
+
+
+def bind(host, port, backlog=2048):
+    # One listening socket, inherited by every worker; the kernel spreads accepts
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, host, port, sock, threads):
+    startup.after_fork()
+    configure_worker_threads(threads)
+    # Dropped by after_fork(); rebuilt now so /ready passes before the first chat request
+    startup.get('chat_writer')
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Flush queued chat turns before the process goes away
+        startup.shutdown()
+
+
+def spawn(app, host, port, sock, threads):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, host, port, sock, threads)
+        except Exception as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            # Never fall back into the master's loop
+            os._exit(code)
+    return pid
+
+
+def serve(host='127.0.0.1', port=5001, workers=DEFAULT_WORKERS, torch_threads=None):
+    app = create_app(warm_up=False)
+    if not hasattr(os, 'fork') or workers <= 1:
+        # No fork (Windows) or a single worker: one threaded server in this process
+        startup.warm_up(PRELOAD + ['chat_writer'])
+        make_server(host, port, app, threaded=True).serve_forever()
+        return
+
+    # Load the index, matcher and (if enabled) the model before forking, then
+    # move everything alive into the permanent GC generation so the collector
+    # never writes to those pages and they stay shared between workers
+    startup.warm_up(PRELOAD)
+    startup.before_fork()
+    gc.collect()
+    gc.freeze()
+
+    threads = torch_threads_per_worker(workers, torch_threads)
+    sock = bind(host, port)
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[spawn(app, host, port, sock, threads)] = True
+    print(f"Serving on http://{host}:{port} with {workers} workers, {threads} torch threads each")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.pop(pid, None)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            children[spawn(app, host, port, sock, threads)] = True
+    sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the app from pre-forked workers sharing one loaded model.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--torch-threads', type=int, default=None,
+                        help="Torch threads per worker (default: cores / workers)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.torch_threads)
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Set ICLINIQ_WARM_UP=1 to build every subsystem in a background thread at startup
+WARM_UP = os.environ.get('ICLINIQ_WARM_UP', '0') == '1'
+
+
+class Startup:
+    # Registry of the app's heavy subsystems. Each one is built on first use (or
+    # by warm_up()), exactly once, and every build step is timed by phase so a
+    # slow cold start can be traced to Neo4j, the index, the model, ...
+    def __init__(self):
+        self.created_at = time.perf_counter()
+        self.factories = OrderedDict()
+        self.per_process = set()
+        self.instances = {}
+        self.errors = {}
+        self.timings = OrderedDict()
+        self.warm_up_thread = None
+        self._lock = threading.RLock()
+
+    def register(self, name, factory, per_process=False):
+        # per_process: owns threads or handles that cannot cross a fork, so a
+        # forked worker builds its own instead of inheriting the parent's
+        self.factories[name] = factory
+        if per_process:
+            self.per_process.add(name)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def get(self, name):
+        instance = self.instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self.instances.get(name)
+                if instance is None:
+                    try:
+                        with self.phase(name):
+                            instance = self.factories[name]()
+                    except Exception as e:
+                        self.errors[name] = str(e)
+                        raise
+                    self.errors.pop(name, None)
+                    self.instances[name] = instance
+        return instance
+
+    def is_warm(self, name):
+        return name in self.instances
+
+    def peek(self, name):
+        # The instance if it is already built, without building it
+        return self.instances.get(name)
+
+    def warm_up(self, names=None, background=False):
+        if background:
+            if self.warm_up_thread is None or not self.warm_up_thread.is_alive():
+                self.warm_up_thread = threading.Thread(target=self.warm_up, args=(names,),
+                                                       name='warm-up', daemon=True)
+                self.warm_up_thread.start()
+            return self.warm_up_thread
+
+        for name in names or list(self.factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+        self.print_report()
+
+    def before_fork(self):
+        # Called in the parent right before forking workers
+        for instance in list(self.instances.values()):
+            if hasattr(instance, 'before_fork'):
+                instance.before_fork()
+
+    def after_fork(self):
+        # Called first thing in a forked worker; only the forking thread survived
+        self._lock = threading.RLock()
+        self.warm_up_thread = None
+        for name, instance in list(self.instances.items()):
+            if name in self.per_process:
+                del self.instances[name]
+            elif hasattr(instance, 'after_fork'):
+                instance.after_fork()
+
+    def shutdown(self):
+        # Newest first, so e.g. the chat writer flushes before the store closes
+        for instance in reversed(list(self.instances.values())):
+            if hasattr(instance, 'close'):
+                instance.close()
+
+    def report(self):
+        return {
+            'uptime_seconds': time.perf_counter() - self.created_at,
+            'warm': {name: self.is_warm(name) for name in self.factories},
+            'errors': dict(self.errors),
+            'phases': dict(self.timings),
+        }
+
+    def print_report(self):
+        print("Startup timing:")
+        for name, seconds in self.timings.items():
+            print(f"  {name:<24} {seconds * 1000:8.1f} ms")
@@ -0,0 +1,139 @@
+import re
+from collections import Counter, defaultdict
+from itertools import chain
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+FUZZY_THRESHOLD = 80  # Same cut-off the fuzzywuzzy loop used (score > 80)
+NGRAM_SIZE = 3
+WINDOW_CACHE_SIZE = 65536
+
+# Symptom phrases never start or end on these, so fuzzy windows that do are skipped
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'am', 'as', 'at', 'be', 'been', 'but', 'by', 'do', 'for', 'from',
+    'had', 'has', 'have', 'i', 'im', 'in', 'is', 'it', 'me', 'my', 'no', 'not', 'of', 'on',
+    'or', 'since', 'so', 'some', 'the', 'to', 'very', 'was', 'with', 'you', 'your'
+}
+
+
+def tokenize(text):
+    # "High_Fever!" -> ['high', 'fever']; underscores count as spaces
+    return re.findall(r'[a-z0-9]+', text.lower().replace('_', ' '))
+
+
+def phrase_variants(symptom):
+    # The underscore-split name plus, for names like "toxic_look_(typhos)", the
+    # name without its parenthetical so users can type either form
+    variants = [tokenize(symptom)]
+    without_parens = tokenize(re.sub(r'\(.*?\)', ' ', symptom))
+    if without_parens and without_parens != variants[0]:
+        variants.append(without_parens)
+    return [tokens for tokens in variants if tokens]
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    padded = f' {text} '
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+class SymptomMatcher:
+    # Compiles every symptom name (and optional extra aliases) once. Exact hits come
+    # from walking a token trie over the query; typos are resolved through an
+    # n-gram index that shortlists a few candidate phrases before scoring them.
+    def __init__(self, symptoms, aliases=None, threshold=FUZZY_THRESHOLD):
+        self.threshold = threshold
+        self.trie = {}
+        self.phrases = []  # (text, targets)
+        self.phrase_lengths = []
+        self.gram_index = defaultdict(list)
+        self.max_tokens = 1
+
+        for symptom in symptoms:
+            for tokens in phrase_variants(symptom):
+                self.add_phrase(tokens, [symptom])
+        for alias, targets in (aliases or {}).items():
+            self.add_phrase(tokenize(alias), list(targets))
+
+        # Chat users repeat the same words constantly, so remember fuzzy verdicts per window
+        self.fuzzy_matches = lru_cache(maxsize=WINDOW_CACHE_SIZE)(self.match_window)
+
+    def add_phrase(self, tokens, targets):
+        if not tokens:
+            return
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        terminal = node.setdefault(None, [])
+        for target in targets:
+            if target not in terminal:
+                terminal.append(target)
+        self.max_tokens = max(self.max_tokens, len(tokens))
+
+        phrase_id = len(self.phrases)
+        text = ' '.join(tokens)
+        self.phrases.append((text, targets))
+        self.phrase_lengths.append(len(text))
+        for gram in ngrams(text):
+            self.gram_index[gram].append(phrase_id)
+
+    def match(self, query):
+        tokens = tokenize(query)
+        found = {}
+        covered = [False] * len(tokens)
+
+        # Exact phrase hits: walk the trie from every token position
+        for start in range(len(tokens)):
+            node = self.trie
+            for end, token in enumerate(tokens[start:start + self.max_tokens], start + 1):
+                node = node.get(token)
+                if node is None:
+                    break
+                for symptom in node.get(None, []):
+                    found.setdefault(symptom, None)
+                if None in node:
+                    covered[start:end] = [True] * (end - start)
+
+        # Fuzzy hits: score each query window only against phrases sharing n-grams.
+        # Words an exact hit already explained aren't typos, so windows touching
+        # them are skipped ("joint pain" is not also "hip joint pain").
+        for start in range(len(tokens)):
+            if tokens[start] in STOPWORDS or covered[start]:
+                continue
+            for end in range(start + 1, min(start + self.max_tokens, len(tokens)) + 1):
+                if covered[end - 1]:
+                    break
+                if tokens[end - 1] in STOPWORDS:
+                    continue
+                for symptom in self.fuzzy_matches(' '.join(tokens[start:end])):
+                    found.setdefault(symptom, None)
+
+        return list(found)
+
+    def match_window(self, window):
+        matched = []
+        for phrase_id in self.fuzzy_candidates(window):
+            text, targets = self.phrases[phrase_id]
+            if self.score(window, text) > self.threshold:
+                matched.extend(targets)
+        return tuple(matched)
+
+    def fuzzy_candidates(self, window):
+        size = len(window)
+        counts = Counter(chain.from_iterable(self.gram_index.get(gram, ()) for gram in ngrams(window)))
+
+        candidates = []
+        for phrase_id, shared in counts.items():
+            length = self.phrase_lengths[phrase_id]
+            # A ratio above 80 needs comparable lengths and a fair share of n-grams
+            if min(size, length) * 3 < max(size, length) * 2 or shared * 3 < min(size, length):
+                continue
+            candidates.append(phrase_id)
+        return candidates
+
+    def score(self, a, b):
+        # Same 0-100 scale as fuzzywuzzy's fuzz.ratio; the cheap upper bounds
+        # reject most candidates before the full matching-blocks computation
+        matcher = SequenceMatcher(None, a, b)
+        if round(100 * matcher.real_quick_ratio()) <= self.threshold or round(100 * matcher.quick_ratio()) <= self.threshold:
+            return 0
+        return int(round(100 * matcher.ratio()))
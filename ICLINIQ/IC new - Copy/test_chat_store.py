@@ -0,0 +1,132 @@
+import json
+import sqlite3
+import pytest
+from chat_store import ChatStore, ChatTurn
+
+# The chat database as app.py created it before sessions kept a preview and
+# symptoms moved out of the comma-joined chat_session_data table
+LEGACY_SCHEMA = '''
+CREATE TABLE chat_sessions (
+    session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE chat_messages (
+    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER,
+    message_text TEXT,
+    is_user BOOLEAN,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE chat_session_data (
+    session_id INTEGER PRIMARY KEY,
+    symptoms TEXT
+);
+INSERT INTO chat_sessions (session_id, created_at) VALUES (1, '2024-01-01 10:00:00'), (2, '2024-01-02 10:00:00');
+INSERT INTO chat_messages (session_id, message_text, is_user, created_at) VALUES
+    (1, 'I have itching and a skin rash since Monday', 1, '2024-01-01 10:00:00'),
+    (1, 'You may have...', 0, '2024-01-01 10:00:01'),
+    (1, 'and now a cough', 1, '2024-01-01 10:05:00');
+INSERT INTO chat_session_data (session_id, symptoms) VALUES (1, 'itching,skin_rash,'), (2, '');
+'''
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChatStore(str(tmp_path / 'chat.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def legacy_store(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+    store = ChatStore(path)
+    yield store
+    store.close()
+
+
+def add_sessions(store, created_at):
+    # One session per timestamp, ids in the order given
+    ids = store.reserve_session_ids(len(created_at))
+    store.write_turns([
+        ChatTurn(session_id, f'query {session_id}', 'response', [], stamp, True)
+        for session_id, stamp in zip(ids, created_at)])
+    return list(ids)
+
+
+def test_legacy_symptoms_move_to_session_symptoms_at_turn_one(legacy_store):
+    with legacy_store.connection() as conn:
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chat_session_data'").fetchone() is None
+        rows = conn.execute('SELECT session_id, symptom_id, first_seen_turn FROM session_symptoms').fetchall()
+    assert {row['first_seen_turn'] for row in rows} == {1}
+    assert legacy_store.get_previous_symptoms(1) == ['itching', 'skin_rash']
+    assert legacy_store.get_previous_symptoms(2) == []
+
+
+def test_preview_is_backfilled_from_first_message(legacy_store):
+    sessions = {s['session_id']: s for s in legacy_store.list_sessions()}
+    assert sessions[1]['preview'] == 'I have itching and a skin rash...'
+    assert sessions[1]['symptoms'].split(',') == ['itching', 'skin_rash']
+    assert sessions[2]['preview'] == 'Empty chat'
+
+
+def test_migrated_store_keeps_counting_turns(legacy_store):
+    # Two user turns already stored, so a new symptom is first seen on turn three
+    legacy_store.save_turn('fever too', 'response', session_id=1, symptoms=['high_fever', 'itching'])
+    assert legacy_store.get_previous_symptoms(1) == ['itching', 'skin_rash', 'high_fever']
+
+
+def test_list_sessions_pages_newest_first(store):
+    # Two sessions share a timestamp; the tie is broken by session id
+    ids = add_sessions(store, ['2024-01-01 10:00:00', '2024-01-02 10:00:00', '2024-01-02 10:00:00',
+                               '2024-01-03 10:00:00', '2024-01-04 10:00:00'])
+    newest_first = [ids[4], ids[3], ids[2], ids[1], ids[0]]
+
+    assert [s['session_id'] for s in store.list_sessions()] == newest_first
+    seen, before = [], None
+    while True:
+        page = store.list_sessions(before=before, limit=2)
+        seen += [s['session_id'] for s in page]
+        if len(page) < 2:
+            break
+        before = page[-1]['session_id']
+    assert seen == newest_first
+
+    # Continues strictly after `before`, across the tie
+    assert [s['session_id'] for s in store.list_sessions(before=ids[2], limit=10)] == [ids[1], ids[0]]
+    assert store.list_sessions(before=ids[0]) == []
+    # Out-of-range limits are clamped rather than rejected
+    assert len(store.list_sessions(limit=0)) == 1
+    assert len(store.list_sessions(limit=-5)) == 1
+
+
+def read_stream(store, session_id, after=None, limit=None):
+    return json.loads(''.join(store.stream_session_messages(session_id, after, limit)))
+
+
+def test_stream_session_messages_next_after(store):
+    session_id = None
+    for i in range(3):
+        session_id = store.save_turn(f'question {i}', f'answer {i}', session_id=session_id)
+    everything = read_stream(store, session_id, limit=100)
+    assert [m['message_text'] for m in everything['messages']] == [
+        'question 0', 'answer 0', 'question 1', 'answer 1', 'question 2', 'answer 2']
+    assert everything['next_after'] is None
+    message_ids = [m['message_id'] for m in everything['messages']]
+
+    first = read_stream(store, session_id, limit=4)
+    assert [m['message_id'] for m in first['messages']] == message_ids[:4]
+    assert first['next_after'] == message_ids[3]
+    rest = read_stream(store, session_id, after=first['next_after'], limit=4)
+    assert [m['message_id'] for m in rest['messages']] == message_ids[4:]
+    assert rest['next_after'] is None
+
+    # A page that ends exactly on the last message still hands out a cursor,
+    # and the page after it is empty
+    exact = read_stream(store, session_id, after=message_ids[1], limit=4)
+    assert exact['next_after'] == message_ids[-1]
+    assert read_stream(store, session_id, after=exact['next_after'], limit=4) == {
+        'session_id': session_id, 'messages': [], 'next_after': None}
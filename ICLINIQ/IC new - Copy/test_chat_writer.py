@@ -0,0 +1,138 @@
+import threading
+import pytest
+from chat_store import ChatStore
+from chat_writer import ChatWriter
+
+
+class GatedStore(ChatStore):
+    # Holds every write until the test opens the gate, so turns stay queued
+    def __init__(self, path):
+        super().__init__(path)
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def write_turns(self, turns):
+        assert self.gate.wait(5)
+        super().write_turns(turns)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = GatedStore(str(tmp_path / 'chat.db'))
+    yield store
+    store.gate.set()
+    store.close()
+
+
+def messages(store, session_id):
+    return [m['message_text'] for m in store.iter_session_messages(session_id)]
+
+
+def test_unknown_durability_is_rejected(store):
+    with pytest.raises(ValueError):
+        ChatWriter(store, durability='eventually')
+
+
+def test_turns_of_each_session_are_written_in_order(store):
+    writer = ChatWriter(store, durability='async', max_batch=3)
+    sessions = [writer.save('open a', 'ok'), writer.save('open b', 'ok')]
+
+    # Interleaved turns from several threads, each thread owning one session
+    def chat(session_id):
+        for i in range(20):
+            writer.save(f'turn {i}', f'reply {i}', session_id=session_id, symptoms=[f'symptom_{i}'])
+
+    threads = [threading.Thread(target=chat, args=(session_id,)) for session_id in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert writer.flush(timeout=10)
+    writer.close()
+
+    for session_id, opening in zip(sessions, ['open a', 'open b']):
+        expected = [opening, 'ok']
+        for i in range(20):
+            expected += [f'turn {i}', f'reply {i}']
+        assert messages(store, session_id) == expected
+        # Turn 1 opened the session, so symptom_i was first seen on turn i + 2
+        with store.connection() as conn:
+            turns = [row[0] for row in conn.execute(
+                'SELECT first_seen_turn FROM session_symptoms WHERE session_id = ? ORDER BY first_seen_turn',
+                (session_id,))]
+        assert turns == list(range(2, 22))
+    assert writer.stats()['written'] == 42
+
+
+def test_next_turn_reads_its_own_unflushed_symptoms(store):
+    writer = ChatWriter(store, durability='async')
+    session_id = writer.save('itching', 'ok', symptoms=['itching'])
+    assert writer.flush(timeout=5)
+
+    store.gate.clear()
+    writer.save('and a rash', 'ok', session_id=session_id, symptoms=['skin_rash'])
+    writer.save('and a cough', 'ok', session_id=session_id, symptoms=['cough', 'itching'])
+    # Nothing new on disk yet, but the session already sees all three
+    assert store.get_previous_symptoms(session_id) == ['itching']
+    assert writer.get_previous_symptoms(session_id) == ['itching', 'skin_rash', 'cough']
+    assert not writer.flush(timeout=0.05)
+
+    store.gate.set()
+    assert writer.flush(timeout=5)
+    assert writer.pending_symptoms == {}
+    assert store.get_previous_symptoms(session_id) == ['itching', 'skin_rash', 'cough']
+    assert writer.get_previous_symptoms(session_id) == ['itching', 'skin_rash', 'cough']
+    writer.close()
+
+
+def test_sync_writes_before_returning(store):
+    writer = ChatWriter(store, durability='sync')
+    assert writer._thread is None
+    session_id = writer.save('hello', 'hi', symptoms=['fatigue'])
+    assert messages(store, session_id) == ['hello', 'hi']
+    assert store.get_previous_symptoms(session_id) == ['fatigue']
+    assert writer.flush()
+
+
+def test_commit_waits_for_the_group_commit(store):
+    writer = ChatWriter(store, durability='commit')
+    session_id = writer.save('hello', 'hi', symptoms=['fatigue'])
+    assert messages(store, session_id) == ['hello', 'hi']
+
+    # The caller is held until the writer thread has committed its turn
+    store.gate.clear()
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (writer.save('again', 'hi', session_id=session_id), done.set()))
+    thread.start()
+    assert not done.wait(0.1)
+    store.gate.set()
+    assert done.wait(5)
+    thread.join()
+    assert messages(store, session_id) == ['hello', 'hi', 'again', 'hi']
+    writer.close()
+
+
+def test_commit_reports_a_failed_write(store, monkeypatch):
+    writer = ChatWriter(store, durability='commit')
+    monkeypatch.setattr('chat_writer.WRITE_RETRIES', 1)
+
+    def write_turns(turns):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(store, 'write_turns', write_turns)
+    with pytest.raises(OSError):
+        writer.save('hello', 'hi')
+    assert writer.stats()['failed'] == 1
+    writer.close()
+
+
+def test_async_returns_before_the_write(store):
+    writer = ChatWriter(store, durability='async')
+    store.gate.clear()
+    session_id = writer.save('hello', 'hi')
+    assert messages(store, session_id) == []
+
+    store.gate.set()
+    assert writer.flush(timeout=5)
+    assert messages(store, session_id) == ['hello', 'hi']
+    writer.close()
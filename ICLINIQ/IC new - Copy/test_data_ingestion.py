@@ -0,0 +1,89 @@
+import pytest
+from data_ingestion import (CSV_FILES, CypherRecorder, DELETE_DESCRIPTION_LINKS, DELETE_DISEASES, DELETE_HAS_SYMPTOM,
+                            DELETE_PRECAUTION_LINKS, DELETE_SEVERITY_LINKS, MERGE_DESCRIPTIONS, MERGE_HAS_SYMPTOM,
+                            MERGE_PRECAUTIONS, MERGE_SEVERITIES, ingest_data)
+
+BEFORE = {
+    'dataset': [('Acne', ['skin_rash', 'itching']), ('Cold', ['cough', 'chills']), ('Allergy', ['itching', 'sneezing'])],
+    'descriptions': {'Acne': 'Blocked pores', 'Cold': 'A virus', 'Allergy': 'Immune reaction'},
+    'precautions': {'Acne': ['wash face', 'avoid oil'], 'Cold': ['rest'], 'Allergy': ['avoid dust']},
+    'severities': {'skin_rash': 3, 'itching': 1, 'cough': 4, 'chills': 3, 'sneezing': 4},
+}
+
+# Cold is gone, Gout is new, Acne swaps a symptom, a precaution and its
+# description, itching changes weight; Allergy is untouched
+AFTER = {
+    'dataset': [('Acne', ['skin_rash', 'blackheads']), ('Allergy', ['itching', 'sneezing']), ('Gout', ['joint_pain'])],
+    'descriptions': {'Acne': 'Inflamed pores', 'Allergy': 'Immune reaction', 'Gout': 'Uric acid crystals'},
+    'precautions': {'Acne': ['wash face', 'see a doctor'], 'Allergy': ['avoid dust'], 'Gout': ['rest']},
+    'severities': {'skin_rash': 3, 'itching': 2, 'sneezing': 4, 'blackheads': 2, 'joint_pain': 5},
+}
+
+
+def write_csvs(directory, data):
+    def table(column, rows):
+        width = max(len(cells) for _, cells in rows)
+        lines = ['Disease,' + ','.join(f'{column}_{i + 1}' for i in range(width))]
+        # Repeated rows, padding and leading spaces, like the shipped dataset.csv
+        lines += [f'{name},' + ','.join([f' {c}' for c in cells] + [''] * (width - len(cells)))
+                  for name, cells in rows for _ in range(2)]
+        return '\n'.join(lines) + '\n'
+
+    (directory / CSV_FILES['dataset']).write_text(table('Symptom', data['dataset']))
+    (directory / CSV_FILES['symptom_precaution']).write_text(table('Precaution', list(data['precautions'].items())))
+    (directory / CSV_FILES['symptom_description']).write_text(
+        'Disease,Description\n' + ''.join(f'{d},{text}\n' for d, text in data['descriptions'].items()))
+    (directory / CSV_FILES['symptom_severity']).write_text(
+        'Symptom,weight\n' + ''.join(f'{s},{w}\n' for s, w in data['severities'].items()))
+
+
+def rows_of(recorder, query):
+    rows = [row for statement, params in recorder.statements if statement == query.strip() for row in params['rows']]
+    return sorted(rows, key=lambda row: sorted(row.items()))
+
+
+@pytest.fixture
+def refresh(tmp_path):
+    # Full load of BEFORE, then the CSVs replaced by AFTER and loaded incrementally
+    manifest = str(tmp_path / 'manifest.json')
+    write_csvs(tmp_path, BEFORE)
+    ingest_data(CypherRecorder(), data_dir=str(tmp_path), mode='full', manifest_path=manifest)
+    write_csvs(tmp_path, AFTER)
+    recorder = CypherRecorder()
+    ingest_data(recorder, data_dir=str(tmp_path), mode='incremental', manifest_path=manifest)
+    return recorder, tmp_path, manifest
+
+
+def test_incremental_load_deletes_what_vanished(refresh):
+    recorder, _, _ = refresh
+    assert rows_of(recorder, DELETE_DISEASES) == [{'disease': 'Cold'}]
+    # Cold's own links go with its DETACH DELETE; only Acne's dropped rows remain
+    assert rows_of(recorder, DELETE_HAS_SYMPTOM) == [{'disease': 'Acne', 'symptom': 'itching'}]
+    assert rows_of(recorder, DELETE_PRECAUTION_LINKS) == [{'disease': 'Acne', 'text': 'avoid oil'}]
+    assert rows_of(recorder, DELETE_DESCRIPTION_LINKS) == [
+        {'disease': 'Acne', 'text': 'Inflamed pores'}, {'disease': 'Gout', 'text': 'Uric acid crystals'}]
+    assert rows_of(recorder, DELETE_SEVERITY_LINKS) == [
+        {'symptom': 'blackheads', 'weight': 2}, {'symptom': 'chills'}, {'symptom': 'cough'},
+        {'symptom': 'itching', 'weight': 2}, {'symptom': 'joint_pain', 'weight': 5}]
+
+
+def test_incremental_load_upserts_only_changed_rows(refresh):
+    recorder, _, _ = refresh
+    assert rows_of(recorder, MERGE_HAS_SYMPTOM) == [
+        {'disease': 'Acne', 'symptom': 'blackheads'}, {'disease': 'Gout', 'symptom': 'joint_pain'}]
+    assert rows_of(recorder, MERGE_DESCRIPTIONS) == [
+        {'disease': 'Acne', 'text': 'Inflamed pores'}, {'disease': 'Gout', 'text': 'Uric acid crystals'}]
+    assert rows_of(recorder, MERGE_PRECAUTIONS) == [
+        {'disease': 'Acne', 'text': 'see a doctor'}, {'disease': 'Gout', 'text': 'rest'}]
+    assert rows_of(recorder, MERGE_SEVERITIES) == [
+        {'symptom': 'blackheads', 'weight': 2}, {'symptom': 'itching', 'weight': 2}, {'symptom': 'joint_pain', 'weight': 5}]
+    # Allergy did not change, so nothing mentions it
+    assert not any('Allergy' in str(params) for _, params in recorder.statements)
+
+
+def test_unchanged_csvs_write_nothing(refresh):
+    _, directory, manifest = refresh
+    recorder = CypherRecorder()
+    timings = ingest_data(recorder, data_dir=str(directory), mode='incremental', manifest_path=manifest)
+    assert recorder.statements == []
+    assert list(timings) == ['load_csv']
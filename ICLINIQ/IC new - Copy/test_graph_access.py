@@ -0,0 +1,103 @@
+import threading
+import pytest
+from graph_access import CircuitBreaker, GraphClient, GraphUnavailable
+
+
+class StubGraph(GraphClient):
+    # Answers every query with whatever the test queued up: rows or an exception
+    def __init__(self, breaker=None, retries=1):
+        super().__init__(uri='stub://', retries=retries, breaker=breaker)
+        self.answers = []
+
+    def _open_graph(self):
+        return self
+
+    def run(self, query):
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def half_open_client():
+    breaker = CircuitBreaker(threshold=1, reset_seconds=0)
+    client = StubGraph(breaker)
+    breaker.trip()
+    return client
+
+
+def test_non_transient_error_releases_half_open_trial():
+    client = half_open_client()
+    client.answers = [ValueError("bad query"), [{'ok': 1}]]
+
+    with pytest.raises(ValueError):
+        client._call('trial', lambda graph: graph.run('RETURN 1 AS ok'))
+    assert client.breaker.state != 'half_open'
+
+    # The next call gets the trial, and its success closes the breaker
+    assert client._call('trial', lambda graph: graph.run('RETURN 1 AS ok')) == [{'ok': 1}]
+    assert client.breaker.state == 'closed'
+
+
+def test_transient_error_reopens_half_open_breaker():
+    client = half_open_client()
+    client.answers = [OSError("connection refused")]
+
+    with pytest.raises(GraphUnavailable):
+        client._call('trial', lambda graph: graph.run('RETURN 1 AS ok'))
+    assert client.breaker.state == 'open'
+
+
+def test_transient_error_leaves_other_calls_running():
+    client = StubGraph(retries=2)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(graph):
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    def broken(graph):
+        raise OSError("connection reset")
+
+    # A call in flight, and a caller that has the executor but hasn't submitted yet
+    results = {}
+    in_flight = threading.Thread(target=lambda: results.setdefault('slow', client._call('slow', slow)))
+    in_flight.start()
+    started.wait(5)
+    _, executor = client._connection()
+
+    with pytest.raises(GraphUnavailable):
+        client._call('broken', broken)
+    assert executor.submit(lambda: 'still running').result(timeout=5) == 'still running'
+
+    release.set()
+    in_flight.join(5)
+    assert results['slow'] == 'slow'
+
+
+def test_concurrent_calls_with_transient_errors_never_fail_on_a_closed_pool():
+    client = StubGraph(breaker=CircuitBreaker(threshold=10 ** 6), retries=3)
+    calls = iter(range(10 ** 6))
+    errors = []
+
+    def flaky(graph):
+        if next(calls) % 7 == 0:
+            raise OSError("connection reset")
+        return 'ok'
+
+    def worker():
+        for _ in range(25):
+            try:
+                client._call('flaky', flaky)
+            except GraphUnavailable:
+                pass
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
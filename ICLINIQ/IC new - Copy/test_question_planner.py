@@ -0,0 +1,56 @@
+import pytest
+from knowledge_index import KnowledgeIndex
+
+# After "fever" every disease but Gout is a candidate, equally likely.
+# cough splits them 2/3, which beats the 1/4 splits of chills, sneezing and
+# rash. Once cough is asked, rash splits the three-disease side while chills
+# or sneezing only split the two-disease side, so rash comes next.
+DISEASE_SYMPTOMS = {
+    'Flu': ['fever', 'cough', 'chills'],
+    'Cold': ['fever', 'cough', 'sneezing'],
+    'Dengue': ['fever', 'rash'],
+    'Typhoid': ['fever'],
+    'Malaria': ['fever'],
+    'Gout': ['joint_pain'],
+}
+
+
+@pytest.fixture
+def index():
+    return KnowledgeIndex(DISEASE_SYMPTOMS)
+
+
+def columns(index, *names):
+    return [index.symptom_ids[name] for name in names]
+
+
+def test_most_informative_question_first(index):
+    reported = columns(index, 'fever')
+    candidates = index.recommend_columns(reported)
+    assert index.questions.plan(candidates, reported, limit=1) == ['cough']
+    assert index.questions.plan(candidates, reported, limit=2) == ['cough', 'rash']
+
+
+def test_follow_up_turn_separates_the_remaining_candidates(index):
+    first = columns(index, 'fever')
+    reported = columns(index, 'fever', 'cough')
+    candidates = index.recommend_columns(reported)
+    index.questions.plan(index.recommend_columns(first), first)
+
+    # Flu and Cold now dominate, so the question tells them apart
+    planned = index.questions.plan(candidates, reported, previous_columns=first, limit=1)
+    assert planned in (['chills'], ['sneezing'])
+    # Starting from the cached belief of the previous turn changes nothing
+    assert index.questions.plan(candidates, reported, previous_columns=first) == \
+        KnowledgeIndex(DISEASE_SYMPTOMS).questions.plan(candidates, reported)
+
+
+def test_reported_symptoms_are_never_asked_again(index):
+    reported = columns(index, 'fever', 'rash')
+    candidates = index.recommend_columns(reported)
+    assert not {'fever', 'rash'} & set(index.questions.plan(candidates, reported))
+
+
+def test_nothing_to_ask_with_one_candidate(index):
+    reported = columns(index, 'joint_pain')
+    assert index.questions.plan(index.recommend_columns(reported), reported) == []
@@ -0,0 +1,87 @@
+import pytest
+from knowledge_index import KnowledgeIndex
+
+# Disease order matters: the Cypher query left ties unordered, the index breaks
+# them by disease order. Flu has no symptoms (description only).
+DISEASE_SYMPTOMS = {
+    'Acne': ['skin_rash', 'itching'],
+    'Allergy': ['skin_rash', 'itching', 'chills', 'cough'],
+    'Cold': ['itching', 'cough'],
+    'Dermatitis': ['skin_rash'],
+    'Eczema': ['skin_rash', 'blister'],
+    'Gout': ['skin_rash', 'joint_pain', 'swelling'],
+    'Hives': ['skin_rash', 'fatigue', 'nausea'],
+}
+DESCRIBED = ['Flu']
+
+
+def write_csvs(directory):
+    width = max(len(symptoms) for symptoms in DISEASE_SYMPTOMS.values())
+    rows = ['Disease,' + ','.join(f'Symptom_{i + 1}' for i in range(width))]
+    for disease, symptoms in DISEASE_SYMPTOMS.items():
+        # Same shape as dataset.csv: leading spaces, padding, repeated rows
+        cells = [f' {symptom}' for symptom in symptoms] + [''] * (width - len(symptoms))
+        rows += [f'{disease},' + ','.join(cells)] * 2
+    (directory / 'dataset.csv').write_text('\n'.join(rows) + '\n')
+
+    described = list(DISEASE_SYMPTOMS) + DESCRIBED
+    (directory / 'symptom_Description.csv').write_text(
+        'Disease,Description\n' + ''.join(f'{d},About {d}\n' for d in described))
+    (directory / 'symptom_precaution.csv').write_text(
+        'Disease,Precaution_1\n' + ''.join(f'{d},rest\n' for d in described))
+    symptoms = dict.fromkeys(s for syms in DISEASE_SYMPTOMS.values() for s in syms)
+    (directory / 'symptom_severity.csv').write_text(
+        'Symptom,weight\n' + ''.join(f'{s},{i % 5 + 1}\n' for i, s in enumerate(symptoms)))
+
+
+def cypher_ranking(symptoms, limit=5):
+    # What the old query returned: matched / total over diseases matching at least
+    # one symptom and having any, best first, LIMIT 5
+    rows = []
+    for disease, total in DISEASE_SYMPTOMS.items():
+        matched = len(set(total) & set(symptoms))
+        if matched and total:
+            rows.append((disease, matched, len(set(total)), matched / len(set(total))))
+    rows.sort(key=lambda row: -row[3])
+    return rows[:limit]
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('csv')
+    write_csvs(directory)
+    return KnowledgeIndex.from_csv(str(directory))
+
+
+@pytest.mark.parametrize('symptoms', [
+    ['skin_rash'],                        # six matches, ties at 0.5 and 1/3, cut at five
+    ['skin_rash', 'itching'],
+    ['itching', 'cough', 'itching'],      # duplicates count once
+    ['chills'],
+    ['joint_pain', 'swelling', 'nausea'],
+    ['skin_rash', 'not_a_symptom'],
+])
+def test_ranking_matches_cypher_formula(index, symptoms):
+    records = index.recommend_diseases(symptoms)
+    got = [(r['disease'], r['matched_count'], r['total_count']) for r in records]
+    expected = cypher_ranking(symptoms)
+    assert got == [row[:3] for row in expected]
+    assert [r['match_percentage'] for r in records] == pytest.approx([row[3] for row in expected])
+
+
+def test_ties_keep_disease_order(index):
+    ranked = [r['disease'] for r in index.recommend_diseases(['skin_rash'])]
+    assert ranked == ['Dermatitis', 'Acne', 'Eczema', 'Gout', 'Hives']
+
+
+def test_disease_without_symptoms_never_ranks(index):
+    assert 'Flu' in index.disease_ids
+    assert index.scoring.total_counts[index.disease_ids['Flu']] == 0
+    every_symptom = list(index.symptoms)
+    assert 'Flu' not in [r['disease'] for r in index.recommend_diseases(every_symptom, limit=len(index.diseases))]
+    assert index.match_record('Flu', every_symptom) is None
+
+
+def test_no_or_unknown_symptoms_rank_nothing(index):
+    assert index.recommend_diseases([]) == []
+    assert index.recommend_diseases(['not_a_symptom']) == []
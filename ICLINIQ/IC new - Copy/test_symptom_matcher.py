@@ -0,0 +1,66 @@
+import pytest
+from symptom_matcher import SymptomMatcher
+
+SYMPTOMS = [
+    'itching', 'skin_rash', 'chest_pain', 'breathlessness', 'restlessness', 'joint_pain',
+    'hip_joint_pain', 'vomiting', 'high_fever', 'mild_fever', 'toxic_look_(typhos)', 'headache',
+]
+ALIASES = {'fever': ['high_fever', 'mild_fever']}
+
+
+@pytest.fixture(scope='module')
+def matcher():
+    return SymptomMatcher(SYMPTOMS, aliases=ALIASES)
+
+
+@pytest.mark.parametrize('query, expected', [
+    # Exact names, in any case, with underscores as spaces or kept
+    ("I have itching", ['itching']),
+    ("skin rash and a headache", ['skin_rash', 'headache']),
+    ("Skin_Rash!", ['skin_rash']),
+    # Parenthetical part of a name is optional
+    ("he has a toxic look", ['toxic_look_(typhos)']),
+    ("toxic look typhos", ['toxic_look_(typhos)']),
+    # Aliases map to every target
+    ("fever since yesterday", ['high_fever', 'mild_fever']),
+])
+def test_exact_matches(matcher, query, expected):
+    assert matcher.match(query) == expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ("vomitting all night", ['vomiting']),
+    ("chest pian", ['chest_pain']),
+    ("breathlesness", ['breathlessness']),
+    ("skin rahs", ['skin_rash']),
+])
+def test_misspellings_above_threshold_match(matcher, query, expected):
+    assert matcher.match(query) == expected
+
+
+@pytest.mark.parametrize('query', [
+    "vomit",        # ratio 77 against 'vomiting'
+    "rash",         # ratio 62 against 'skin rash'
+    "I am fine",
+    "",
+])
+def test_below_threshold_matches_nothing(matcher, query):
+    assert matcher.match(query) == []
+
+
+def test_threshold_is_strictly_greater_than():
+    # 'lumpx' vs 'lumps' scores exactly 80, like fuzz.ratio
+    assert SymptomMatcher(['lumps'], threshold=79).score('lumpx', 'lumps') == 80
+    assert SymptomMatcher(['lumps']).match('lumpx') == []
+    assert SymptomMatcher(['lumps'], threshold=79).match('lumpx') == ['lumps']
+
+
+@pytest.mark.parametrize('query, expected', [
+    # Words an exact hit covers are not fuzzy-matched again
+    ("chest pain, breathlessness", ['chest_pain', 'breathlessness']),
+    ("joint pain", ['joint_pain']),
+    # A typo next to an exact hit is still found
+    ("chest pian and breathlessness", ['breathlessness', 'chest_pain']),
+])
+def test_exactly_matched_words_are_not_fuzzy_matched(matcher, query, expected):
+    assert matcher.match(query) == expected
@@ -0,0 +1,131 @@
+import json
+import os
+import numpy as np
+from data_ingestion import DATA_DIR
+
+EMBEDDINGS_PATH = os.path.join(DATA_DIR, 'graph_embeddings.pt')
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def top_k_rows(scores, k):
+    # Highest-scoring k columns per row, best first
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class VectorIndex:
+    # Unit-normalized float32 node vectors, sorted so that every node type
+    # (Disease, Symptom, ...) is a contiguous block of rows. Cosine similarity is
+    # then one batched matrix product against that block.
+    def __init__(self, vectors, names, types):
+        order = sorted(range(len(names)), key=lambda i: (types[i], i))
+        if order != list(range(len(names))):
+            vectors = np.asarray(vectors)[order]
+        # Memory-mapped vectors were already normalized when they were saved
+        self.vectors = vectors if isinstance(vectors, np.memmap) else normalize_rows(vectors)
+        self.names = [names[i] for i in order]
+        self.types = [types[i] for i in order]
+        self.dim = self.vectors.shape[1] if len(self.names) else 0
+
+        self.rows = {(node_type, name): row for row, (node_type, name) in enumerate(zip(self.types, self.names))}
+        self.blocks = {}
+        for row, node_type in enumerate(self.types):
+            start, _ = self.blocks.get(node_type, (row, row))
+            self.blocks[node_type] = (start, row + 1)
+        self.ivf = {}
+
+    @classmethod
+    def load(cls, path=EMBEDDINGS_PATH):
+        # The first load converts graph_embeddings.pt into a memory-mapped float32
+        # matrix next to it; later loads (and every forked worker) just map that file
+        data_path, meta_path = path + '.index.f32', path + '.index.json'
+        if os.path.exists(data_path) and os.path.exists(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            vectors = np.memmap(data_path, dtype=np.float32, mode='r', shape=(len(meta['names']), meta['dim']))
+            return cls(vectors, meta['names'], meta['types'])
+
+        import torch
+
+        saved = torch.load(path, map_location='cpu')
+        if not isinstance(saved, dict) or 'node_names' not in saved:
+            raise ValueError(f"{path} has no node names; regenerate it with graph_embeddings.py")
+        index = cls(saved['embeddings'].numpy(), saved['node_names'], saved['node_types'])
+        index.save(path)
+        return index
+
+    @classmethod
+    def from_texts(cls, encode, names, node_type):
+        # Index arbitrary strings (e.g. symptom names) with a text encoder such as
+        # QueryAnalyzer.analyze_queries, so query vectors can be searched directly
+        return cls(encode(list(names)), list(names), [node_type] * len(names))
+
+    def save(self, path):
+        data_path, meta_path = path + '.index.f32', path + '.index.json'
+        vectors = np.memmap(data_path, dtype=np.float32, mode='w+', shape=self.vectors.shape)
+        vectors[:] = self.vectors
+        vectors.flush()
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'dim': self.dim, 'names': self.names, 'types': self.types}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def vector(self, node_type, names):
+        # Mean direction of the given nodes, or None if none of them are indexed
+        rows = [self.rows[(node_type, name)] for name in names if (node_type, name) in self.rows]
+        if not rows:
+            return None
+        return normalize_rows(self.vectors[rows].mean(axis=0, keepdims=True))[0]
+
+    def build_ivf(self, node_type, nlist=None, iterations=10, seed=0):
+        # Inverted-file index: k-means coarse centroids, each owning a list of rows.
+        # Only worth it for large blocks; 41 diseases are faster brute-forced.
+        start, end = self.blocks[node_type]
+        block = np.asarray(self.vectors[start:end])
+        nlist = nlist or max(1, int(np.sqrt(len(block))))
+        rng = np.random.default_rng(seed)
+        centroids = block[rng.choice(len(block), size=min(nlist, len(block)), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(block @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = block[assignment == c]
+                if len(members):
+                    centroids[c] = normalize_rows(members.mean(axis=0, keepdims=True))[0]
+        assignment = np.argmax(block @ centroids.T, axis=1)
+        lists = [np.flatnonzero(assignment == c) for c in range(len(centroids))]
+        self.ivf[node_type] = (centroids, lists)
+
+    def search(self, queries, k=5, node_type='Disease', nprobe=4):
+        # queries: (n, dim) or (dim,). Returns one [(name, similarity), ...] list per query.
+        queries = normalize_rows(np.atleast_2d(queries))
+        if node_type not in self.blocks:
+            return [[] for _ in range(len(queries))]
+        start, end = self.blocks[node_type]
+
+        if node_type in self.ivf:
+            return [self._search_ivf(query, k, node_type, start, nprobe) for query in queries]
+
+        scores = queries @ np.asarray(self.vectors[start:end]).T
+        top = top_k_rows(scores, k)
+        return [[(self.names[start + i], float(scores[row, i])) for i in top[row]] for row in range(len(queries))]
+
+    def _search_ivf(self, query, k, node_type, start, nprobe):
+        centroids, lists = self.ivf[node_type]
+        probes = top_k_rows((query @ centroids.T)[np.newaxis, :], nprobe)[0]
+        rows = np.concatenate([lists[c] for c in probes])
+        if not len(rows):
+            return []
+        scores = np.asarray(self.vectors[start + rows]) @ query
+        top = top_k_rows(scores[np.newaxis, :], k)[0]
+        return [(self.names[start + rows[i]], float(scores[i])) for i in top]